@@ -0,0 +1,365 @@
+import argparse
+import json
+import os
+import random
+import string
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from resource_usage import peak_resident_memory_mb
+
+# Percentiles reported for every timed operation
+PERCENTILES = (50, 90, 99)
+
+
+def build_tiny_model(directory: str, vocab_size: int = 2000,
+                     hidden_size: int = 64, num_layers: int = 2,
+                     seed: int = 0) -> List[str]:
+    """
+    Save a tiny, randomly initialized BERT and a matching tokenizer, so the
+    benchmark runs without downloading a pre-trained model.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to save the model and tokenizer to.
+    vocab_size : int, optional
+        The number of whole words in the vocabulary, by default 2000.
+    hidden_size : int, optional
+        The hidden size of the model, by default 64.
+    num_layers : int, optional
+        The number of transformer layers, by default 2.
+    seed : int, optional
+        The random seed for the vocabulary and the weights, by default 0.
+
+    Returns
+    -------
+    List[str]
+        The whole words of the vocabulary.
+    """
+    import torch
+    from transformers import BertConfig, BertForMaskedLM, BertTokenizerFast
+
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < vocab_size:
+        words.add(''.join(rng.choices(string.ascii_lowercase,
+                                      k=rng.randint(2, 9))))
+    words = sorted(words)
+    vocab = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]', '.', ','] + \
+        words + ['##s', '##ed', '##ing']
+
+    os.makedirs(directory, exist_ok=True)
+    vocab_file = os.path.join(directory, 'vocab.txt')
+    with open(vocab_file, 'w', encoding='utf-8') as file:
+        file.write('\n'.join(vocab))
+    BertTokenizerFast(vocab_file, do_lower_case=True).save_pretrained(
+        directory)
+
+    torch.manual_seed(seed)
+    config = BertConfig(vocab_size=len(vocab), hidden_size=hidden_size,
+                        num_hidden_layers=num_layers,
+                        num_attention_heads=max(hidden_size // 32, 1),
+                        intermediate_size=hidden_size * 4,
+                        max_position_embeddings=512)
+    BertForMaskedLM(config).save_pretrained(directory)
+    return words
+
+
+def synthetic_sentences(words: List[str], count: int, min_length: int = 6,
+                        max_length: int = 30, long_fraction: float = 0.0,
+                        long_length: int = 400, seed: int = 0) -> List[str]:
+    """
+    Generate random sentences from a vocabulary, with Zipf-distributed word
+    frequencies like natural text.
+
+    A fraction of the sentences can be made very long, like the run-on
+    "sentences" that lists and tables without punctuation produce.
+
+    Parameters
+    ----------
+    words : List[str]
+        The words to draw from.
+    count : int
+        The number of sentences to generate.
+    min_length : int, optional
+        The minimum number of words per sentence, by default 6.
+    max_length : int, optional
+        The maximum number of words per sentence, by default 30.
+    long_fraction : float, optional
+        The fraction of long sentences, by default 0.
+    long_length : int, optional
+        The number of words of a long sentence, by default 400.
+    seed : int, optional
+        The random seed, by default 0.
+
+    Returns
+    -------
+    List[str]
+        The generated sentences.
+    """
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, len(words) + 1)
+    weights /= weights.sum()
+    sentences = []
+    for _ in range(count):
+        length = rng.integers(min_length, max_length + 1)
+        if rng.random() < long_fraction:
+            length = long_length
+        sentence = ' '.join(rng.choice(words, size=length, p=weights))
+        sentences.append(sentence.capitalize() + '.')
+    return sentences
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """
+    Summarize latencies as percentiles and throughput.
+
+    Parameters
+    ----------
+    latencies : List[float]
+        The measured latencies, in seconds.
+
+    Returns
+    -------
+    Dict[str, float]
+        The latency percentiles in milliseconds, the mean latency and the
+        number of calls per second.
+    """
+    summary = {f'p{q}_ms': float(np.percentile(latencies, q) * 1000)
+               for q in PERCENTILES}
+    summary['mean_ms'] = float(np.mean(latencies) * 1000)
+    summary['per_second'] = len(latencies) / float(np.sum(latencies))
+    return summary
+
+
+def time_calls(function: Callable[[int], object], iterations: int) \
+        -> Dict[str, float]:
+    """
+    Time repeated calls of a function.
+
+    Parameters
+    ----------
+    function : Callable[[int], object]
+        The function to time; it is passed the iteration number, so every
+        call can work on a different sentence.
+    iterations : int
+        The number of calls.
+
+    Returns
+    -------
+    Dict[str, float]
+        The summarized latencies, see `summarize`.
+    """
+    latencies = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        function(i)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+def run_benchmarks(model, sentences: List[str], iterations: int) \
+        -> Dict[str, Dict[str, float]]:
+    """
+    Time the model hot paths and full game rounds.
+
+    Parameters
+    ----------
+    model : ContextAwareTextModel
+        The model to benchmark.
+    sentences : List[str]
+        The sentences to play with.
+    iterations : int
+        The number of calls per benchmark.
+
+    Returns
+    -------
+    Dict[str, Dict[str, float]]
+        The summarized latencies of every benchmark.
+    """
+    from rounds import RoundEngine
+
+    def sentence(i: int) -> str:
+        return sentences[i % len(sentences)]
+
+    masked = [model.mask_word(s, 0.5) for s in sentences]
+    masked = [m for m in masked if m[2] != -1]
+
+    def masked_round(i: int):
+        return masked[i % len(masked)]
+
+    def calculate_perplexity(i: int) -> None:
+        masked_sentence, original_word, mask_index = masked_round(i)
+        model.calculate_perplexity(masked_sentence, original_word, mask_index)
+
+    def score_candidates(i: int) -> None:
+        masked_sentence, original_word, mask_index = masked_round(i)
+        model.score_candidates(masked_sentence,
+                               [original_word] * 12, mask_index)
+
+    # The caches would turn repeated sentences into hits, so every benchmark
+    # starts cold and runs over distinct sentences where possible
+    results = {}
+    benchmarks = {
+        'mask_word': lambda i: model.mask_word(sentence(i), 0.5),
+        'get_top_predictions': lambda i: model.get_top_predictions(
+            masked_round(i)[0]),
+        'calculate_perplexity': calculate_perplexity,
+        'score_candidates': score_candidates,
+    }
+    for name, function in benchmarks.items():
+        model.cache.clear()
+        model.vocab_cache.clear()
+        results[name] = time_calls(function, iterations)
+
+    # A full round as played in main(): mask, predict, score the original
+    # word, the top-k and the guess. Prefetching is disabled so the round's
+    # whole cost is measured.
+    model.cache.clear()
+    model.vocab_cache.clear()
+    engine = RoundEngine(model, sentences=iter(
+        sentences[i % len(sentences)] for i in range(10 * iterations)))
+
+    def full_round(i: int) -> None:
+        game_round = engine.prepare_round(0.5)
+        guess = game_round.top_words_with_fitness[-1][0]
+        engine.score_guess(game_round, guess)
+
+    results['round'] = time_calls(full_round, iterations)
+    engine.close()
+    return results
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> bool:
+    """
+    Print the change of every benchmark relative to a saved baseline.
+
+    Parameters
+    ----------
+    results : Dict
+        The current benchmark report.
+    baseline : Dict
+        The baseline benchmark report.
+    threshold : float
+        The relative p50 slowdown above which a benchmark counts as a
+        regression (e.g. 0.1 for 10%).
+
+    Returns
+    -------
+    bool
+        True if no benchmark regressed.
+    """
+    ok = True
+    print(f"\n{'benchmark':<24}{'baseline p50':>14}{'p50':>10}{'change':>10}")
+    for name, stats in results['benchmarks'].items():
+        if name not in baseline.get('benchmarks', {}):
+            continue
+        before = baseline['benchmarks'][name]['p50_ms']
+        change = (stats['p50_ms'] - before) / before
+        regressed = change > threshold
+        ok = ok and not regressed
+        print(f"{name:<24}{before:>12.2f}ms{stats['p50_ms']:>8.2f}ms"
+              f"{change:>+10.1%}{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def print_report(results: Dict) -> None:
+    """
+    Print a benchmark report as a table.
+
+    Parameters
+    ----------
+    results : Dict
+        The benchmark report.
+    """
+    header = ''.join(f"{f'p{q} ms':>10}" for q in PERCENTILES)
+    print(f"{'benchmark':<24}{header}{'per sec':>10}")
+    for name, stats in results['benchmarks'].items():
+        row = ''.join(f"{stats[f'p{q}_ms']:>10.2f}" for q in PERCENTILES)
+        print(f"{name:<24}{row}{stats['per_second']:>10.1f}")
+    print(f"\nThroughput: {results['rounds_per_second']:.1f} rounds/sec")
+    print(f"Peak RSS: {results['peak_rss_mb']:.0f} MB")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Benchmark the model and game-round hot paths offline.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the model and game-round hot paths.")
+    parser.add_argument("--model-name",
+                        help="A pre-trained model to benchmark instead of "
+                             "the tiny random one.")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--sentences", type=int, default=500)
+    parser.add_argument("--max-length", type=int, default=30,
+                        help="The maximum number of words per synthetic "
+                             "sentence.")
+    parser.add_argument("--long-fraction", type=float, default=0.02,
+                        help="The fraction of very long sentences.")
+    parser.add_argument("--long-length", type=int, default=400,
+                        help="The number of words of a long sentence.")
+    parser.add_argument("--context-window", type=int, default=128,
+                        help="The context window of the model; compare "
+                             "with 512 to see the effect of windowing.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report to a JSON file.")
+    parser.add_argument("--baseline",
+                        help="A saved report to compare the results with.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="The relative p50 slowdown that counts as a "
+                             "regression.")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+
+    from context_aware_model import ContextAwareTextModel
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.model_name:
+            model = ContextAwareTextModel(
+                args.model_name, context_window=args.context_window)
+            words = [token for token in model.tokenizer.get_vocab()
+                     if token.isalpha()][:5000]
+        else:
+            words = build_tiny_model(directory, seed=args.seed)
+            model = ContextAwareTextModel(
+                directory, context_window=args.context_window)
+    # Keep one-off lazy initialization out of the first timed call
+    model.warm_up()
+
+    sentences = synthetic_sentences(words, args.sentences,
+                                    max_length=args.max_length,
+                                    long_fraction=args.long_fraction,
+                                    long_length=args.long_length,
+                                    seed=args.seed)
+    benchmarks = run_benchmarks(model, sentences, args.iterations)
+    results = {
+        'model_name': args.model_name or 'tiny-random-bert',
+        'iterations': args.iterations,
+        'context_window': model.context_window,
+        'benchmarks': benchmarks,
+        'rounds_per_second': benchmarks['round']['per_second'],
+        'peak_rss_mb': peak_resident_memory_mb(),
+    }
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        if not compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,170 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, TYPE_CHECKING
+
+import numpy as np
+import torch
+
+from benchmark import build_tiny_model, synthetic_sentences
+from resource_usage import process_memory_mb
+from rounds import RoundEngine
+from worker_pool import ModelWorkerPool
+
+if TYPE_CHECKING:
+    from context_aware_model import ContextAwareTextModel
+
+
+def cycling_engine(sentences: List[str]) \
+        -> Callable[['ContextAwareTextModel'], RoundEngine]:
+    """
+    Get a pool setup function that gives every worker a RoundEngine over
+    its own shuffled, endless copy of the sentences.
+    """
+    def setup(model) -> RoundEngine:
+        shuffled = list(sentences)
+        random.shuffle(shuffled)
+        return RoundEngine(model, sentences=itertools.cycle(shuffled))
+    return setup
+
+
+def worker_counts(max_workers: int) -> List[int]:
+    """
+    Get 1, 2, 4, ... workers up to and including `max_workers`.
+    """
+    counts = []
+    workers = 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def run_pool(model, sentences: List[str], workers: int, rounds: int,
+             threads_per_worker: int) -> Dict[str, float]:
+    """
+    Time `rounds` rounds spread over a pool and measure its workers' memory.
+    """
+    with ModelWorkerPool(model, workers, threads_per_worker,
+                         setup=cycling_engine(sentences)) as pool:
+        # Keep every worker's lazy initialization out of the timing
+        pool.prepare_rounds([0.5] * workers * 2)
+        start = time.perf_counter()
+        pool.prepare_rounds([0.5] * rounds)
+        seconds = time.perf_counter() - start
+        memory = [usage for usage in pool.memory() if usage is not None]
+
+    run = {'workers': workers, 'threads_per_worker': threads_per_worker,
+           'seconds': seconds, 'rounds_per_second': rounds / seconds}
+    for field in ('rss', 'shared', 'private'):
+        run[f'worker_{field}_mb'] = float(np.mean(
+            [usage[field] for usage in memory])) if memory else float('nan')
+    return run
+
+
+def run_single_process(model, sentences: List[str], rounds: int) \
+        -> Dict[str, float]:
+    """
+    Time `rounds` rounds in this process with all intra-op threads, the
+    alternative to a pool.
+    """
+    engine = cycling_engine(sentences)(model)
+    for _ in range(2):
+        engine.prepare_round(0.5)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        engine.prepare_round(0.5)
+    seconds = time.perf_counter() - start
+    engine.close()
+    return {'workers': 0, 'threads_per_worker': torch.get_num_threads(),
+            'seconds': seconds, 'rounds_per_second': rounds / seconds}
+
+
+def print_report(results: Dict) -> None:
+    """
+    Print the throughput and memory of every pool size.
+    """
+    base = results['runs'][0]['rounds_per_second']
+    parent = results['parent_rss_mb']
+    print(f"Model process RSS after loading: {parent:.0f} MB")
+    print(f"{'workers':>8}{'rounds/s':>10}{'speedup':>9}{'rss':>8}"
+          f"{'private':>9}{'saved':>8}")
+    for run in results['runs']:
+        # A separately started process would hold its own copy of everything
+        # a worker shares with the parent
+        print(f"{run['workers']:>8}{run['rounds_per_second']:>10.1f}"
+              f"{run['rounds_per_second'] / base:>8.2f}x"
+              f"{run['worker_rss_mb']:>8.0f}{run['worker_private_mb']:>9.0f}"
+              f"{run['worker_shared_mb']:>8.0f}")
+    single = results['single_process']
+    print(f"\nOne process with {single['threads_per_worker']} threads: "
+          f"{single['rounds_per_second']:.1f} rounds/s")
+    print("rss, private and saved (shared with the parent) are MB per "
+          "worker.")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Benchmark round throughput against the number of worker processes.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark round throughput against the number of "
+                    "worker processes sharing one model.")
+    parser.add_argument("--model-name",
+                        help="A pre-trained model to benchmark instead of "
+                             "the tiny random one.")
+    parser.add_argument("--max-workers", type=int,
+                        help="The largest pool to try, by default one "
+                             "worker per core.")
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=200,
+                        help="The number of rounds timed per pool size.")
+    parser.add_argument("--sentences", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report to a JSON file.")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+
+    from context_aware_model import ContextAwareTextModel
+
+    # No inference in this process until the pools have been forked
+    with tempfile.TemporaryDirectory() as directory:
+        if args.model_name:
+            model = ContextAwareTextModel(args.model_name)
+            words = [token for token in model.tokenizer.get_vocab()
+                     if token.isalpha()][:5000]
+        else:
+            words = build_tiny_model(directory, seed=args.seed)
+            model = ContextAwareTextModel(directory)
+    sentences = synthetic_sentences(words, args.sentences, seed=args.seed)
+    parent = process_memory_mb()
+
+    max_workers = args.max_workers or max(
+        (os.cpu_count() or 1) // args.threads_per_worker, 1)
+    results = {
+        'model_name': args.model_name or 'tiny-random-bert',
+        'rounds': args.rounds,
+        'parent_rss_mb': parent['rss'] if parent else float('nan'),
+        'runs': [run_pool(model, sentences, workers, args.rounds,
+                          args.threads_per_worker)
+                 for workers in worker_counts(max_workers)],
+    }
+    results['single_process'] = run_single_process(model, sentences,
+                                                   args.rounds)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,88 @@
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Any, Hashable, Optional
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 1024) -> None:
+        """
+        Initialize a bounded, thread-safe least-recently-used cache.
+
+        Parameters
+        ----------
+        maxsize : int, optional
+            The maximum number of entries to keep, by default 1024. Once the
+            cache is full, the least recently used entry is evicted.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Look up a key and mark it as recently used.
+
+        Parameters
+        ----------
+        key : Hashable
+            The key to look up.
+
+        Returns
+        -------
+        Optional[Any]
+            The cached value, or None if the key is not cached.
+        """
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Store a value, evicting the least recently used entry if the cache is
+        full.
+
+        Parameters
+        ----------
+        key : Hashable
+            The key to store the value under.
+        value : Any
+            The value to store.
+        """
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Remove all entries and reset the hit and miss counters.
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> CacheInfo:
+        """
+        Get the cache statistics.
+
+        Returns
+        -------
+        CacheInfo
+            The number of hits and misses, the maximum size and the current
+            number of entries.
+        """
+        return CacheInfo(self.hits, self.misses, self.maxsize,
+                         len(self._data))
+
+    def __len__(self) -> int:
+        return len(self._data)
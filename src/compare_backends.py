@@ -0,0 +1,198 @@
+import argparse
+import gc
+import json
+import random
+import time
+from itertools import islice
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from context_aware_model import ContextAwareTextModel
+from data_processing import list_corpus_files, sentence_stream
+from model_options import BACKENDS, DEFAULT_MODEL_NAME
+from resource_usage import resident_memory_mb
+
+
+def spearman_correlation(a: List[float], b: List[float]) -> float:
+    """
+    Calculate the Spearman rank correlation between two lists of scores.
+
+    Parameters
+    ----------
+    a : List[float]
+        The first list of scores.
+    b : List[float]
+        The second list of scores, of the same length.
+
+    Returns
+    -------
+    float
+        The rank correlation between -1 and 1, or 1.0 if either list has no
+        variation.
+    """
+    rank_a = np.argsort(np.argsort(a))
+    rank_b = np.argsort(np.argsort(b))
+    if rank_a.std() == 0 or rank_b.std() == 0:
+        return 1.0
+    return float(np.corrcoef(rank_a, rank_b)[0, 1])
+
+
+def sample_rounds(model: ContextAwareTextModel, corpus_files: List[str],
+                  num_sentences: int) -> List[Tuple[str, int]]:
+    """
+    Mask a sample of corpus sentences with the reference model, so every
+    backend is compared on the same rounds.
+
+    Parameters
+    ----------
+    model : ContextAwareTextModel
+        The reference model used for masking.
+    corpus_files : List[str]
+        Paths to the text corpus files.
+    num_sentences : int
+        The number of rounds to sample.
+
+    Returns
+    -------
+    List[Tuple[str, int]]
+        The masked sentences and the index of their masked token.
+    """
+    rounds = []
+    for sentence in islice(sentence_stream(corpus_files, cycle=False),
+                           num_sentences * 10):
+        masked_sentence, _, mask_index = model.mask_word(
+            sentence, random.random())
+        if mask_index != -1:
+            rounds.append((masked_sentence, mask_index))
+        if len(rounds) == num_sentences:
+            break
+    return rounds
+
+
+def evaluate_backend(model: ContextAwareTextModel,
+                     rounds: List[Tuple[str, int]],
+                     reference: List[Tuple[List[str], List[float]]],
+                     top_k: int) -> Dict[str, float]:
+    """
+    Time a backend on the sampled rounds and compare its top-k predictions
+    and fitness scores with the fp32 reference.
+
+    Parameters
+    ----------
+    model : ContextAwareTextModel
+        The model running the backend under test.
+    rounds : List[Tuple[str, int]]
+        The masked sentences and the index of their masked token.
+    reference : List[Tuple[List[str], List[float]]]
+        The fp32 top-k words and their fitness for every round.
+    top_k : int
+        The number of top predictions to compare.
+
+    Returns
+    -------
+    Dict[str, float]
+        Latency, top-k agreement and fitness agreement statistics.
+    """
+    latencies, overlaps, top1, correlations, errors = [], [], [], [], []
+    for (masked_sentence, mask_index), (ref_words, ref_fitness) in zip(
+            rounds, reference):
+        start = time.perf_counter()
+        words = model.get_top_predictions(masked_sentence, top_k)
+        fitness = model.score_candidates(masked_sentence, ref_words,
+                                         mask_index)
+        latencies.append(time.perf_counter() - start)
+
+        overlaps.append(len(set(words) & set(ref_words)) / top_k)
+        top1.append(float(words[0] == ref_words[0]))
+        correlations.append(spearman_correlation(fitness, ref_fitness))
+        errors.append(float(np.max(np.abs(
+            np.asarray(fitness) - np.asarray(ref_fitness)))))
+
+    return {
+        'latency_p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'latency_p90_ms': float(np.percentile(latencies, 90) * 1000),
+        'top_k_overlap': float(np.mean(overlaps)),
+        'top_1_agreement': float(np.mean(top1)),
+        'fitness_spearman': float(np.mean(correlations)),
+        'fitness_max_abs_error': float(np.max(errors)),
+    }
+
+
+def main():
+    """
+    Compare the quantized and reduced-precision inference backends with fp32
+    on a sample of corpus sentences.
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare latency, memory and score stability of the "
+                    "CPU inference backends.")
+    parser.add_argument("--language", required=True,
+                        help="The corpus directory under data/corpus.")
+    parser.add_argument("--model-name", default=DEFAULT_MODEL_NAME)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS,
+                        default=list(BACKENDS))
+    parser.add_argument("--sentences", type=int, default=100,
+                        help="The number of sentences to sample.")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--min-agreement", type=float, default=0.9,
+                        help="The minimum top-k overlap and fitness rank "
+                             "correlation for a backend to count as stable.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report to a JSON file.")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+
+    corpus_files = list_corpus_files(f'data/corpus/{args.language}')
+
+    report = {}
+    rounds, reference = [], []
+    # fp32 always runs first, as it provides the reference scores
+    backends = ['fp32'] + [b for b in args.backends if b != 'fp32']
+    for backend in backends:
+        gc.collect()
+        memory_before = resident_memory_mb()
+        start = time.perf_counter()
+        model = ContextAwareTextModel(args.model_name, backend=backend)
+        load_time = time.perf_counter() - start
+        memory = resident_memory_mb() - memory_before
+
+        if backend == 'fp32':
+            rounds = sample_rounds(model, corpus_files, args.sentences)
+            for masked_sentence, mask_index in rounds:
+                words = model.get_top_predictions(masked_sentence, args.top_k)
+                reference.append((words, model.score_candidates(
+                    masked_sentence, words, mask_index)))
+            model.cache.clear()
+            model.vocab_cache.clear()
+
+        stats = evaluate_backend(model, rounds, reference, args.top_k)
+        stats['load_time_s'] = load_time
+        stats['resident_memory_mb'] = memory
+        stats['stable'] = bool(
+            stats['top_k_overlap'] >= args.min_agreement
+            and stats['fitness_spearman'] >= args.min_agreement)
+        report[backend] = stats
+        del model
+
+    print(f"Compared {len(rounds)} rounds against fp32:\n")
+    print(f"{'backend':<14}{'p50 ms':>9}{'p90 ms':>9}{'RSS MB':>9}"
+          f"{'top-k':>8}{'top-1':>8}{'rho':>8}{'stable':>8}")
+    for backend, stats in report.items():
+        print(f"{backend:<14}{stats['latency_p50_ms']:>9.1f}"
+              f"{stats['latency_p90_ms']:>9.1f}"
+              f"{stats['resident_memory_mb']:>9.0f}"
+              f"{stats['top_k_overlap']:>8.2f}"
+              f"{stats['top_1_agreement']:>8.2f}"
+              f"{stats['fitness_spearman']:>8.2f}"
+              f"{'yes' if stats['stable'] else 'no':>8}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
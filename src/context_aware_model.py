@@ -1,13 +1,33 @@
 from transformers import AutoTokenizer, AutoModelForMaskedLM
 import torch
-from typing import List, Tuple
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
 import random
+import time
 import numpy as np
+from cache import CacheInfo, LRUCache
+import instrumentation
+from model_options import BACKENDS, DEFAULT_MODEL_NAME, SCORING_MODES
+from prepared_sentence import PreparedSentence, prepare_sentences
+# Re-exported for code that imported it from here
+from prepared_sentence import is_maskable_token  # noqa: F401
+from vocabulary import build_vocabulary_tables, load_vocabulary_tables, \
+    vocabulary_cache_path
+
+# Log-probability distance (in nats) below the most likely token at which a
+# calibrated logit fitness score reaches 0
+LOGIT_CALIBRATION_SPAN = 10.0
+
+# Batches are padded to the next power of two of at least this many tokens,
+# and rows of different buckets are forwarded separately
+MIN_LENGTH_BUCKET = 16
 
 
 class ContextAwareTextModel:
-    def __init__(self, model_name: str = "bert-base-multilingual-uncased")\
-            -> None:
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME,
+                 cache_size: int = 1024, scoring: str = "perplexity",
+                 backend: str = "fp32",
+                 context_window: Optional[int] = 128,
+                 vocabulary_dir: Optional[str] = None) -> None:
         """
         Initialize the ContextAwareTextModel with a specified pre-trained
         model.
@@ -17,18 +37,194 @@ class ContextAwareTextModel:
         model_name : str, optional
             The name of the pre-trained model to use, by default
             "distilbert-base-uncased".
+        cache_size : int, optional
+            The maximum number of sentence losses to keep in the LRU cache, by
+            default 1024.
+        scoring : str, optional
+            How candidate fitness is calculated, by default "perplexity".
+            "perplexity" compares full-sentence losses for every candidate,
+            "logit" reads calibrated log-probabilities for the whole
+            vocabulary from a single forward pass.
+        backend : str, optional
+            The precision used for CPU inference, by default "fp32".
+            "dynamic-int8" quantizes the linear layers to int8 at load time,
+            "bf16" runs the model in bfloat16.
+        context_window : Optional[int], optional
+            The maximum number of tokens, including [CLS] and [SEP], the
+            model sees around the masked position, by default 128. Longer
+            sentences are cut to a window centred on the mask, which bounds
+            the cost of attention. None uses the longest input the model
+            supports.
+        vocabulary_dir : Optional[str], optional
+            Where to cache the vocabulary tables of the tokenizer (e.g.
+            VOCABULARY_DIR), by default None, which builds them without
+            caching. Either way their rarity ranks tokens by id, see
+            `load_vocabulary_tables`.
         """
+        if scoring not in SCORING_MODES:
+            raise ValueError(f"Unknown scoring mode '{scoring}', expected one "
+                             f"of {SCORING_MODES}")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of "
+                             f"{BACKENDS}")
+
+        self.model_name = model_name
+        self.backend = backend
+        # Time spent in each loading phase, in seconds
+        self.load_timings: Dict[str, float] = {}
+
+        start = time.perf_counter()
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForMaskedLM.from_pretrained(model_name)
+        self.load_timings['tokenizer'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if vocabulary_dir is None:
+            self.vocabulary = build_vocabulary_tables(self.tokenizer)
+        else:
+            self.vocabulary = load_vocabulary_tables(
+                self.tokenizer,
+                vocabulary_cache_path(model_name, vocabulary_dir))
+        self.load_timings['vocabulary'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.model = self._load_model(model_name, backend)
+        self.load_timings['weights'] = time.perf_counter() - start
+        self.scoring = scoring
+        max_length = getattr(self.model.config, 'max_position_embeddings',
+                             512)
+        self.context_window = max_length if context_window is None \
+            else min(context_window, max_length)
+        # The ids of the logits that are playable words; the model's output
+        # may be larger than the tokenizer's vocabulary
+        words = np.zeros(self.model.config.vocab_size, dtype=bool)
+        size = min(len(words), len(self.vocabulary.words))
+        words[:size] = self.vocabulary.words[:size]
+        self.word_mask = torch.from_numpy(words)
+        self.cache = LRUCache(cache_size)
+        # Vocabulary-sized log-probability vectors are large, so only keep the
+        # ones for the last few masked sentences
+        self.vocab_cache = LRUCache(16)
+
+    @staticmethod
+    def _load_model(model_name: str, backend: str) -> torch.nn.Module:
+        """
+        Load the masked language model for the given inference backend.
+
+        Parameters
+        ----------
+        model_name : str
+            The name of the pre-trained model to load.
+        backend : str
+            One of BACKENDS.
+
+        Returns
+        -------
+        torch.nn.Module
+            The model, in evaluation mode.
+        """
+        model = AutoModelForMaskedLM.from_pretrained(model_name)
+        if backend == "dynamic-int8":
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif backend == "bf16":
+            model = model.to(torch.bfloat16)
+        return model.eval()
+
+    def warm_up(self) -> float:
+        """
+        Run a single forward pass on a short sentence, so that one-off
+        initialization costs are not paid during the first round.
+
+        Returns
+        -------
+        float
+            The time the forward pass took, in seconds.
+        """
+        start = time.perf_counter()
+        inputs = self.tokenizer(f"the {self.tokenizer.mask_token} is here.",
+                                return_tensors="pt")
+        with torch.no_grad():
+            self.model(**inputs)
+        self.load_timings['first_inference'] = time.perf_counter() - start
+        return self.load_timings['first_inference']
 
-    def get_maskable_tokens(self, sentence: str, difficulty: float) \
-            -> List[Tuple[int, str]]:
+    def prepare(self, sentence: str) -> PreparedSentence:
+        """
+        Tokenize a sentence once for all following model calls.
+
+        Parameters
+        ----------
+        sentence : str
+            The sentence to tokenize.
+
+        Returns
+        -------
+        PreparedSentence
+            The token ids, offsets and maskable positions of the sentence.
+        """
+        return self.prepare_batch([sentence])[0]
+
+    def prepare_batch(self, sentences: Sequence[str]) \
+            -> List[PreparedSentence]:
+        """
+        Tokenize several sentences with a single tokenizer call, see
+        `prepare`.
+        """
+        with instrumentation.timer("tokenize"):
+            return prepare_sentences(self.tokenizer, sentences,
+                                     self.vocabulary.words)
+
+    def prepare_encoded(self, sentence: str, token_ids: Sequence[int],
+                        offsets: Sequence[Tuple[int, int]],
+                        maskable_positions: Sequence[int]) \
+            -> PreparedSentence:
+        """
+        Wrap an already tokenized sentence (e.g., one read from a
+        CorpusIndex) without calling the tokenizer again.
+
+        Parameters
+        ----------
+        sentence : str
+            The sentence.
+        token_ids : Sequence[int]
+            The token ids of the sentence, without [CLS] and [SEP].
+        offsets : Sequence[Tuple[int, int]]
+            The character span of every token in `sentence`.
+        maskable_positions : Sequence[int]
+            The indices of the tokens that can be masked.
+
+        Returns
+        -------
+        PreparedSentence
+            The prepared sentence.
+        """
+        return PreparedSentence(
+            sentence,
+            [self.tokenizer.cls_token_id, *map(int, token_ids),
+             self.tokenizer.sep_token_id],
+            [(int(start), int(end)) for start, end in offsets],
+            [int(position) for position in maskable_positions])
+
+    def _prepared(self, sentences: Sequence[Union[str, PreparedSentence]]) \
+            -> List[PreparedSentence]:
+        """
+        Prepare the sentences that are plain strings, in one tokenizer call.
+        """
+        strings = [s for s in sentences if isinstance(s, str)]
+        if not strings:
+            return list(sentences)
+        prepared = iter(self.prepare_batch(strings))
+        return [next(prepared) if isinstance(s, str) else s
+                for s in sentences]
+
+    def get_maskable_tokens(self, sentence: Union[str, PreparedSentence],
+                            difficulty: float) -> List[Tuple[int, str]]:
         """
         Get a list of tokens that can be masked based on the difficulty level.
 
         Parameters:
         -----------
-        sentence : str
+        sentence : Union[str, PreparedSentence]
             The input sentence to tokenize and analyze.
         difficulty : float
             The difficulty level as a float (higher means more difficult).
@@ -38,26 +234,43 @@ class ContextAwareTextModel:
         List[Tuple[int, str]]
             A list of tuples containing the token index and the token itself.
         """
-        tokens = self.tokenizer.tokenize(sentence, add_special_tokens=True)
-        encoded = self.tokenizer.encode(sentence, add_special_tokens=True)
-
-        # Skip [CLS] and [SEP]
-        tokens = tokens[1:-1]
-        encoded = encoded[1:-1]
-
-        # Filter out unmaskable tokens
+        prepared, = self._prepared([sentence])
+        encoded = prepared.token_ids
         maskable_tokens = [
-            (i, token)
-            for i, (token, token_id) in enumerate(zip(tokens, encoded))
-            if token.isalpha() and not token.startswith('##')
-            and token not in self.tokenizer.all_special_tokens
+            (i, self.tokenizer.convert_ids_to_tokens(encoded[i]))
+            for i in prepared.maskable_positions
         ]
 
         if not maskable_tokens:
             return []
 
-        # Sort by token ID to determine the relative difficulty
-        maskable_tokens.sort(key=lambda x: encoded[x[0]])
+        return [self._select_by_difficulty(maskable_tokens, encoded,
+                                           difficulty)]
+
+    def _select_by_difficulty(self, maskable_tokens: List[Tuple[int, str]],
+                              encoded: Sequence[int], difficulty: float) \
+            -> Tuple[int, str]:
+        """
+        Select one of the maskable tokens based on the difficulty level.
+
+        Parameters
+        ----------
+        maskable_tokens : List[Tuple[int, str]]
+            The maskable token indices and tokens to choose from.
+        encoded : Sequence[int]
+            The token ids of the sentence, without [CLS] and [SEP].
+        difficulty : float
+            The difficulty level as a float (higher means more difficult).
+
+        Returns
+        -------
+        Tuple[int, str]
+            The token index and the token that was selected.
+        """
+        # Sort by the rarity of the token to determine the relative difficulty
+        rarity = self.vocabulary.rarity
+        maskable_tokens = sorted(maskable_tokens,
+                                 key=lambda x: rarity[encoded[x[0]]])
 
         # Define the difficulty scaling based on the input score
         n = len(maskable_tokens)
@@ -72,18 +285,70 @@ class ContextAwareTextModel:
         # Use a Gaussian distribution centered around the mean_index
         selected_index = int(np.clip(np.random.normal(
             loc=mean_index, scale=std_dev), 0, n - 1))
-        selected_token = maskable_tokens[selected_index]
+        return maskable_tokens[selected_index]
+
+    def word_token_ids(self, words: Sequence[str]) -> List[Optional[int]]:
+        """
+        Look up the token of words that can be masked, e.g. to find them in
+        the word index of a CorpusIndex.
+
+        Parameters
+        ----------
+        words : Sequence[str]
+            The words, as they appear in a sentence.
+
+        Returns
+        -------
+        List[Optional[int]]
+            The token id of every word, or None for words that are not a
+            single maskable token.
+        """
+        if not words:
+            return []
+        encoded = self.tokenizer(list(words),
+                                 add_special_tokens=False)['input_ids']
+        return [ids[0] if len(ids) == 1 and self.vocabulary.words[ids[0]]
+                else None for ids in encoded]
+
+    def candidate_token_ids(self, candidates: Sequence[Union[str, int]]) \
+            -> List[int]:
+        """
+        Look up the token ids of candidates for a masked position.
 
-        return [selected_token]
+        Token ids, e.g. the masked token of a PreparedSentence, are used as
+        they are. Words, e.g. a user's guess, are normalized the way the
+        tokenizer normalizes text first (lowercased and stripped of accents
+        for an uncased model), so "Paris" finds the token "paris". Words
+        that are not a single vocabulary entry map to the unknown token.
 
-    def mask_word(self, sentence: str, difficulty: str) \
-            -> Tuple[str, str, int]:
+        Parameters
+        ----------
+        candidates : Sequence[Union[str, int]]
+            The candidate words or token ids.
+
+        Returns
+        -------
+        List[int]
+            The token id of every candidate.
+        """
+        normalizer = self.tokenizer.backend_tokenizer.normalizer
+        token_ids = []
+        for candidate in candidates:
+            if isinstance(candidate, str):
+                if normalizer is not None:
+                    candidate = normalizer.normalize_str(candidate).strip()
+                candidate = self.tokenizer.convert_tokens_to_ids(candidate)
+            token_ids.append(int(candidate))
+        return token_ids
+
+    def mask_word(self, sentence: Union[str, PreparedSentence],
+                  difficulty: str) -> Tuple[str, str, int]:
         """
         Mask a word in the sentence based on the given difficulty.
 
         Parameters:
         -----------
-        sentence : str
+        sentence : Union[str, PreparedSentence]
             The input sentence to mask a word from.
         difficulty : str
             The difficulty level ('easy', 'medium', or 'hard').
@@ -94,28 +359,49 @@ class ContextAwareTextModel:
             A tuple containing the masked sentence, the original word, and the
             index of the masked token.
         """
-        maskable_tokens = self.get_maskable_tokens(sentence, difficulty)
+        # Tokenize once; the offsets and maskable tokens all come from the
+        # same call
+        prepared, = self._prepared([sentence])
+        maskable_tokens = self.get_maskable_tokens(prepared, difficulty)
 
         if not maskable_tokens:
             # If no suitable tokens for the given difficulty, choose any
             # maskable token
-            maskable_tokens = self.get_maskable_tokens(sentence, 0.5)
+            maskable_tokens = self.get_maskable_tokens(prepared, 0.5)
 
         if not maskable_tokens:
             # If still no maskable tokens, return the original sentence
-            return sentence, '', -1
+            return prepared.text, '', -1
 
         # Select a token to mask
         mask_index, token_to_mask = random.choice(maskable_tokens)
 
-        # Tokenize the sentence to get tokens with their original positions
-        encoded_sentence = self.tokenizer.encode_plus(
-            sentence, return_offsets_mapping=True)
-        # Exclude [CLS] and [SEP]
-        offsets = encoded_sentence['offset_mapping'][1:-1]
+        return self.mask_at(prepared.text, prepared.offsets, mask_index)
+
+    def mask_at(self, sentence: str, offsets: Sequence[Tuple[int, int]],
+                mask_index: int) -> Tuple[str, str, int]:
+        """
+        Replace the token at the given index with the mask token, e.g. a
+        position drawn from the difficulty index of a CorpusIndex.
 
+        Parameters
+        ----------
+        sentence : str
+            The input sentence to mask a word from.
+        offsets : Sequence[Tuple[int, int]]
+            The character span of every token in `sentence`, without [CLS]
+            and [SEP].
+        mask_index : int
+            The index of the token to mask.
+
+        Returns
+        -------
+        Tuple[str, str, int]
+            A tuple containing the masked sentence, the original word, and the
+            index of the masked token.
+        """
         # Find the original word using the offset
-        start, end = offsets[mask_index]
+        start, end = (int(offset) for offset in offsets[mask_index])
         original_word = sentence[start:end]
 
         # Replace the original word with the mask token in the original
@@ -125,14 +411,36 @@ class ContextAwareTextModel:
 
         return masked_sentence, original_word, mask_index
 
-    def get_top_predictions(self, masked_sentence: str, top_k: int = 10) \
-            -> List[str]:
+    def mask_prepared(self, prepared: PreparedSentence, mask_index: int) \
+            -> PreparedSentence:
+        """
+        Mask the token at the given index of a prepared sentence, without
+        tokenizing the masked sentence again.
+
+        Parameters
+        ----------
+        prepared : PreparedSentence
+            The sentence to mask a word in.
+        mask_index : int
+            The index of the token to mask.
+
+        Returns
+        -------
+        PreparedSentence
+            The masked sentence, ready to be scored.
+        """
+        return prepared.masked(mask_index, self.tokenizer.mask_token,
+                               self.tokenizer.mask_token_id)
+
+    def get_top_predictions(self,
+                            masked_sentence: Union[str, PreparedSentence],
+                            top_k: int = 10) -> List[str]:
         """
         Generate the top K predictions for a masked token in a sentence.
 
         Parameters
         ----------
-        masked_sentence : str
+        masked_sentence : Union[str, PreparedSentence]
             The input sentence with a masked token (e.g., "[MASK]").
         top_k : int, optional
             The number of top predictions to return, by default 10.
@@ -148,20 +456,323 @@ class ContextAwareTextModel:
         >>> get_top_predictions("The quick brown [MASK] jumps over the lazy dog.", top_k=5)
         ['fox', 'dog', 'cat', 'horse', 'rabbit']
         """
-        inputs = self.tokenizer(masked_sentence, return_tensors="pt")
-        mask_token_index = torch.where(
-            inputs["input_ids"] == self.tokenizer.mask_token_id)[1]
+        return self.get_top_predictions_batch([masked_sentence], top_k)[0]
 
-        with torch.no_grad():
-            outputs = self.model(**inputs)
+    def get_top_predictions_batch(
+            self, masked_sentences: List[Union[str, PreparedSentence]],
+            top_k: int = 10) -> List[List[str]]:
+        """
+        Generate the top K predictions for several masked sentences with a
+        single padded forward pass. Only whole words are predicted, never
+        punctuation, subword pieces or special tokens.
+
+        Parameters
+        ----------
+        masked_sentences : List[Union[str, PreparedSentence]]
+            The input sentences, each with a masked token (e.g., "[MASK]").
+        top_k : int, optional
+            The number of top predictions to return, by default 10.
+
+        Returns
+        -------
+        List[List[str]]
+            The top K predicted tokens for every sentence.
+        """
+        all_log_probs = self.score_vocabulary_batch(masked_sentences)
+        if not all_log_probs:
+            return []
+        with instrumentation.timer("top_k_decode"):
+            # One top-k over all sentences, with the non-words ruled out, and
+            # one decoding call
+            log_probs = torch.stack(all_log_probs).masked_fill(
+                ~self.word_mask, -torch.inf)
+            top_k = min(top_k, int(self.word_mask.sum()))
+            if top_k == 0:
+                return [[] for _ in all_log_probs]
+            tokens = self.tokenizer.convert_ids_to_tokens(
+                torch.topk(log_probs, top_k).indices.flatten().tolist())
+            return [tokens[i:i + top_k]
+                    for i in range(0, len(tokens), top_k)]
+
+    def score_vocabulary(self,
+                         masked_sentence: Union[str, PreparedSentence]) \
+            -> torch.Tensor:
+        """
+        Calculate the log-probability of every vocabulary entry at the masked
+        position with a single forward pass.
+
+        Parameters
+        ----------
+        masked_sentence : Union[str, PreparedSentence]
+            The input sentence with a masked token (e.g., "[MASK]").
+
+        Returns
+        -------
+        torch.Tensor
+            A tensor of shape (vocab,) with the log-probability of each token
+            id at the (first) masked position.
+        """
+        return self.score_vocabulary_batch([masked_sentence])[0]
+
+    def score_vocabulary_batch(
+            self, masked_sentences: List[Union[str, PreparedSentence]]) \
+            -> List[torch.Tensor]:
+        """
+        Calculate the vocabulary log-probabilities at the masked position of
+        several sentences, running one padded forward pass for the sentences
+        that are not cached yet.
+
+        Parameters
+        ----------
+        masked_sentences : List[Union[str, PreparedSentence]]
+            The input sentences, each with a masked token (e.g., "[MASK]").
+
+        Returns
+        -------
+        List[torch.Tensor]
+            A tensor of shape (vocab,) for every sentence.
+        """
+        # Use the first mask token of every sentence, and only keep the
+        # context window around it
+        keys = []
+        for ids in self._input_ids(masked_sentences):
+            ids, _ = self._window(ids, ids.index(self.tokenizer.mask_token_id))
+            keys.append(tuple(ids))
+        results = [self.vocab_cache.get(key) for key in keys]
+
+        missing = list(dict.fromkeys(
+            key for key, log_probs in zip(keys, results) if log_probs is None))
+
+        if missing:
+            computed = {}
+            for rows, logits in self._forward(missing):
+                for row, i in enumerate(rows):
+                    key = missing[i]
+                    mask_position = key.index(self.tokenizer.mask_token_id)
+                    computed[key] = torch.log_softmax(
+                        logits[row, mask_position].float(), dim=-1)
+                    self.vocab_cache.put(key, computed[key])
+            results = [log_probs if log_probs is not None else computed[key]
+                       for key, log_probs in zip(keys, results)]
+
+        return results
+
+    def position_confidence_batch(
+            self, positions: Sequence[Tuple[PreparedSentence, int]]) \
+            -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Measure how confidently the model fills in tokens: every position is
+        masked on its own, and all masked copies are forwarded in padded
+        batches.
+
+        Parameters
+        ----------
+        positions : Sequence[Tuple[PreparedSentence, int]]
+            The sentence and the index of the token to mask, without [CLS].
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            The entropy (in nats) of the predicted distribution and the rank
+            of the original token in it (0 when it is the top prediction),
+            for every position.
+        """
+        rows, targets, originals = [], [], []
+        for prepared, mask_index in positions:
+            input_ids = list(prepared.input_ids)
+            originals.append(input_ids[mask_index + 1])
+            input_ids[mask_index + 1] = self.tokenizer.mask_token_id
+            input_ids, position = self._window(input_ids, mask_index + 1)
+            rows.append(input_ids)
+            targets.append(position)
 
-        logits = outputs.logits
-        mask_token_logits = logits[0, mask_token_index, :]
-        top_k_tokens = torch.topk(mask_token_logits, top_k, dim=1)\
-            .indices[0].tolist()
-        return [self.tokenizer.decode([token]) for token in top_k_tokens]
+        entropy = np.zeros(len(rows), dtype=np.float32)
+        rank = np.zeros(len(rows), dtype=np.int32)
+        for indices, logits in self._forward(rows):
+            log_probs = torch.log_softmax(logits[
+                torch.arange(len(indices)),
+                torch.tensor([targets[i] for i in indices])].float(), dim=-1)
+            original = log_probs.gather(
+                1, torch.tensor([[originals[i]] for i in indices]))
+            entropy[indices] = -(log_probs.exp() * log_probs).sum(-1).numpy()
+            rank[indices] = (log_probs > original).sum(-1).numpy()
+        return entropy, rank
 
-    def calculate_perplexity(self, sentence: str, word: str, mask_index: int) \
+    def _input_ids(self,
+                   sentences: Sequence[Union[str, PreparedSentence]]) \
+            -> List[List[int]]:
+        """
+        Get the token ids, with [CLS] and [SEP], of every sentence, only
+        tokenizing the plain strings.
+        """
+        strings = [s for s in sentences if isinstance(s, str)]
+        if not strings:
+            return [s.input_ids for s in sentences]
+        with instrumentation.timer("tokenize"):
+            encoded = iter(self.tokenizer(strings)['input_ids'])
+        return [next(encoded) if isinstance(s, str) else s.input_ids
+                for s in sentences]
+
+    def _window(self, input_ids: Sequence[int], position: int) \
+            -> Tuple[List[int], int]:
+        """
+        Cut token ids down to the context window around a position.
+
+        Parameters
+        ----------
+        input_ids : Sequence[int]
+            The token ids of a sentence, with [CLS] and [SEP].
+        position : int
+            The position in `input_ids` the window is centred on.
+
+        Returns
+        -------
+        Tuple[List[int], int]
+            The token ids of the window, again with [CLS] and [SEP], and the
+            position within the window.
+        """
+        if len(input_ids) <= self.context_window:
+            return list(input_ids), position
+
+        # Centre the window on the position, but keep it inside the sentence
+        # so it is filled up with context from the other side near the edges
+        size = self.context_window - 2
+        start = min(max(position - 1 - size // 2, 0),
+                    len(input_ids) - 2 - size)
+        window = [input_ids[0], *input_ids[1 + start:1 + start + size],
+                  input_ids[-1]]
+        return window, position - start
+
+    def _forward(self, sequences: List[Sequence[int]]) \
+            -> Iterator[Tuple[List[int], torch.Tensor]]:
+        """
+        Run the model on token id sequences, forwarding sequences of similar
+        length together.
+
+        Every sequence is assigned to the smallest power-of-two length bucket
+        it fits in, so a long sentence does not make short ones pay for its
+        padding and attention cost.
+
+        Parameters
+        ----------
+        sequences : List[Sequence[int]]
+            The token ids of every row.
+
+        Yields
+        ------
+        Tuple[List[int], torch.Tensor]
+            The indices of the sequences in a bucket and their logits of
+            shape (rows, bucket length, vocab).
+        """
+        buckets: Dict[int, List[int]] = {}
+        for i, ids in enumerate(sequences):
+            buckets.setdefault(self._bucket_length(len(ids)), []).append(i)
+
+        for length, rows in sorted(buckets.items()):
+            input_ids, attention_mask = self._pad(
+                [sequences[i] for i in rows], length)
+            instrumentation.count("forward_passes")
+            instrumentation.count("forward_rows", len(rows))
+            with instrumentation.timer("forward"), torch.no_grad():
+                logits = self.model(input_ids=input_ids,
+                                    attention_mask=attention_mask).logits
+            yield rows, logits
+
+    def _bucket_length(self, length: int) -> int:
+        """
+        Round a sequence length up to its length bucket.
+        """
+        bucket = MIN_LENGTH_BUCKET
+        while bucket < length:
+            bucket *= 2
+        return min(bucket, max(length, self.context_window))
+
+    def _pad(self, sequences: List[Sequence[int]],
+             length: Optional[int] = None) \
+            -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Right-pad token id sequences into a single batch.
+
+        Parameters
+        ----------
+        sequences : List[Sequence[int]]
+            The token ids of every row.
+        length : Optional[int], optional
+            The length to pad to, by default the longest sequence.
+
+        Returns
+        -------
+        Tuple[torch.Tensor, torch.Tensor]
+            The padded token ids and the attention mask, both of shape
+            (batch, length).
+        """
+        if length is None:
+            length = max(len(ids) for ids in sequences)
+        input_ids = torch.full((len(sequences), length),
+                               self.tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(sequences), length),
+                                     dtype=torch.long)
+        for row, ids in enumerate(sequences):
+            input_ids[row, :len(ids)] = torch.tensor(list(ids))
+            attention_mask[row, :len(ids)] = 1
+        return input_ids, attention_mask
+
+    def vocabulary_fitness(self,
+                           masked_sentence: Union[str, PreparedSentence]) \
+            -> torch.Tensor:
+        """
+        Calculate the calibrated "logit" fitness score of every vocabulary
+        entry at the masked position.
+
+        Parameters
+        ----------
+        masked_sentence : Union[str, PreparedSentence]
+            The input sentence with a masked token (e.g., "[MASK]").
+
+        Returns
+        -------
+        torch.Tensor
+            A tensor of shape (vocab,) with a fitness score between 0 and 1
+            for each token id.
+        """
+        log_probs = self.score_vocabulary(masked_sentence)
+        return self.calibrate_logit_scores(log_probs, log_probs.max().item())
+
+    def calibrate_logit_scores(self, log_probs: torch.Tensor,
+                               max_log_prob: float,
+                               span: float = LOGIT_CALIBRATION_SPAN) \
+            -> torch.Tensor:
+        """
+        Map log-probabilities onto the 0-1 fitness range used by the feedback.
+
+        The most likely token scores 1 and the score falls linearly with the
+        distance in log-probability, reaching 0 at `span` nats below the most
+        likely token.
+
+        Parameters
+        ----------
+        log_probs : torch.Tensor
+            The log-probabilities to calibrate.
+        max_log_prob : float
+            The log-probability of the most likely token.
+        span : float, optional
+            The log-probability distance that maps to a score of 0, by default
+            LOGIT_CALIBRATION_SPAN.
+
+        Returns
+        -------
+        torch.Tensor
+            The calibrated fitness scores, with the same shape as `log_probs`.
+
+        Examples
+        --------
+        >>> calibrate_logit_scores(torch.tensor([-1.0, -3.5, -20.0]), -1.0)
+        tensor([1.0000, 0.7500, 0.0000])
+        """
+        return (1 - (max_log_prob - log_probs) / span).clamp(0, 1)
+
+    def calculate_perplexity(self, sentence: Union[str, PreparedSentence],
+                             word: Union[str, int], mask_index: int) \
             -> float:
         """
         Calculate the perplexity of a sentence with a masked token and compare
@@ -170,12 +781,14 @@ class ContextAwareTextModel:
 
         Parameters
         ----------
-        sentence : str
+        sentence : Union[str, PreparedSentence]
             The input sentence containing a masked token (e.g., "[MASK]").
-        word : str
-            The word to place at the masked position for comparison.
+        word : Union[str, int]
+            The word to place at the masked position for comparison, or its
+            token id.
         mask_index : int
-            The index position of the masked token in the input sentence.
+            The index position of the masked token in the input sentence,
+            without [CLS], as returned by `mask_word`.
 
         Returns
         -------
@@ -189,25 +802,278 @@ class ContextAwareTextModel:
         >>> calculate_perplexity("The quick brown [MASK] jumps over the lazy dog.", "fox", mask_index=3)
         (20.5, 18.3)
         """
-        inputs = self.tokenizer(sentence, return_tensors="pt")
-        labels = inputs.input_ids.clone()
+        labels, = self._input_ids([sentence])
 
-        # Calculate perplexity for the original masked sentence
-        with torch.no_grad():
-            outputs = self.model(**inputs, labels=labels)
-            loss = outputs.loss.item()
-            perplexity_masked = np.exp(loss)
-
-        # Replace the mask with the word and calculate new perplexity
-        inputs.input_ids[0, mask_index] = self.tokenizer.convert_tokens_to_ids(
-            [word])[0]
-        with torch.no_grad():
-            outputs = self.model(**inputs, labels=labels)
-            loss = outputs.loss.item()
-            perplexity_word = np.exp(loss)
+        # Row 0 is the original masked sentence, row 1 has the word placed at
+        # the masked position
+        loss_masked, loss_word = self._cached_losses(self._candidate_rows(
+            labels, mask_index, self.candidate_token_ids([word])))
 
+        perplexity_masked = np.exp(loss_masked)
+        perplexity_word = np.exp(loss_word)
         return perplexity_masked, perplexity_word
 
+    def score_candidates(self, masked_sentence: Union[str, PreparedSentence],
+                         candidates: List[Union[str, int]],
+                         mask_index: int) \
+            -> List[float]:
+        """
+        Calculate the fitness score of several candidate words for the masked
+        position using a single batched forward pass.
+
+        The first row of the batch holds the masked sentence itself and acts
+        as the baseline; every following row places one candidate at the
+        masked position. The returned scores are identical to calling
+        `calculate_perplexity` and `calculate_fitness_score` for each
+        candidate separately.
+
+        In "logit" scoring mode the candidates are instead read from the
+        calibrated vocabulary-wide fitness of `vocabulary_fitness`, and
+        `mask_index` is not used.
+
+        Parameters
+        ----------
+        masked_sentence : Union[str, PreparedSentence]
+            The input sentence containing a masked token (e.g., "[MASK]").
+        candidates : List[Union[str, int]]
+            The words to place at the masked position, or their token ids,
+            see `candidate_token_ids`.
+        mask_index : int
+            The index position of the masked token in the input sentence,
+            without [CLS], as returned by `mask_word`.
+
+        Returns
+        -------
+        List[float]
+            The fitness score of each candidate, in the same order as
+            `candidates`.
+
+        Examples
+        --------
+        >>> score_candidates("The quick brown [MASK] jumps over the lazy dog.",
+        ...                  ["fox", "dog"], mask_index=3)
+        [1.12, 1.05]
+        """
+        if not candidates:
+            return []
+        return self.score_batch([(masked_sentence, candidates, mask_index)])[0]
+
+    def score_batch(
+            self,
+            requests: Sequence[Tuple[Union[str, PreparedSentence],
+                                     List[Union[str, int]], int]]) \
+            -> List[List[float]]:
+        """
+        Calculate the fitness scores of candidate words for several masked
+        sentences at once, e.g. for requests collected from concurrent game
+        sessions.
+
+        All rows that are not cached yet, over all sentences, are padded into
+        a single batch and scored with one forward pass.
+
+        Parameters
+        ----------
+        requests : Sequence[Tuple[Union[str, PreparedSentence],
+                   List[Union[str, int]], int]]
+            The masked sentence, the candidate words or token ids (see
+            `candidate_token_ids`) and the index of the masked token for
+            every request.
+
+        Returns
+        -------
+        List[List[float]]
+            The fitness score of each candidate, for every request.
+        """
+        if self.scoring == "logit":
+            # Every candidate is read from its sentence's vocabulary-wide
+            # tensor
+            all_log_probs = self.score_vocabulary_batch(
+                [masked_sentence for masked_sentence, _, _ in requests])
+            results = []
+            for (_, candidates, _), log_probs in zip(requests,
+                                                     all_log_probs):
+                fitness = self.calibrate_logit_scores(
+                    log_probs, log_probs.max().item())
+                results.append(
+                    fitness[self.candidate_token_ids(candidates)].tolist())
+            return results
+
+        encoded = self._input_ids(
+            [masked_sentence for masked_sentence, _, _ in requests])
+
+        # For every request, the first row is the masked baseline and row
+        # i + 1 holds candidate i
+        rows = []
+        for labels, (_, candidates, mask_index) in zip(encoded, requests):
+            rows.extend(self._candidate_rows(
+                labels, mask_index, self.candidate_token_ids(candidates)))
+
+        losses = self._cached_losses(rows)
+
+        results = []
+        start = 0
+        for _, candidates, _ in requests:
+            perplexity_masked = np.exp(losses[start])
+            results.append([
+                self.calculate_fitness_score(perplexity_masked, np.exp(loss))
+                for loss in losses[start + 1:start + 1 + len(candidates)]])
+            start += len(candidates) + 1
+        return results
+
+    def baseline_loss(self, masked_sentence: Union[str, PreparedSentence],
+                      mask_index: int) -> float:
+        """
+        Get the loss of the masked sentence itself, the baseline every
+        candidate's perplexity is compared with.
+
+        Parameters
+        ----------
+        masked_sentence : Union[str, PreparedSentence]
+            The input sentence containing a masked token (e.g., "[MASK]").
+        mask_index : int
+            The index of the masked token, without [CLS].
+
+        Returns
+        -------
+        float
+            The mean token cross-entropy of the masked sentence.
+        """
+        labels, = self._input_ids([masked_sentence])
+        return self._cached_losses(
+            self._candidate_rows(labels, mask_index, []))[0]
+
+    def seed_baseline_loss(self,
+                           masked_sentence: Union[str, PreparedSentence],
+                           mask_index: int, loss: float) -> None:
+        """
+        Put a precomputed baseline loss in the cache, so scoring a guess for
+        the sentence only forwards the guess.
+
+        Parameters
+        ----------
+        masked_sentence : Union[str, PreparedSentence]
+            The input sentence containing a masked token (e.g., "[MASK]").
+        mask_index : int
+            The index of the masked token, without [CLS].
+        loss : float
+            The loss returned by `baseline_loss` for the same model.
+        """
+        labels, = self._input_ids([masked_sentence])
+        (input_ids, labels), = self._candidate_rows(labels, mask_index, [])
+        self.cache.put((tuple(input_ids), tuple(labels)), loss)
+
+    def _candidate_rows(self, labels: Sequence[int], mask_index: int,
+                        candidate_ids: List[int]) \
+            -> List[Tuple[List[int], List[int]]]:
+        """
+        Build the (input ids, labels) rows that score candidates for the
+        masked position: the masked baseline followed by one row per
+        candidate, all cut to the context window around the mask.
+
+        Parameters
+        ----------
+        labels : Sequence[int]
+            The token ids of the masked sentence, with [CLS] and [SEP].
+        mask_index : int
+            The index of the masked token, without [CLS].
+        candidate_ids : List[int]
+            The token ids of the candidates.
+
+        Returns
+        -------
+        List[Tuple[List[int], List[int]]]
+            The baseline row and a row for every candidate.
+        """
+        # Shift the mask index past [CLS]
+        labels, position = self._window(labels, mask_index + 1)
+        rows = [(labels, labels)]
+        for candidate_id in candidate_ids:
+            input_ids = list(labels)
+            input_ids[position] = candidate_id
+            rows.append((input_ids, labels))
+        return rows
+
+    def _cached_losses(self,
+                       rows: List[Tuple[Sequence[int], Sequence[int]]]) \
+            -> List[float]:
+        """
+        Get the loss of every (input ids, labels) row, running padded forward
+        passes, one per length bucket, for the rows that are not in the cache
+        yet.
+
+        Parameters
+        ----------
+        rows : List[Tuple[Sequence[int], Sequence[int]]]
+            The token ids and the target token ids of every row.
+
+        Returns
+        -------
+        List[float]
+            The loss of each row.
+        """
+        keys = [(tuple(input_ids), tuple(labels))
+                for input_ids, labels in rows]
+        losses = [self.cache.get(key) for key in keys]
+
+        # Rows may repeat (e.g. a guess equal to the original word), so only
+        # forward each missing key once
+        missing = list(dict.fromkeys(
+            key for key, loss in zip(keys, losses) if loss is None))
+
+        if missing:
+            computed = {}
+            for rows, logits in self._forward(
+                    [input_ids for input_ids, _ in missing]):
+                labels, attention_mask = self._pad(
+                    [missing[i][1] for i in rows], logits.shape[1])
+                new_losses = self._sequence_losses(logits, labels,
+                                                   attention_mask)
+                for i, loss in zip(rows, new_losses):
+                    computed[missing[i]] = loss
+                    self.cache.put(missing[i], loss)
+            losses = [loss if loss is not None else computed[key]
+                      for key, loss in zip(keys, losses)]
+
+        return losses
+
+    def cache_info(self) -> CacheInfo:
+        """
+        Get the hit and miss statistics of the sentence loss cache.
+
+        Returns
+        -------
+        CacheInfo
+            The number of hits and misses, the maximum size and the current
+            number of cached losses.
+        """
+        return self.cache.info()
+
+    def _sequence_losses(self, logits: torch.Tensor, labels: torch.Tensor,
+                         attention_mask: torch.Tensor) -> List[float]:
+        """
+        Calculate the mean token cross-entropy of every row in a batch, the
+        same loss the model reports for a single sentence.
+
+        Parameters
+        ----------
+        logits : torch.Tensor
+            The model logits of shape (batch, length, vocab).
+        labels : torch.Tensor
+            The target token ids of shape (batch, length).
+        attention_mask : torch.Tensor
+            The attention mask of shape (batch, length); padded positions are
+            left out of the mean.
+
+        Returns
+        -------
+        List[float]
+            The loss of each row in the batch.
+        """
+        token_losses = torch.nn.functional.cross_entropy(
+            logits.float().transpose(1, 2), labels, reduction="none")
+        mask = attention_mask.to(token_losses.dtype)
+        return ((token_losses * mask).sum(dim=1) / mask.sum(dim=1)).tolist()
+
     def calculate_fitness_score(self,
                                 perplexity_masked: float,
                                 perplexity_word: float) -> float:
@@ -0,0 +1,585 @@
+import json
+import os
+import random
+from collections import Counter
+from typing import BinaryIO, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from data_processing import FREQUENCY_FILE, calculate_frequency_dict, \
+    load_frequency_dict, preprocess_text, save_frequency_dict, \
+    stream_sentences
+from preprocessing import iter_preprocessed_sentences, \
+    load_preprocessed_frequencies
+from prepared_sentence import prepare_sentences
+from vocabulary import VocabularyTables, build_vocabulary_tables
+
+if TYPE_CHECKING:
+    from context_aware_model import ContextAwareTextModel
+
+# The flat arrays that make up an index, with their dtype and trailing shape.
+# Every array is stored as a raw binary file next to `meta.json` and opened as
+# a read-only memory map.
+INDEX_ARRAYS: Dict[str, Tuple[str, Tuple[int, ...]]] = {
+    # UTF-8 bytes of all sentences, back to back
+    'text': ('uint8', ()),
+    # Byte offset of every sentence in `text`, plus the end offset
+    'sentence_offsets': ('int64', ()),
+    # Token ids of all sentences, without [CLS] and [SEP]
+    'token_ids': ('int32', ()),
+    # Character span of every token within its sentence
+    'char_spans': ('int32', (2,)),
+    # Offset of every sentence's first token in `token_ids`, plus the end
+    'token_offsets': ('int64', ()),
+    # Maskable token positions within their sentence
+    'maskable': ('int32', ()),
+    # Offset of every sentence's first position in `maskable`, plus the end
+    'maskable_offsets': ('int64', ()),
+}
+
+# Sorted difficulty of every maskable position, stored as regular .npy files
+# so they can be opened with np.load(mmap_mode='r')
+DIFFICULTY_ARRAYS = ('difficulty', 'difficulty_sentences',
+                     'difficulty_positions')
+
+# How confidently the model predicts the original token of every maskable
+# position, in the order of `maskable`
+CONFIDENCE_ARRAYS = ('confidence_entropy', 'confidence_rank')
+
+# Inverted index from token ids to the maskable positions of that token, in
+# CSR layout: the positions of token id t are entries word_offsets[t] to
+# word_offsets[t + 1] of `word_sentences` and `word_positions`
+WORD_ARRAYS = ('word_offsets', 'word_sentences', 'word_positions')
+
+INDEX_VERSION = 1
+
+
+class _ArrayWriter:
+    def __init__(self, path: str, dtype: str) -> None:
+        """
+        Append arrays of a fixed dtype to a raw binary file.
+
+        Parameters
+        ----------
+        path : str
+            The file to write to.
+        dtype : str
+            The NumPy dtype of the stored values.
+        """
+        self.dtype = np.dtype(dtype)
+        self.file: BinaryIO = open(path, 'wb')
+        self.count = 0
+
+    def write(self, values) -> None:
+        array = np.asarray(values, dtype=self.dtype)
+        self.file.write(array.tobytes())
+        self.count += len(array)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def build_corpus_index(corpus_files: List[str], index_dir: str, tokenizer,
+                       batch_size: int = 1024,
+                       preprocessed_dir: Optional[str] = None) -> int:
+    """
+    Split a corpus into sentences, tokenize them and store the result as flat
+    memory-mappable arrays.
+
+    Sentences are streamed from the corpus files, tokenized in batches with
+    the fast tokenizer and written to disk as they are produced, so only one
+    chunk and one batch are held in memory at a time. The word frequencies of
+    the corpus are counted along the way and used to rank the vocabulary by
+    rarity, which gives the difficulty index of all maskable positions.
+
+    With a corpus preprocessed by `preprocess_corpus`, its sentence shards
+    and word frequencies are read instead, so sentence splitting and word
+    counting are not repeated serially.
+
+    Parameters
+    ----------
+    corpus_files : List[str]
+        Paths to the text corpus files.
+    index_dir : str
+        The directory to write the index to.
+    tokenizer : transformers.PreTrainedTokenizerFast
+        The tokenizer of the model that will play with the index.
+    batch_size : int, optional
+        The number of sentences to tokenize at once, by default 1024.
+    preprocessed_dir : Optional[str], optional
+        The directory the corpus files were preprocessed to, see
+        `is_preprocessed`.
+
+    Returns
+    -------
+    int
+        The number of sentences in the index.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    writers = {name: _ArrayWriter(os.path.join(index_dir, f'{name}.bin'),
+                                  dtype)
+               for name, (dtype, _) in INDEX_ARRAYS.items()}
+    if preprocessed_dir is not None:
+        sentences = iter_preprocessed_sentences(preprocessed_dir)
+        frequencies = load_preprocessed_frequencies(preprocessed_dir)
+    else:
+        sentences = stream_sentences(corpus_files)
+        frequencies = calculate_frequency_dict([])
+    words = build_vocabulary_tables(tokenizer).words
+
+    for name in ('sentence_offsets', 'token_offsets', 'maskable_offsets'):
+        writers[name].write([0])
+
+    def write_batch(batch: List[str]) -> None:
+        if preprocessed_dir is None:
+            for sentence in batch:
+                frequencies.update(preprocess_text(sentence))
+
+        for prepared in prepare_sentences(tokenizer, batch, words):
+            writers['text'].write(np.frombuffer(
+                prepared.text.encode('utf-8'), dtype=np.uint8))
+            writers['token_ids'].write(prepared.token_ids)
+            writers['char_spans'].write(np.asarray(
+                prepared.offsets, dtype=np.int32).reshape(-1, 2).ravel())
+            writers['maskable'].write(prepared.maskable_positions)
+
+            writers['sentence_offsets'].write([writers['text'].count])
+            writers['token_offsets'].write([writers['token_ids'].count])
+            writers['maskable_offsets'].write([writers['maskable'].count])
+
+    batch = []
+    for sentence in sentences:
+        batch.append(sentence)
+        if len(batch) == batch_size:
+            write_batch(batch)
+            batch = []
+    if batch:
+        write_batch(batch)
+
+    for writer in writers.values():
+        writer.close()
+
+    num_sentences = writers['sentence_offsets'].count - 1
+    meta = {
+        'version': INDEX_VERSION,
+        'model_name': tokenizer.name_or_path,
+        'num_sentences': num_sentences,
+        'lengths': {name: writer.count for name, writer in writers.items()},
+    }
+    with open(os.path.join(index_dir, 'meta.json'), 'w',
+              encoding='utf-8') as file:
+        json.dump(meta, file, indent=2)
+
+    save_frequency_dict(frequencies, os.path.join(index_dir, FREQUENCY_FILE))
+    tables = build_vocabulary_tables(tokenizer, frequencies)
+    # Confidence scores of an earlier build no longer match the positions
+    for name in CONFIDENCE_ARRAYS:
+        path = os.path.join(index_dir, f'{name}.npy')
+        if os.path.isfile(path):
+            os.remove(path)
+    corpus_index = CorpusIndex(index_dir)
+    build_difficulty_index(corpus_index, tables)
+    build_word_index(corpus_index, len(tokenizer))
+
+    return num_sentences
+
+
+def _maskable_token_ids(corpus_index: 'CorpusIndex') \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Get the sentence, position and token id of every maskable position of an
+    index, in the order of `maskable`.
+    """
+    arrays = corpus_index.arrays
+    sentences = np.repeat(
+        np.arange(len(corpus_index), dtype=np.int32),
+        np.diff(arrays['maskable_offsets']))
+    positions = np.asarray(arrays['maskable'], dtype=np.int32)
+    # Look up the token of every position in one go
+    token_ids = arrays['token_ids'][
+        np.asarray(arrays['token_offsets'][:-1])[sentences] + positions]
+    return sentences, positions, np.asarray(token_ids)
+
+
+def build_difficulty_index(corpus_index: 'CorpusIndex',
+                           tables: VocabularyTables) -> None:
+    """
+    Score every maskable position of an index by the rarity of its token and
+    store the positions sorted by that difficulty.
+
+    Parameters
+    ----------
+    corpus_index : CorpusIndex
+        The index to add the difficulty arrays to.
+    tables : VocabularyTables
+        The vocabulary tables of the index's tokenizer, ranked by the word
+        frequencies of the corpus.
+    """
+    sentences, positions, token_ids = _maskable_token_ids(corpus_index)
+    difficulty = tables.rarity[token_ids].astype(np.float32)
+    _save_difficulty_index(corpus_index, difficulty, sentences, positions,
+                           {'source': 'rarity'})
+
+
+def build_word_index(corpus_index: 'CorpusIndex', vocab_size: int) -> None:
+    """
+    Store where every maskable token occurs, so a sentence containing a given
+    word can be drawn without scanning the corpus.
+
+    Parameters
+    ----------
+    corpus_index : CorpusIndex
+        The index to add the word arrays to.
+    vocab_size : int
+        The number of token ids of the index's tokenizer.
+    """
+    sentences, positions, token_ids = _maskable_token_ids(corpus_index)
+    order = np.argsort(token_ids, kind='stable')
+    word_offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(token_ids, minlength=vocab_size),
+              out=word_offsets[1:])
+
+    for name, array in zip(WORD_ARRAYS, (word_offsets, sentences[order],
+                                         positions[order])):
+        np.save(os.path.join(corpus_index.index_dir, f'{name}.npy'), array)
+    corpus_index.load_word_index()
+
+
+def build_confidence_index(corpus_index: 'CorpusIndex',
+                           model: 'ContextAwareTextModel',
+                           batch_size: int = 64) -> None:
+    """
+    Score every maskable position of an index by how hard the model finds it
+    to fill in, and store the positions sorted by that difficulty.
+
+    Every position is masked on its own and the copies are forwarded in
+    batches. The entropy of the predicted distribution and the rank of the
+    original token in it are stored per position; the difficulty is the
+    mean of their percentiles, spread evenly over the 0-1 range again. A
+    blank that the model fills in confidently and correctly is easy, one
+    where it is unsure or expects other words is hard.
+
+    Parameters
+    ----------
+    corpus_index : CorpusIndex
+        The index to add the difficulty arrays to.
+    model : ContextAwareTextModel
+        The model the index was built for.
+    batch_size : int, optional
+        The number of masked positions forwarded together, by default 64.
+    """
+    if model.model_name != corpus_index.model_name:
+        raise ValueError(f"The corpus index was built for "
+                         f"'{corpus_index.model_name}', not "
+                         f"'{model.model_name}'.")
+
+    sentences, positions, _ = _maskable_token_ids(corpus_index)
+    entropy = np.zeros(len(positions), dtype=np.float32)
+    rank = np.zeros(len(positions), dtype=np.int32)
+
+    for start in range(0, len(positions), batch_size):
+        end = min(start + batch_size, len(positions))
+        # The positions of a sentence are consecutive, so it is prepared once
+        # per batch
+        prepared = {}
+        for sentence_id in np.unique(sentences[start:end]).tolist():
+            prepared[sentence_id] = model.prepare_encoded(
+                corpus_index.sentence(sentence_id),
+                corpus_index.token_ids(sentence_id),
+                corpus_index.offsets(sentence_id),
+                corpus_index.maskable_positions(sentence_id))
+        entropy[start:end], rank[start:end] = model.position_confidence_batch(
+            [(prepared[sentence_id], position) for sentence_id, position
+             in zip(sentences[start:end].tolist(),
+                    positions[start:end].tolist())])
+
+    for name, array in zip(CONFIDENCE_ARRAYS, (entropy, rank)):
+        np.save(os.path.join(corpus_index.index_dir, f'{name}.npy'), array)
+
+    combined = (_percentiles(entropy) + _percentiles(rank)) / 2
+    _save_difficulty_index(corpus_index, _percentiles(combined), sentences,
+                           positions, {'source': 'confidence',
+                                       'model_name': model.model_name})
+
+
+def _percentiles(values: np.ndarray) -> np.ndarray:
+    """
+    Get the percentile of every value in the 0-1 range, with tied values
+    sharing their lowest percentile.
+    """
+    if len(values) < 2:
+        return np.zeros(len(values), dtype=np.float32)
+    ranks = np.searchsorted(np.sort(values), values, 'left')
+    return (ranks / (len(values) - 1)).astype(np.float32)
+
+
+def _save_difficulty_index(corpus_index: 'CorpusIndex',
+                           difficulty: np.ndarray, sentences: np.ndarray,
+                           positions: np.ndarray, source: Dict) -> None:
+    """
+    Sort the maskable positions of an index by difficulty, store them and
+    record how the difficulty was computed in the index metadata.
+    """
+    order = np.argsort(difficulty, kind='stable')
+    for name, array in zip(DIFFICULTY_ARRAYS,
+                           (difficulty, sentences, positions)):
+        np.save(os.path.join(corpus_index.index_dir, f'{name}.npy'),
+                array[order])
+
+    corpus_index.meta['difficulty'] = source
+    with open(os.path.join(corpus_index.index_dir, 'meta.json'), 'w',
+              encoding='utf-8') as file:
+        json.dump(corpus_index.meta, file, indent=2)
+    corpus_index.load_difficulty_index()
+
+
+class CorpusIndex:
+    def __init__(self, index_dir: str) -> None:
+        """
+        Open a corpus index built by `build_corpus_index`.
+
+        All arrays are memory-mapped, so opening an index takes constant time
+        and no text is read until a sentence is requested.
+
+        Parameters
+        ----------
+        index_dir : str
+            The directory containing the index.
+        """
+        with open(os.path.join(index_dir, 'meta.json'), 'r',
+                  encoding='utf-8') as file:
+            self.meta = json.load(file)
+
+        if self.meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"Corpus index in '{index_dir}' has version "
+                             f"{self.meta.get('version')}, expected "
+                             f"{INDEX_VERSION}. Please rebuild it.")
+
+        self.index_dir = index_dir
+        self.model_name: str = self.meta['model_name']
+        self.arrays: Dict[str, np.ndarray] = {}
+        for name, (dtype, shape) in INDEX_ARRAYS.items():
+            width = int(np.prod(shape, dtype=int))
+            length = self.meta['lengths'][name] // width
+            path = os.path.join(index_dir, f'{name}.bin')
+            if length == 0:
+                # np.memmap cannot map empty files
+                self.arrays[name] = np.zeros((0,) + shape, dtype=dtype)
+            else:
+                self.arrays[name] = np.memmap(path, dtype=dtype, mode='r',
+                                              shape=(length,) + shape)
+
+        self.difficulty: Optional[Dict[str, np.ndarray]] = None
+        self.load_difficulty_index()
+        self.words: Optional[Dict[str, np.ndarray]] = None
+        self.load_word_index()
+
+    def load_difficulty_index(self) -> None:
+        """
+        Memory-map the difficulty arrays, if they have been built.
+        """
+        paths = [os.path.join(self.index_dir, f'{name}.npy')
+                 for name in DIFFICULTY_ARRAYS]
+        if all(os.path.isfile(path) for path in paths):
+            self.difficulty = {name: np.load(path, mmap_mode='r')
+                               for name, path in zip(DIFFICULTY_ARRAYS, paths)}
+
+    def load_word_index(self) -> None:
+        """
+        Memory-map the word arrays, if they have been built.
+        """
+        paths = [os.path.join(self.index_dir, f'{name}.npy')
+                 for name in WORD_ARRAYS]
+        if all(os.path.isfile(path) for path in paths):
+            self.words = {name: np.load(path, mmap_mode='r')
+                          for name, path in zip(WORD_ARRAYS, paths)}
+
+    def __len__(self) -> int:
+        return self.meta['num_sentences']
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        """
+        Check whether a corpus index has been built in a directory.
+
+        Parameters
+        ----------
+        index_dir : str
+            The directory to check.
+
+        Returns
+        -------
+        bool
+            True if the directory contains an index, False otherwise.
+        """
+        return os.path.isfile(os.path.join(index_dir, 'meta.json'))
+
+    def _span(self, name: str, sentence_id: int) -> Tuple[int, int]:
+        offsets = self.arrays[name]
+        return int(offsets[sentence_id]), int(offsets[sentence_id + 1])
+
+    def sentence(self, sentence_id: int) -> str:
+        """
+        Get the text of a sentence.
+
+        Parameters
+        ----------
+        sentence_id : int
+            The index of the sentence.
+
+        Returns
+        -------
+        str
+            The sentence.
+        """
+        start, end = self._span('sentence_offsets', sentence_id)
+        return self.arrays['text'][start:end].tobytes().decode('utf-8')
+
+    def token_ids(self, sentence_id: int) -> np.ndarray:
+        """
+        Get the token ids of a sentence, without [CLS] and [SEP].
+
+        Parameters
+        ----------
+        sentence_id : int
+            The index of the sentence.
+
+        Returns
+        -------
+        np.ndarray
+            The token ids.
+        """
+        start, end = self._span('token_offsets', sentence_id)
+        return self.arrays['token_ids'][start:end]
+
+    def offsets(self, sentence_id: int) -> np.ndarray:
+        """
+        Get the character span of every token of a sentence.
+
+        Parameters
+        ----------
+        sentence_id : int
+            The index of the sentence.
+
+        Returns
+        -------
+        np.ndarray
+            An array of shape (tokens, 2) with the start and end of each
+            token.
+        """
+        start, end = self._span('token_offsets', sentence_id)
+        return self.arrays['char_spans'][start:end]
+
+    def maskable_positions(self, sentence_id: int) -> np.ndarray:
+        """
+        Get the indices of the tokens of a sentence that can be masked.
+
+        Parameters
+        ----------
+        sentence_id : int
+            The index of the sentence.
+
+        Returns
+        -------
+        np.ndarray
+            The maskable token indices.
+        """
+        start, end = self._span('maskable_offsets', sentence_id)
+        return self.arrays['maskable'][start:end]
+
+    def random_sentence_id(self) -> int:
+        """
+        Draw a random sentence from the index.
+
+        Returns
+        -------
+        int
+            The index of the sentence.
+        """
+        return random.randrange(len(self))
+
+    def frequencies(self) -> Counter:
+        """
+        Load the word frequencies of the corpus.
+
+        Returns
+        -------
+        Counter
+            Frequency dictionary of the lowercased corpus words.
+        """
+        return load_frequency_dict(os.path.join(self.index_dir,
+                                                FREQUENCY_FILE))
+
+    def sample_position(self, difficulty: float, spread: float = 0.1) \
+            -> Optional[Tuple[int, int]]:
+        """
+        Draw a sentence and the token to mask in it for a given difficulty.
+
+        The target difficulty is drawn from a Gaussian around `difficulty`
+        and looked up in the sorted difficulty index by binary search, so no
+        sentence has to be tokenized or retried.
+
+        Parameters
+        ----------
+        difficulty : float
+            The difficulty level as a float (higher means more difficult),
+            clamped to the 0-1 range.
+        spread : float, optional
+            The standard deviation of the drawn difficulty, by default 0.1.
+
+        Returns
+        -------
+        Optional[Tuple[int, int]]
+            The index of the sentence and the index of the token to mask, or
+            None if the index has no difficulty arrays or maskable tokens.
+        """
+        if self.difficulty is None or not len(self.difficulty['difficulty']):
+            return None
+
+        target = float(np.clip(np.random.normal(
+            loc=min(max(difficulty, 0.0), 1.0), scale=spread), 0.0, 1.0))
+        difficulties = self.difficulty['difficulty']
+        i = min(int(np.searchsorted(difficulties, target)),
+                len(difficulties) - 1)
+
+        # Many positions share a difficulty (e.g. every occurrence of "the"),
+        # so pick uniformly among all positions tied with the match
+        low = int(np.searchsorted(difficulties, difficulties[i], 'left'))
+        high = int(np.searchsorted(difficulties, difficulties[i], 'right'))
+        i = random.randrange(low, high)
+        return (int(self.difficulty['difficulty_sentences'][i]),
+                int(self.difficulty['difficulty_positions'][i]))
+
+    def sample_token(self, token_id: int) -> Optional[Tuple[int, int]]:
+        """
+        Draw a sentence containing a token and the position of the token in
+        it, e.g. to show a word that is due for review again.
+
+        The occurrences of the token are read from the word index, so the
+        lookup takes constant time.
+
+        Parameters
+        ----------
+        token_id : int
+            The id of the token.
+
+        Returns
+        -------
+        Optional[Tuple[int, int]]
+            The index of the sentence and the index of the token to mask, or
+            None if the index has no word arrays or the token is never
+            maskable in the corpus.
+        """
+        if self.words is None:
+            return None
+        word_offsets = self.words['word_offsets']
+        if not 0 <= token_id < len(word_offsets) - 1:
+            return None
+
+        low, high = int(word_offsets[token_id]), \
+            int(word_offsets[token_id + 1])
+        if low == high:
+            return None
+        i = random.randrange(low, high)
+        return (int(self.words['word_sentences'][i]),
+                int(self.words['word_positions'][i]))
@@ -1,6 +1,16 @@
+import json
+import os
+import random
 from collections import Counter
+import nltk.data
 from nltk.tokenize import word_tokenize
 
+# The word frequencies saved next to a corpus index or preprocessed corpus
+FREQUENCY_FILE = 'frequencies.json'
+
+# Loaded on first use by `_punkt_tokenizer`
+_PUNKT_TOKENIZER = None
+
 
 def load_corpus(filepath):
     """
@@ -20,6 +30,24 @@ def load_corpus(filepath):
         return file.read()
 
 
+def list_corpus_files(corpus_dir):
+    """
+    List the text files of a corpus directory.
+
+    Parameters
+    ----------
+    corpus_dir : str
+        The directory containing the corpus.
+
+    Returns
+    -------
+    list of str
+        Paths to the `.txt` files in the directory, in sorted order.
+    """
+    return sorted(os.path.join(corpus_dir, file)
+                  for file in os.listdir(corpus_dir) if file.endswith('.txt'))
+
+
 def preprocess_text(text):
     """
     Preprocess the text by converting to lowercase and tokenizing.
@@ -55,3 +83,192 @@ def calculate_frequency_dict(tokens):
         Frequency dictionary of tokens.
     """
     return Counter(tokens)
+
+
+def save_frequency_dict(frequency_dict, filepath):
+    """
+    Save a frequency dictionary as JSON, most frequent token first.
+
+    Parameters
+    ----------
+    frequency_dict : collections.Counter
+        Frequency dictionary of tokens.
+    filepath : str
+        Path to the JSON file to write.
+    """
+    with open(filepath, 'w', encoding='utf-8') as file:
+        json.dump(dict(frequency_dict.most_common()), file,
+                  ensure_ascii=False)
+
+
+def load_frequency_dict(filepath):
+    """
+    Load a frequency dictionary saved by `save_frequency_dict`.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the JSON file to read.
+
+    Returns
+    -------
+    collections.Counter
+        Frequency dictionary of tokens.
+    """
+    with open(filepath, 'r', encoding='utf-8') as file:
+        return Counter(json.load(file))
+
+
+def iter_corpus_chunks(filepath, chunk_size=1 << 20):
+    """
+    Read a text corpus file incrementally.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the text corpus file.
+    chunk_size : int, optional
+        The number of characters to read at a time, by default 1 MiB.
+
+    Yields
+    ------
+    str
+        Consecutive chunks of the file content.
+    """
+    with open(filepath, 'r', encoding='utf-8') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _punkt_tokenizer():
+    """
+    Get the sentence tokenizer `sent_tokenize` uses, once per process.
+    """
+    global _PUNKT_TOKENIZER
+    if _PUNKT_TOKENIZER is None:
+        _PUNKT_TOKENIZER = nltk.data.load('tokenizers/punkt/english.pickle')
+    return _PUNKT_TOKENIZER
+
+
+def stream_sentences(filepaths, chunk_size=1 << 20,
+                     max_sentence_length=1 << 20, tokenizer=None):
+    """
+    Split corpus files into sentences without loading them in full.
+
+    Each chunk is sentence-tokenized together with the raw text of the
+    unfinished sentence left over from the previous chunk, so sentences
+    spanning a chunk boundary come out as if the file had been tokenized
+    whole.
+
+    Parameters
+    ----------
+    filepaths : list of str
+        Paths to the text corpus files.
+    chunk_size : int, optional
+        The number of characters to read at a time, by default 1 MiB.
+    max_sentence_length : int, optional
+        The length above which an unfinished sentence is cut at its last
+        whitespace rather than carried further, by default 1 Mi characters.
+    tokenizer : nltk.tokenize.punkt.PunktSentenceTokenizer, optional
+        The sentence tokenizer, by default the one of `sent_tokenize`.
+
+    Yields
+    ------
+    str
+        The sentences of the corpus, in file order.
+    """
+    tokenizer = tokenizer or _punkt_tokenizer()
+    for filepath in filepaths:
+        remainder = ''
+        for chunk in iter_corpus_chunks(filepath, chunk_size):
+            text = remainder + chunk
+            spans = list(tokenizer.span_tokenize(text))
+            if not spans:
+                remainder = ''
+                continue
+
+            for start, end in spans[:-1]:
+                yield text[start:end]
+            # The last sentence may continue in the next chunk; keep its raw
+            # text, including trailing whitespace, to tokenize it again
+            remainder = text[spans[-1][0]:]
+            if len(remainder) > max_sentence_length:
+                # A sentence this long is unlikely to ever end, so flush it,
+                # but never in the middle of a word
+                cut = max(remainder.rfind(space)
+                          for space in (' ', '\n', '\t', '\r'))
+                if cut > 0:
+                    yield remainder[:cut].rstrip()
+                    remainder = remainder[cut:].lstrip()
+
+        yield from tokenizer.tokenize(remainder)
+
+
+def shuffle_buffered(items, buffer_size=10000):
+    """
+    Shuffle a stream of items using a fixed-size buffer.
+
+    Every incoming item replaces a random item of the buffer, which is yielded
+    instead. Memory use is bounded by `buffer_size`, no matter how long the
+    stream is.
+
+    Parameters
+    ----------
+    items : iterable
+        The items to shuffle.
+    buffer_size : int, optional
+        The number of items to keep in the buffer, by default 10000.
+
+    Yields
+    ------
+    object
+        The items in shuffled order.
+    """
+    buffer = []
+    for item in items:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+        index = random.randrange(buffer_size)
+        yield buffer[index]
+        buffer[index] = item
+
+    random.shuffle(buffer)
+    yield from buffer
+
+
+def sentence_stream(filepaths, buffer_size=10000, chunk_size=1 << 20,
+                    cycle=True):
+    """
+    Stream shuffled sentences from corpus files with bounded memory.
+
+    Parameters
+    ----------
+    filepaths : list of str
+        Paths to the text corpus files.
+    buffer_size : int, optional
+        The number of sentences in the shuffle buffer, by default 10000.
+    chunk_size : int, optional
+        The number of characters to read at a time, by default 1 MiB.
+    cycle : bool, optional
+        Whether to start a new, reshuffled pass over the corpus once it is
+        exhausted, by default True.
+
+    Yields
+    ------
+    str
+        Sentences of the corpus in shuffled order.
+    """
+    filepaths = list(filepaths)
+    while True:
+        found = False
+        for sentence in shuffle_buffered(
+                stream_sentences(filepaths, chunk_size), buffer_size):
+            found = True
+            yield sentence
+
+        if not cycle or not found:
+            return
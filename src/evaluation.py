@@ -0,0 +1,230 @@
+import os
+import random
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, \
+    Tuple, Union, TYPE_CHECKING
+
+import numpy as np
+
+from prepared_sentence import PreparedSentence
+
+if TYPE_CHECKING:
+    from context_aware_model import ContextAwareTextModel
+
+# The thresholds of provide_context_feedback, as fractions of the original
+# word's fitness
+FEEDBACK_THRESHOLDS = (0.9, 0.7, 0.5)
+
+# The average scores at which adjust_difficulty moves between easy, medium
+# and hard
+DIFFICULTY_THRESHOLDS = (0.6, 0.8)
+
+# A masked sentence waiting to be scored: the sentence number, the
+# difficulty, the masked sentence, the original word and its token, which is
+# normalized (e.g. lowercased) like the predictions
+_Masked = Tuple[int, float, PreparedSentence, str, str]
+
+
+def _mask_chunk(model: 'ContextAwareTextModel',
+                sentences: List[Union[str, PreparedSentence]],
+                first_id: int, difficulties: Sequence[float]) \
+        -> List[_Masked]:
+    """
+    Mask every sentence of a chunk once per difficulty, tokenizing the chunk
+    with a single call.
+    """
+    encoded = iter(model.prepare_batch(
+        [sentence for sentence in sentences if isinstance(sentence, str)]))
+    masked = []
+    for offset, sentence in enumerate(sentences):
+        prepared = next(encoded) if isinstance(sentence, str) else sentence
+        for difficulty in difficulties:
+            _, original_word, mask_index = model.mask_word(prepared,
+                                                           difficulty)
+            if mask_index == -1:
+                break
+            masked.append((first_id + offset, difficulty,
+                           model.mask_prepared(prepared, mask_index),
+                           original_word,
+                           model.tokenizer.convert_ids_to_tokens(
+                               prepared.token_ids[mask_index])))
+    return masked
+
+
+def _chunks(sentences: Iterable[Union[str, PreparedSentence]],
+            size: int, max_sentences: Optional[int]) \
+        -> Iterator[List[Union[str, PreparedSentence]]]:
+    chunk = []
+    for number, sentence in enumerate(sentences):
+        if max_sentences is not None and number >= max_sentences:
+            break
+        chunk.append(sentence)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def evaluate(model: 'ContextAwareTextModel',
+             sentences: Iterable[Union[str, PreparedSentence]],
+             difficulties: Sequence[float] = (0.0, 0.25, 0.5, 0.75, 1.0),
+             top_k: int = 10, batch_size: int = 64, sort_batches: int = 16,
+             max_sentences: Optional[int] = None,
+             seed: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    Run the masking and scoring pipeline of the game over a corpus without a
+    user, taking the model's own top predictions as simulated guesses.
+
+    Sentences are masked once per difficulty, collected into groups of
+    `batch_size * sort_batches` masked sentences and sorted by length, so
+    every batch holds sentences of similar length and little padding.
+
+    Parameters
+    ----------
+    model : ContextAwareTextModel
+        The context model used for masking and scoring.
+    sentences : Iterable[Union[str, PreparedSentence]]
+        The sentences to evaluate, raw or already tokenized.
+    difficulties : Sequence[float], optional
+        The difficulties to mask every sentence at, by default 0 to 1 in
+        steps of 0.25.
+    top_k : int, optional
+        The number of simulated guesses per masked sentence, by default 10.
+    batch_size : int, optional
+        The number of masked sentences per forward batch, by default 64.
+    sort_batches : int, optional
+        The number of batches sorted by length together, by default 16.
+    max_sentences : Optional[int], optional
+        The number of sentences to evaluate, by default all of them.
+    seed : Optional[int], optional
+        Seeds the choice of the masked words, by default unseeded.
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        One column per field, one row per masked sentence: `sentence_id`,
+        `difficulty`, `length` (tokens), `mask_index`, `original_word`,
+        `original_fitness`, `original_rank` (among the guesses, -1 if
+        absent), and the (rows, top_k) columns `guesses` and
+        `guess_fitness`. `sentences` and `seconds` hold the number of
+        evaluated sentences and the time taken.
+    """
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+
+    columns: Dict[str, list] = {
+        'sentence_id': [], 'difficulty': [], 'length': [], 'mask_index': [],
+        'original_word': [], 'original_fitness': [], 'original_rank': [],
+        'guesses': [], 'guess_fitness': []}
+    num_sentences = 0
+    start = time.perf_counter()
+
+    # Enough sentences to fill `sort_batches` batches once masked
+    chunk_size = max(batch_size * sort_batches // max(len(difficulties), 1),
+                     1)
+    for chunk in _chunks(sentences, chunk_size, max_sentences):
+        masked = _mask_chunk(model, chunk, num_sentences, difficulties)
+        num_sentences += len(chunk)
+        masked.sort(key=lambda item: len(item[2].input_ids))
+
+        for batch_start in range(0, len(masked), batch_size):
+            batch = masked[batch_start:batch_start + batch_size]
+            all_top_words = model.get_top_predictions_batch(
+                [prepared for _, _, prepared, _, _ in batch], top_k)
+            all_scores = model.score_batch([
+                (prepared, [prepared.original_token_id] + top_words,
+                 prepared.mask_index)
+                for (_, _, prepared, _, _), top_words
+                in zip(batch, all_top_words)])
+
+            for (sentence_id, difficulty, prepared, original_word,
+                 original_token), top_words, scores in zip(
+                    batch, all_top_words, all_scores):
+                columns['sentence_id'].append(sentence_id)
+                columns['difficulty'].append(difficulty)
+                columns['length'].append(len(prepared.token_ids))
+                columns['mask_index'].append(prepared.mask_index)
+                columns['original_word'].append(original_word)
+                columns['original_fitness'].append(scores[0])
+                columns['original_rank'].append(
+                    top_words.index(original_token)
+                    if original_token in top_words else -1)
+                # Pad the rare sentences with fewer than top_k predictions
+                padding = top_k - len(top_words)
+                columns['guesses'].append(top_words + [''] * padding)
+                columns['guess_fitness'].append(scores[1:] +
+                                                [np.nan] * padding)
+
+    return {
+        'sentence_id': np.array(columns['sentence_id'], dtype=np.int64),
+        'difficulty': np.array(columns['difficulty'], dtype=np.float32),
+        'length': np.array(columns['length'], dtype=np.int32),
+        'mask_index': np.array(columns['mask_index'], dtype=np.int32),
+        'original_word': np.array(columns['original_word'], dtype=str),
+        'original_fitness': np.array(columns['original_fitness'],
+                                     dtype=np.float32),
+        'original_rank': np.array(columns['original_rank'], dtype=np.int16),
+        'guesses': np.array(columns['guesses'], dtype=str).reshape(-1, top_k),
+        'guess_fitness': np.array(columns['guess_fitness'],
+                                  dtype=np.float32).reshape(-1, top_k),
+        'sentences': np.array(num_sentences),
+        'seconds': np.array(time.perf_counter() - start)}
+
+
+def save_results(results: Dict[str, np.ndarray], path: str) -> None:
+    """
+    Write evaluation results to a compressed .npz file, one array per
+    column, readable with `np.load` without pickling.
+
+    Parameters
+    ----------
+    results : Dict[str, np.ndarray]
+        The columns returned by `evaluate`.
+    path : str
+        The file to write.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    np.savez_compressed(path, **results)
+
+
+def print_summary(results: Dict[str, np.ndarray]) -> None:
+    """
+    Print the throughput and, per difficulty, how the simulated guesses fall
+    into the bands of the feedback and difficulty thresholds.
+
+    Parameters
+    ----------
+    results : Dict[str, np.ndarray]
+        The columns returned by `evaluate`.
+    """
+    sentences = int(results['sentences'])
+    seconds = float(results['seconds'])
+    rows = len(results['difficulty'])
+    print(f"Evaluated {sentences} sentences ({rows} masked) in "
+          f"{seconds:.1f} s: {sentences / max(seconds, 1e-9):.1f} "
+          f"sentences/s, {rows / max(seconds, 1e-9):.1f} masked/s")
+
+    # The share of guesses above each feedback threshold, and of top-1
+    # guesses in each difficulty band
+    low, high = DIFFICULTY_THRESHOLDS
+    print(f"{'difficulty':>10}{'rows':>8}{'orig':>7}" +
+          ''.join(f"{f'>{t}':>7}" for t in FEEDBACK_THRESHOLDS) +
+          f"{f'<{low}':>7}{f'>{high}':>7}")
+    for difficulty in np.unique(results['difficulty']):
+        selected = results['difficulty'] == difficulty
+        original = results['original_fitness'][selected]
+        guesses = results['guess_fitness'][selected]
+        valid = ~np.isnan(guesses)
+        shares = [(guesses[valid] > threshold *
+                   np.broadcast_to(original[:, None], guesses.shape)[valid])
+                  .mean() if valid.any() else np.nan
+                  for threshold in FEEDBACK_THRESHOLDS]
+        top = guesses[:, 0] if guesses.shape[1] else np.array([np.nan])
+        print(f"{difficulty:>10.2f}{int(selected.sum()):>8}"
+              f"{original.mean():>7.3f}" +
+              ''.join(f"{share:>7.1%}" for share in shares) +
+              f"{np.mean(top < low):>7.1%}{np.mean(top > high):>7.1%}")
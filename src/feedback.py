@@ -1,7 +1,13 @@
-from typing import List, Tuple
-from context_aware_model import ContextAwareTextModel
+from typing import List, Tuple, TYPE_CHECKING
+from instrumentation import timed
 
+if TYPE_CHECKING:
+    from context_aware_model import ContextAwareTextModel
+    from similarity import SimilarityScorer
+    from translation import CachedTranslator
 
+
+@timed("feedback")
 def provide_context_feedback(
     user_guess: str,
     original_word: str,
@@ -9,7 +15,7 @@ def provide_context_feedback(
     original_fitness: float,
     top_words: List[Tuple[str, float]],
     masked_sentence: str,
-    context_model: ContextAwareTextModel
+    context_model: 'ContextAwareTextModel'
 ) -> str:
     """
     Provide feedback on the user's guess in terms of contextual fitness using
@@ -82,41 +88,88 @@ def provide_context_feedback(
     return feedback
 
 
+@timed("similarity")
+def provide_similarity_feedback(
+    user_guess: str,
+    original_word: str,
+    scorer: 'SimilarityScorer',
+    top_k: int = 5
+) -> str:
+    """
+    Describe how close the user's guess is in meaning to the original word,
+    and which words are closest to the guess.
+
+    Parameters
+    ----------
+    user_guess : str
+        The word guessed by the user.
+    original_word : str
+        The actual word that was masked in the sentence.
+    scorer : SimilarityScorer
+        The scorer holding the vocabulary embeddings.
+    top_k : int, optional
+        The number of closest words to list, by default 5.
+
+    Returns
+    -------
+    str
+        The similarity feedback.
+    """
+    similarity = scorer.similarity(user_guess, original_word)
+    feedback = (f"Semantic similarity to '{original_word}': "
+                f"{similarity:.2f}\n")
+
+    closest = scorer.closest_words(user_guess, top_k)
+    if closest:
+        feedback += "Words closest in meaning to your guess: " + ", ".join(
+            f"{word} ({score:.2f})" for word, score in closest) + "\n"
+    return feedback
+
+
+@timed("translation")
 def provide_translations(
     original_sentence: str,
     user_sentence: str,
     language_code: str,
-    translator
+    translator: 'CachedTranslator'
 ) -> str:
     """
-    Translate a sentence to a specified language.
+    Translate the original and the user's sentence to English.
 
     Parameters
     ----------
-    sentence : str
-        The sentence to be translated.
+    original_sentence : str
+        The original sentence.
+    user_sentence : str
+        The sentence with the user's guess in place of the masked word.
     language_code : str
-        The language code for the target language.
-    translator : object
-        The translator object used for translation.
+        The language code of the sentences.
+    translator : CachedTranslator
+        The translator used for translation. Both sentences are translated in
+        one call, so cache misses are requested concurrently.
 
     Returns
     -------
     str
-        The translated sentence.
+        The translated sentences.
     """
 
     if language_code == 'en':
         return "Cannot translate to English."
 
-    original_translation = translator.translate(
-        original_sentence, src=language_code, dest='en').text
-    user_translation = translator.translate(
-        user_sentence, src=language_code, dest='en').text
+    # Only translate the user's sentence if it differs from the original
+    sentences = [original_sentence]
+    if original_sentence != user_sentence:
+        sentences.append(user_sentence)
+    translations = [
+        translation if translation is not None
+        else "(translation unavailable)"
+        for translation in translator.translate_many(
+            sentences, src=language_code, dest='en')]
 
-    ret_str = f"Original Sentence (translated): {original_translation}"
+    ret_str = f"Original Sentence (translated): {translations[0]}"
 
     if original_sentence != user_sentence:
-        ret_str += f"\nYour Sentence (translated): {user_translation}\n"
+        ret_str += f"\nYour Sentence (translated): {translations[1]}\n"
 
     return ret_str
@@ -0,0 +1,355 @@
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+# Instrumentation is off unless enabled; every hook then costs a single
+# global lookup
+_enabled = False
+# Set while a sampled round is being profiled
+_profile_path: Optional[str] = None
+# Marks the threads that are running a profiler already
+_profiling = threading.local()
+# Since Python 3.12 only one cProfile profiler can be active per process, so
+# a block is only profiled if no other thread is being profiled
+_EXCLUSIVE_PROFILER = sys.version_info >= (3, 12)
+_profiler_lock = threading.Lock()
+
+
+class _NullTimer:
+    """
+    The timer handed out while instrumentation is disabled.
+    """
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    def __init__(self) -> None:
+        """
+        Thread-safe totals of named timers and counters.
+        """
+        self._lock = threading.Lock()
+        self.timers: Dict[str, list] = {}
+        self.counters: Dict[str, float] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+        Add a duration to a named timer.
+
+        Parameters
+        ----------
+        name : str
+            The name of the timed stage.
+        seconds : float
+            The duration, in seconds.
+        """
+        with self._lock:
+            stats = self.timers.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+    def add(self, name: str, value: float = 1) -> None:
+        """
+        Increase a named counter.
+
+        Parameters
+        ----------
+        name : str
+            The name of the counter.
+        value : float, optional
+            The amount to add, by default 1.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get a copy of all timers and counters.
+
+        Returns
+        -------
+        Dict[str, Dict[str, Any]]
+            The call count, total and maximum seconds of every timer, and the
+            value of every counter.
+        """
+        with self._lock:
+            return {
+                'timers': {name: {'count': count, 'seconds': total,
+                                  'max_seconds': longest}
+                           for name, (count, total, longest)
+                           in self.timers.items()},
+                'counters': dict(self.counters),
+            }
+
+    def reset(self) -> None:
+        """
+        Clear all timers and counters.
+        """
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+
+
+metrics = Metrics()
+
+
+class _Timer:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+def enable() -> None:
+    """
+    Start recording timers and counters.
+    """
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    """
+    Stop recording timers and counters. The totals recorded so far are kept.
+    """
+    global _enabled
+    _enabled = False
+
+
+def timer(name: str):
+    """
+    Time the enclosed block as a named stage.
+
+    Parameters
+    ----------
+    name : str
+        The name of the stage.
+
+    Examples
+    --------
+    >>> with timer("forward"):
+    ...     logits = model(**inputs).logits
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name)
+
+
+def timed(name: str) -> Callable:
+    """
+    Decorate a function to time every call as a named stage.
+
+    Parameters
+    ----------
+    name : str
+        The name of the stage.
+    """
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, value: float = 1) -> None:
+    """
+    Increase a named counter.
+
+    Parameters
+    ----------
+    name : str
+        The name of the counter.
+    value : float, optional
+        The amount to add, by default 1.
+    """
+    if _enabled:
+        metrics.add(name, value)
+
+
+@contextmanager
+def profiled(name: str) -> Iterator[None]:
+    """
+    Run the enclosed block under cProfile if a sampled round is being
+    profiled, writing the statistics next to the round's own profile.
+
+    cProfile only sees the thread it runs in, so work done in background
+    threads (e.g. preparing the next round) is wrapped separately. On Python
+    3.12 and later, a block that starts while another thread is being
+    profiled runs unprofiled, as does one that starts while another
+    profiling tool (e.g. a debugger) is active.
+
+    Parameters
+    ----------
+    name : str
+        The name of the profiled section, used in the file name.
+    """
+    path = _profile_path
+    if path is None or getattr(_profiling, 'active', False):
+        yield
+        return
+
+    if _EXCLUSIVE_PROFILER and not _profiler_lock.acquire(blocking=False):
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    enabled = False
+    _profiling.active = True
+    try:
+        try:
+            profiler.enable()
+            enabled = True
+        except ValueError:
+            # Another profiling tool is already active
+            pass
+        yield
+    finally:
+        if enabled:
+            profiler.disable()
+        _profiling.active = False
+        if _EXCLUSIVE_PROFILER:
+            _profiler_lock.release()
+        if enabled:
+            profiler.dump_stats(f"{path}-{name}.prof")
+
+
+def to_prometheus(snapshot: Dict[str, Dict[str, Any]],
+                  prefix: str = 'learn_like_an_llm') -> str:
+    """
+    Format a metrics snapshot in the Prometheus text exposition format.
+
+    Parameters
+    ----------
+    snapshot : Dict[str, Dict[str, Any]]
+        The snapshot, see `Metrics.snapshot`.
+    prefix : str, optional
+        The prefix of every metric name, by default 'learn_like_an_llm'.
+
+    Returns
+    -------
+    str
+        The metrics as text.
+    """
+    lines = [f"# HELP {prefix}_stage_seconds Time spent per stage.",
+             f"# TYPE {prefix}_stage_seconds summary"]
+    for name, stats in sorted(snapshot['timers'].items()):
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} '
+                     f"{stats['seconds']:.6f}")
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} '
+                     f"{stats['count']}")
+    for name, value in sorted(snapshot['counters'].items()):
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        lines.append(f"{prefix}_{name}_total {value}")
+    return "\n".join(lines) + "\n"
+
+
+class RoundRecorder:
+    def __init__(self, jsonl_path: Optional[str] = None,
+                 prometheus_path: Optional[str] = None,
+                 profile_every: int = 0,
+                 profile_dir: str = 'data/profiles') -> None:
+        """
+        Export the timers and counters of every game round, and profile a
+        sample of rounds.
+
+        Every round's record holds what was recorded between its start and
+        end. As the next round is prefetched in the background, a round's
+        forward passes include those of preparing its successor.
+
+        Parameters
+        ----------
+        jsonl_path : Optional[str], optional
+            A file to append one JSON record per round to, by default None.
+        prometheus_path : Optional[str], optional
+            A file to rewrite with the running totals in the Prometheus text
+            format after every round, by default None.
+        profile_every : int, optional
+            Profile every n-th round with cProfile, by default 0 (never).
+        profile_dir : str, optional
+            The directory to write the profiles to, by default
+            'data/profiles'.
+        """
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.profile_every = profile_every
+        self.profile_dir = profile_dir
+        self.rounds = 0
+        for path in (jsonl_path, prometheus_path):
+            if path and os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+        if profile_every:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    @contextmanager
+    def round(self) -> Iterator[None]:
+        """
+        Record the enclosed block as one game round.
+        """
+        global _profile_path
+
+        self.rounds += 1
+        before = metrics.snapshot()
+        start = time.perf_counter()
+        sampled = bool(self.profile_every) and \
+            self.rounds % self.profile_every == 0
+        if sampled:
+            _profile_path = os.path.join(self.profile_dir,
+                                         f"round-{self.rounds}")
+        try:
+            with profiled("main"):
+                yield
+        finally:
+            _profile_path = None
+            self._export(before, time.perf_counter() - start)
+
+    def _export(self, before: Dict[str, Dict[str, Any]],
+                seconds: float) -> None:
+        after = metrics.snapshot()
+        if self.jsonl_path:
+            timers = {}
+            for name, stats in after['timers'].items():
+                previous = before['timers'].get(name, {'count': 0,
+                                                       'seconds': 0.0})
+                if stats['count'] > previous['count']:
+                    timers[name] = stats['seconds'] - previous['seconds']
+            counters = {
+                name: value - before['counters'].get(name, 0)
+                for name, value in after['counters'].items()
+                if value != before['counters'].get(name, 0)}
+            record = {'round': self.rounds, 'time': time.time(),
+                      'seconds': seconds, 'stages': timers,
+                      'counters': counters}
+            with open(self.jsonl_path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(record) + "\n")
+
+        if self.prometheus_path:
+            # Write a temporary file first, so scrapers never see a
+            # partially written one
+            temporary = f"{self.prometheus_path}.tmp"
+            with open(temporary, 'w', encoding='utf-8') as file:
+                file.write(to_prometheus(after))
+            os.replace(temporary, self.prometheus_path)
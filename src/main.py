@@ -1,22 +1,385 @@
-import random
-import nltk
+import argparse
+import asyncio
 import os
-from data_processing import load_corpus
-from user import UserProfile, schedule_review, adjust_difficulty
-from feedback import provide_context_feedback, provide_translations
-from context_aware_model import ContextAwareTextModel
-from googletrans import Translator
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from data_processing import calculate_frequency_dict, list_corpus_files, \
+    preprocess_text, sentence_stream, stream_sentences
+from user import ProfileStore, schedule_review, adjust_difficulty
+from feedback import provide_context_feedback, \
+    provide_similarity_feedback, provide_translations
+from model_options import BACKENDS, DEFAULT_MODEL_NAME, LANGUAGE_CODES, \
+    LANGUAGE_MODELS, SCORING_MODES
+from model_registry import ModelRegistry, model_name_for
+from preprocessing import is_preprocessed, load_preprocessed_frequencies, \
+    preprocess_corpus, report_scaling
+from corpus_index import CorpusIndex, build_confidence_index, \
+    build_corpus_index
+from round_store import RoundStore, precompute_rounds, store_key
+from rounds import RoundEngine
+from similarity import SimilarityScorer, build_vocabulary_embeddings
+import instrumentation
+from startup import BackgroundModelLoader, StartupTimer
+from translation import CachedTranslator, GoogleTranslatorBackend, \
+    StubTranslatorBackend
+from vocabulary import VOCABULARY_DIR
 
 
-def main():
+def language_models(args: argparse.Namespace) -> Dict[str, str]:
+    """
+    Get the model name of every language code that has its own model, which
+    is none unless `--per-language-models` is given without `--model-name`.
+    """
+    if args.per_language_models and not args.model_name:
+        return LANGUAGE_MODELS
+    return {}
+
+
+def resolve_model_name(args: argparse.Namespace, language: str) -> str:
+    """
+    Get the model name to use for a language, see `language_models`.
+    """
+    return model_name_for(language, language_models(args),
+                          args.model_name or DEFAULT_MODEL_NAME)
+
+
+def build_index(args: argparse.Namespace) -> None:
+    """
+    Build the memory-mapped corpus index for a language.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments.
+    """
+    from transformers import AutoTokenizer
+
+    corpus_dir = f'data/corpus/{args.language}'
+    if not os.path.isdir(corpus_dir):
+        print(f"No corpus found for language '{args.language}'. Please make "
+              f"sure the directory '{corpus_dir}' exists.")
+        return
+
+    # Reuse the sentences and frequencies of the parallel preprocess command
+    corpus_files = list_corpus_files(corpus_dir)
+    preprocessed_dir = f'data/preprocessed/{args.language}'
+    if not is_preprocessed(preprocessed_dir, corpus_files):
+        preprocessed_dir = None
+
+    index_dir = f'data/index/{args.language}'
+    tokenizer = AutoTokenizer.from_pretrained(
+        resolve_model_name(args, args.language))
+    num_sentences = build_corpus_index(
+        corpus_files, index_dir, tokenizer,
+        preprocessed_dir=preprocessed_dir)
+    print(f"Indexed {num_sentences} sentences in '{index_dir}'.")
+
+
+def build_difficulty(args: argparse.Namespace) -> None:
+    """
+    Rate the maskable positions of a language's corpus index by how
+    confidently the model fills them in.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments.
+    """
+    from context_aware_model import ContextAwareTextModel
+
+    index_dir = f'data/index/{args.language}'
+    if not CorpusIndex.exists(index_dir):
+        print(f"No corpus index found for language '{args.language}'. "
+              f"Please run build-index first.")
+        return
+
+    corpus_index = CorpusIndex(index_dir)
+    model = ContextAwareTextModel(corpus_index.model_name,
+                                  context_window=args.context_window,
+                                  vocabulary_dir=VOCABULARY_DIR)
+    start = time.perf_counter()
+    build_confidence_index(corpus_index, model, batch_size=args.batch_size)
+    print(f"Rated {len(corpus_index.difficulty['difficulty'])} positions in "
+          f"{time.perf_counter() - start:.1f}s.")
+
+
+def preprocess(args: argparse.Namespace) -> None:
+    """
+    Split a language's corpus into sentence and token shards and count its
+    word frequencies, using all cores.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments.
+    """
+    corpus_dir = f'data/corpus/{args.language}'
+    if not os.path.isdir(corpus_dir):
+        print(f"No corpus found for language '{args.language}'. Please make "
+              f"sure the directory '{corpus_dir}' exists.")
+        return
+
+    corpus_files = list_corpus_files(corpus_dir)
+    output_dir = f'data/preprocessed/{args.language}'
+    chunk_bytes = int(args.chunk_mb * (1 << 20))
+    if args.scaling:
+        report_scaling(corpus_files, output_dir, args.workers, chunk_bytes)
+        return
+
+    stats = preprocess_corpus(corpus_files, output_dir, args.workers,
+                              chunk_bytes)
+    print(f"Preprocessed {stats['sentences']} sentences in "
+          f"{stats['chunks']} chunks ({stats['words']} distinct words) in "
+          f"{stats['seconds']:.1f}s to '{output_dir}'.")
+
+
+def build_embeddings(args: argparse.Namespace) -> None:
+    """
+    Embed the vocabulary of a language's corpus for similarity feedback.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments.
+    """
+    corpus_dir = f'data/corpus/{args.language}'
+    if not os.path.isdir(corpus_dir):
+        print(f"No corpus found for language '{args.language}'. Please make "
+              f"sure the directory '{corpus_dir}' exists.")
+        return
+
+    # Reuse the word frequencies counted while building the corpus index or
+    # preprocessing the corpus
+    index_dir = f'data/index/{args.language}'
+    preprocessed_dir = f'data/preprocessed/{args.language}'
+    if CorpusIndex.exists(index_dir):
+        frequencies = CorpusIndex(index_dir).frequencies()
+    elif is_preprocessed(preprocessed_dir, list_corpus_files(corpus_dir)):
+        frequencies = load_preprocessed_frequencies(preprocessed_dir)
+    else:
+        frequencies = calculate_frequency_dict([])
+        for sentence in stream_sentences(list_corpus_files(corpus_dir)):
+            frequencies.update(preprocess_text(sentence))
+
+    embedding_dir = f'data/embeddings/{args.language}'
+    num_words = build_vocabulary_embeddings(
+        frequencies, embedding_dir, max_words=args.max_words)
+    print(f"Embedded {num_words} words in '{embedding_dir}'.")
+
+
+def evaluate_corpus(args: argparse.Namespace) -> None:
+    """
+    Mask and score a language's corpus without a user, simulating guesses
+    from the model's top predictions, and write the fitness distributions.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments.
+    """
+    from context_aware_model import ContextAwareTextModel
+    from evaluation import evaluate, print_summary, save_results
+
+    corpus_dir = f'data/corpus/{args.language}'
+    if not os.path.isdir(corpus_dir):
+        print(f"No corpus found for language '{args.language}'. Please make "
+              f"sure the directory '{corpus_dir}' exists.")
+        return
+
+    model_name = resolve_model_name(args, args.language)
+    model = ContextAwareTextModel(model_name, scoring=args.scoring,
+                                  backend=args.backend,
+                                  context_window=args.context_window,
+                                  vocabulary_dir=VOCABULARY_DIR)
+
+    # Read the corpus once, in order; the index is already tokenized
+    index_dir = f'data/index/{args.language}'
+    corpus_index = CorpusIndex(index_dir) \
+        if CorpusIndex.exists(index_dir) else None
+    if corpus_index is not None and corpus_index.model_name == model_name:
+        sentences = (model.prepare_encoded(
+            corpus_index.sentence(i), corpus_index.token_ids(i),
+            corpus_index.offsets(i), corpus_index.maskable_positions(i))
+            for i in range(len(corpus_index)))
+    else:
+        sentences = stream_sentences(list_corpus_files(corpus_dir))
+
+    model.warm_up()
+    results = evaluate(model, sentences, args.difficulties, args.top_k,
+                       args.batch_size, max_sentences=args.sentences,
+                       seed=args.seed)
+    output = args.output or f'data/evaluation/{args.language}.npz'
+    save_results(results, output)
+    print_summary(results)
+    print(f"Wrote the results to '{output}'.")
+
+
+def precompute(args: argparse.Namespace) -> None:
+    """
+    Compute round bundles for a language's corpus offline, so the game only
+    has to score the user's guesses.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments.
+    """
+    from context_aware_model import ContextAwareTextModel
+
+    corpus_dir = f'data/corpus/{args.language}'
+    if not os.path.isdir(corpus_dir):
+        print(f"No corpus found for language '{args.language}'. Please make "
+              f"sure the directory '{corpus_dir}' exists.")
+        return
+
+    model_name = resolve_model_name(args, args.language)
+    model = ContextAwareTextModel(model_name, scoring=args.scoring,
+                                  backend=args.backend,
+                                  context_window=args.context_window,
+                                  vocabulary_dir=VOCABULARY_DIR)
+    corpus_index, sentences = open_sentence_source(
+        args.language, list_corpus_files(corpus_dir), model_name)
+
+    store_path = f'data/rounds/{args.language}.sqlite'
+    store = RoundStore(store_path)
+    count = precompute_rounds(model, store, args.rounds,
+                              corpus_index=corpus_index, sentences=sentences)
+    store.close()
+    print(f"Stored {count} rounds in '{store_path}'.")
+
+
+def open_round_store(language: str, model) -> Optional[RoundStore]:
+    """
+    Open the precomputed rounds of a language, if they were computed for the
+    model and its settings.
+
+    Parameters
+    ----------
+    language : str
+        The corpus directory name under data/corpus and data/rounds.
+    model : ContextAwareTextModel
+        The model that will play the rounds.
+
+    Returns
+    -------
+    Optional[RoundStore]
+        The store, or None if there is none or it is out of date.
     """
-    Main function to run the word masking and guessing game.
+    store_path = f'data/rounds/{language}.sqlite'
+    if not os.path.isfile(store_path):
+        return None
+    store = RoundStore(store_path)
+    if store.is_valid(store_key(model)):
+        return store
+    print(f"The precomputed rounds in '{store_path}' were computed for "
+          f"another model or settings. Ignoring them.")
+    store.close()
+    return None
+
+
+def open_sentence_source(language: str, corpus_files: List[str],
+                         model_name: str) \
+        -> Tuple[Optional[CorpusIndex], Optional[Iterator[str]]]:
+    """
+    Open the sentences of a language's corpus.
+
+    The prebuilt index, which opens instantly and is already tokenized, is
+    preferred over streaming the raw corpus files.
+
+    Parameters
+    ----------
+    language : str
+        The corpus directory name under data/corpus and data/index.
+    corpus_files : List[str]
+        Paths to the text corpus files.
+    model_name : str
+        The name of the model that will play with the sentences.
+
+    Returns
+    -------
+    Tuple[Optional[CorpusIndex], Optional[Iterator[str]]]
+        Either the corpus index or a stream of shuffled sentences.
+    """
+    index_dir = f'data/index/{language}'
+    if CorpusIndex.exists(index_dir):
+        corpus_index = CorpusIndex(index_dir)
+        if corpus_index.model_name == model_name:
+            return corpus_index, None
+        print(f"The corpus index in '{index_dir}' was built for "
+              f"'{corpus_index.model_name}'. Ignoring it.")
+
+    return None, sentence_stream(corpus_files)
+
+
+def serve(args: argparse.Namespace) -> None:
+    """
+    Host the game for many concurrent sessions over JSON-lines TCP.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments.
+    """
+    from server import GameServer
+
+    for language in args.language:
+        corpus_dir = f'data/corpus/{language}'
+        if not os.path.isdir(corpus_dir):
+            print(f"No corpus found for language '{language}'. Please make "
+                  f"sure the directory '{corpus_dir}' exists.")
+            return
+
+    def open_engine(language: str, model) -> RoundEngine:
+        corpus_index, sentences = open_sentence_source(
+            language, list_corpus_files(f'data/corpus/{language}'),
+            model.model_name)
+        return RoundEngine(model, corpus_index=corpus_index,
+                           sentences=sentences,
+                           round_store=open_round_store(language, model))
+
+    registry = ModelRegistry(
+        language_models(args), args.model_name or DEFAULT_MODEL_NAME,
+        memory_budget_mb=args.memory_budget_mb, scoring=args.scoring,
+        backend=args.backend, context_window=args.context_window,
+        vocabulary_dir=VOCABULARY_DIR)
+    server = GameServer(registry, open_engine, args.language,
+                        max_batch_size=args.max_batch_size,
+                        max_wait=args.max_wait_ms / 1000,
+                        workers=args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+def play(args: argparse.Namespace) -> None:
+    """
+    Run the word masking and guessing game.
 
     This function loads and preprocesses a text corpus based on the chosen
     language, calculates the word frequency dictionary, builds an n-gram model,
     processes sentences, and facilitates a word guessing game with the user.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments.
     """
-    language_code = {'english': 'en', 'spanish': 'es', 'french': 'fr'}
+    def start_loader(model_name: str) -> BackgroundModelLoader:
+        return BackgroundModelLoader(timer, model_name=model_name,
+                                     scoring=args.scoring,
+                                     backend=args.backend,
+                                     context_window=args.context_window,
+                                     vocabulary_dir=VOCABULARY_DIR)
+
+    # Start loading the model right away, so it overlaps with the language
+    # prompt and opening the corpus. Per-language models can only be loaded
+    # once the language is known.
+    timer = StartupTimer()
+    loader = None
+    if not language_models(args):
+        loader = start_loader(args.model_name or DEFAULT_MODEL_NAME)
+
     language = input("Choose a language (e.g., 'english', 'spanish', "
                      "'french'): ").strip().lower()
     corpus_dir = f'data/corpus/{language}'
@@ -25,95 +388,358 @@ def main():
               f"the directory '{corpus_dir}' exists.")
         return
 
-    corpus_files = [os.path.join(corpus_dir, file) for file in os.listdir(
-        corpus_dir) if file.endswith('.txt')]
+    corpus_files = list_corpus_files(corpus_dir)
     if not corpus_files:
         print(f"No corpus files found in '{corpus_dir}'. Please add text "
               "files to this directory.")
         return
 
-    # Initialize translator
-    translator = Translator()
-    language_code = language_code.get(language, 'auto')
+    model_name = resolve_model_name(args, language)
+    if loader is None:
+        loader = start_loader(model_name)
+
+    language_code = LANGUAGE_CODES.get(language, 'auto')
+    translator = None
+    if language_code != 'en':
+        backend = StubTranslatorBackend() if args.translator == 'stub' \
+            else GoogleTranslatorBackend()
+        translator = CachedTranslator(backend)
+
+    # Load the user profile, including the words still to be reviewed
+    profile_store = ProfileStore()
+    user_profile = profile_store.load(args.profile)
 
-    # Initialize user profile
-    user_profile = UserProfile()
+    with timer.phase("corpus"):
+        corpus_index, sentences = open_sentence_source(
+            language, corpus_files, model_name)
 
-    corpus = ''
-    for file in corpus_files:
-        corpus += load_corpus(file) + ' '
+    # Similarity feedback is only given once the embeddings have been built
+    scorer = None
+    if SimilarityScorer.exists(f'data/embeddings/{language}'):
+        scorer = SimilarityScorer(f'data/embeddings/{language}')
 
-    sentences = nltk.sent_tokenize(corpus)
-    random.shuffle(sentences)
+    model = loader.result()
+    engine = RoundEngine(model, corpus_index=corpus_index,
+                         sentences=sentences,
+                         round_store=open_round_store(language, model))
 
-    model = ContextAwareTextModel()
+    # Per-stage timers and counters are only recorded when exported
+    if args.metrics_jsonl or args.metrics_prometheus:
+        instrumentation.enable()
+    recorder = instrumentation.RoundRecorder(
+        args.metrics_jsonl, args.metrics_prometheus,
+        profile_every=args.cprofile_every, profile_dir=args.cprofile_dir)
 
+    first_round = True
     while True:
-        sentence = sentences.pop(0)
-
-        masked_sentence, original_word, mask_index = model.mask_word(
-            sentence, user_profile.get_average_score())
-        if mask_index == -1:
-            print("Couldn't find a suitable word to mask in this sentence. "
-                  "Skipping...")
-            continue
-        print("\nMasked Sentence: ", masked_sentence)
-        user_guess = input("Guess the missing word: ").strip().lower()
-        user_sentence = masked_sentence.replace('[MASK]', user_guess)
-
-        perplexity_masked, perplexity_user = model.calculate_perplexity(
-            masked_sentence, user_guess, mask_index)
-        user_fitness = model.calculate_fitness_score(
-            perplexity_masked, perplexity_user)
-
-        _, perplexity_original = model.calculate_perplexity(
-            masked_sentence, original_word, mask_index)
-        original_fitness = model.calculate_fitness_score(
-            perplexity_masked, perplexity_original)
-
-        top_words_with_fitness = []
-        for word in model.get_top_predictions(masked_sentence):
-            _, perplexity_word = model.calculate_perplexity(
-                masked_sentence, word, mask_index)
-            fitness = model.calculate_fitness_score(
-                perplexity_masked, perplexity_word)
-            top_words_with_fitness.append((word, fitness))
-
-        feedback = provide_context_feedback(
-            user_guess,
-            original_word,
-            user_fitness,
-            original_fitness,
-            top_words_with_fitness,
-            masked_sentence,
-            model
-        )
-        print(feedback)
-
-        if language_code != 'en':
-            # Translate the sentence to the user's language
-            provided_translation = provide_translations(
-                sentence, user_sentence, language_code, translator)
-            print(provided_translation)
-
-        # Update user profile and adjust difficulty
-        user_profile.update_performance(user_fitness)
-        new_difficulty = adjust_difficulty(user_profile)
-        user_profile.set_difficulty(new_difficulty)
-
-        # Schedule review for this word
-        schedule_review(user_profile, original_word)
-
-        print("\nCurrent Difficulty:", user_profile.get_current_difficulty())
-        print("Average Score:", user_profile.get_average_score())
-        print("Words to Review:", user_profile.get_words_to_review())
+        with recorder.round():
+            if not play_round(args, engine, model, user_profile,
+                              profile_store, translator, scorer,
+                              language_code,
+                              timer if first_round else None):
+                break
+        first_round = False
 
         continue_playing = input("\nContinue? (Y/n): ").lower()
         if continue_playing == 'n':
             break
 
+    engine.close()
+    profile_store.close()
+    if translator is not None:
+        translator.close()
     print("Thanks for playing!")
 
 
+def play_round(args: argparse.Namespace, engine: RoundEngine, model,
+               user_profile, profile_store: ProfileStore,
+               translator: Optional[CachedTranslator],
+               scorer: Optional[SimilarityScorer], language_code: str,
+               timer: Optional[StartupTimer]) -> bool:
+    """
+    Play a single round of the game.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments.
+    engine : RoundEngine
+        Prepares the rounds.
+    model : ContextAwareTextModel
+        The context model used for scoring.
+    user_profile : UserProfile
+        The learner's profile, updated with the result of the round.
+    profile_store : ProfileStore
+        Persists the learner's profile after the round.
+    translator : Optional[CachedTranslator]
+        The translator, or None for English corpora.
+    scorer : Optional[SimilarityScorer]
+        The semantic similarity scorer, or None without embeddings.
+    language_code : str
+        The language code of the corpus.
+    timer : Optional[StartupTimer]
+        The startup timer, for the first round only.
+
+    Returns
+    -------
+    bool
+        False if no round could be prepared.
+    """
+    start = time.perf_counter()
+    with instrumentation.timer("wait_for_round"):
+        game_round = engine.next_round(user_profile.get_average_score(),
+                                       user_profile.get_words_to_review())
+    if game_round is None:
+        print("The corpus does not contain any maskable sentences.")
+        return False
+
+    if timer is not None:
+        timer.record("first round", time.perf_counter() - start)
+        if args.startup_report:
+            print(timer.report())
+
+    sentence = game_round.sentence
+    masked_sentence = game_round.masked_sentence
+    original_word = game_round.original_word
+    original_fitness = game_round.original_fitness
+    top_words_with_fitness = game_round.top_words_with_fitness
+
+    print("\nMasked Sentence: ", masked_sentence)
+    user_guess = input("Guess the missing word: ").strip().lower()
+    user_sentence = masked_sentence.replace('[MASK]', user_guess)
+
+    # Everything but the guess was prepared in the background
+    with instrumentation.timer("score_guess"):
+        user_fitness = engine.score_guess(game_round, user_guess)
+
+    feedback = provide_context_feedback(
+        user_guess,
+        original_word,
+        user_fitness,
+        original_fitness,
+        top_words_with_fitness,
+        masked_sentence,
+        model
+    )
+    print(feedback)
+
+    if scorer is not None and user_guess:
+        print(provide_similarity_feedback(user_guess, original_word, scorer))
+
+    if language_code != 'en':
+        # Translate the sentence to the user's language
+        provided_translation = provide_translations(
+            sentence, user_sentence, language_code, translator)
+        print(provided_translation)
+
+    # Update user profile and adjust difficulty
+    user_profile.update_performance(user_fitness)
+    new_difficulty = adjust_difficulty(user_profile)
+    user_profile.set_difficulty(new_difficulty)
+
+    # Schedule review for this word and move the review clock forward
+    schedule_review(user_profile, original_word)
+    user_profile.update_review_times()
+    profile_store.save(user_profile)
+
+    print("\nCurrent Difficulty:", user_profile.get_current_difficulty())
+    print("Average Score:", user_profile.get_average_score())
+    print("Words to Review:", user_profile.get_words_to_review())
+    return True
+
+
+def model_arguments(defaults: bool) -> argparse.ArgumentParser:
+    """
+    Get a parent parser with the model options, shared by the top-level
+    parser and the subcommands that run the model.
+
+    Parameters
+    ----------
+    defaults : bool
+        Whether the options have defaults. Only the top-level parser sets
+        them, so a subcommand does not reset an option given before it.
+
+    Returns
+    -------
+    argparse.ArgumentParser
+        The parent parser.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--scoring", choices=SCORING_MODES,
+                        default="perplexity" if defaults
+                        else argparse.SUPPRESS,
+                        help="How the fitness of a guess is calculated; "
+                             "play with the setting rounds were precomputed "
+                             "with.")
+    parser.add_argument("--backend", choices=BACKENDS,
+                        default="fp32" if defaults else argparse.SUPPRESS,
+                        help="The precision used for CPU inference; play "
+                             "with the setting rounds were precomputed "
+                             "with.")
+    return parser
+
+
+def main():
+    """
+    Main function to run the word masking and guessing game, or one of the
+    offline commands that prepare data for it.
+    """
+    parser = argparse.ArgumentParser(
+        description="Guess masked words the way a language model does.",
+        parents=[model_arguments(defaults=True)])
+    parser.add_argument("--model-name",
+                        help="The pre-trained masked language model to use "
+                             "for every language, by default "
+                             f"{DEFAULT_MODEL_NAME}.")
+    parser.add_argument("--per-language-models", action="store_true",
+                        help="Use a monolingual model for the languages "
+                             "that have one. Corpus indexes and precomputed "
+                             "rounds must then be built with this flag "
+                             "too.")
+    parser.add_argument("--context-window", type=int, default=128,
+                        help="The maximum number of tokens the model sees "
+                             "around the masked word.")
+    parser.set_defaults(command=play, startup_report=False,
+                        translator="google", profile="default",
+                        metrics_jsonl=None, metrics_prometheus=None,
+                        cprofile_every=0, cprofile_dir="data/profiles")
+    subparsers = parser.add_subparsers()
+
+    play_parser = subparsers.add_parser(
+        "play", parents=[model_arguments(defaults=False)],
+        help="Play the guessing game (default).")
+    play_parser.add_argument("--translator", choices=("google", "stub"),
+                             default="google",
+                             help="The translation service; 'stub' works "
+                                  "offline.")
+    play_parser.add_argument("--profile", default="default",
+                             help="The name the learner's progress is saved "
+                                  "under.")
+    play_parser.add_argument("--startup-report", action="store_true",
+                             help="Print how long each startup phase took.")
+    play_parser.add_argument("--metrics-jsonl",
+                             help="Append per-round stage timings and "
+                                  "counters to a JSON-lines file.")
+    play_parser.add_argument("--metrics-prometheus",
+                             help="Keep the running stage totals in a "
+                                  "Prometheus text file.")
+    play_parser.add_argument("--cprofile-every", type=int, default=0,
+                             help="Profile every n-th round with cProfile.")
+    play_parser.add_argument("--cprofile-dir", default="data/profiles",
+                             help="Where to write the round profiles.")
+    play_parser.set_defaults(command=play)
+
+    index_parser = subparsers.add_parser(
+        "build-index",
+        help="Tokenize a corpus once and store it as a memory-mapped index.")
+    index_parser.add_argument("--language", required=True,
+                              help="The corpus directory under data/corpus.")
+    index_parser.set_defaults(command=build_index)
+
+    difficulty_parser = subparsers.add_parser(
+        "build-difficulty",
+        help="Rate every maskable position of a corpus index by the model's "
+             "confidence instead of word rarity.")
+    difficulty_parser.add_argument("--language", required=True,
+                                   help="The corpus directory under "
+                                        "data/corpus.")
+    difficulty_parser.add_argument("--batch-size", type=int, default=64,
+                                   help="The number of masked positions per "
+                                        "forward batch.")
+    difficulty_parser.set_defaults(command=build_difficulty)
+
+    preprocess_parser = subparsers.add_parser(
+        "preprocess",
+        help="Split a corpus into sentences and tokens on all cores.")
+    preprocess_parser.add_argument("--language", required=True,
+                                   help="The corpus directory under "
+                                        "data/corpus.")
+    preprocess_parser.add_argument("--workers", type=int,
+                                   help="The number of worker processes, "
+                                        "by default one per core.")
+    preprocess_parser.add_argument("--chunk-mb", type=float, default=16,
+                                   help="The size of the chunks the files "
+                                        "are split into, in MiB.")
+    preprocess_parser.add_argument("--scaling", action="store_true",
+                                   help="Report the speedup for 1, 2, 4, ... "
+                                        "workers.")
+    preprocess_parser.set_defaults(command=preprocess)
+
+    embeddings_parser = subparsers.add_parser(
+        "build-embeddings",
+        help="Embed the corpus vocabulary for similarity feedback.")
+    embeddings_parser.add_argument("--language", required=True,
+                                   help="The corpus directory under "
+                                        "data/corpus.")
+    embeddings_parser.add_argument("--max-words", type=int, default=50000,
+                                   help="The number of most frequent words "
+                                        "to embed.")
+    embeddings_parser.set_defaults(command=build_embeddings)
+
+    evaluate_parser = subparsers.add_parser(
+        "evaluate", parents=[model_arguments(defaults=False)],
+        help="Score simulated guesses over a corpus to calibrate the "
+             "feedback and difficulty thresholds.")
+    evaluate_parser.add_argument("--language", required=True,
+                                 help="The corpus directory under "
+                                      "data/corpus.")
+    evaluate_parser.add_argument("--difficulties", type=float, nargs='+',
+                                 default=[0.0, 0.25, 0.5, 0.75, 1.0],
+                                 help="The difficulties to mask every "
+                                      "sentence at.")
+    evaluate_parser.add_argument("--sentences", type=int,
+                                 help="The number of sentences to evaluate, "
+                                      "by default the whole corpus.")
+    evaluate_parser.add_argument("--top-k", type=int, default=10,
+                                 help="The number of simulated guesses per "
+                                      "masked sentence.")
+    evaluate_parser.add_argument("--batch-size", type=int, default=64,
+                                 help="The number of masked sentences per "
+                                      "forward batch.")
+    evaluate_parser.add_argument("--seed", type=int, default=0)
+    evaluate_parser.add_argument("--output",
+                                 help="The .npz file to write, by default "
+                                      "data/evaluation/<language>.npz.")
+    evaluate_parser.set_defaults(command=evaluate_corpus)
+
+    precompute_parser = subparsers.add_parser(
+        "precompute", parents=[model_arguments(defaults=False)],
+        help="Compute rounds offline so the game only scores guesses.")
+    precompute_parser.add_argument("--language", required=True,
+                                   help="The corpus directory under "
+                                        "data/corpus.")
+    precompute_parser.add_argument("--rounds", type=int, default=10000,
+                                   help="The number of rounds to compute.")
+    precompute_parser.set_defaults(command=precompute)
+
+    serve_parser = subparsers.add_parser(
+        "serve", parents=[model_arguments(defaults=False)],
+        help="Host the game for many sessions over JSON-lines TCP.")
+    serve_parser.add_argument("--language", required=True, nargs='+',
+                              help="The corpus directories under "
+                                   "data/corpus of the served languages.")
+    serve_parser.add_argument("--memory-budget-mb", type=float,
+                              help="Evict the least recently used models "
+                                   "when the loaded models use more memory.")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--max-batch-size", type=int, default=32,
+                              help="The maximum number of inference "
+                                   "requests per batch.")
+    serve_parser.add_argument("--max-wait-ms", type=float, default=10.0,
+                              help="How long a request may wait for its "
+                                   "batch to fill.")
+    serve_parser.add_argument("--workers", type=int, default=0,
+                              help="Prepare rounds and score guesses in "
+                                   "this many worker processes per "
+                                   "language, which share the model's "
+                                   "weights. 0 runs the model in the server "
+                                   "process.")
+    serve_parser.set_defaults(command=serve)
+
+    args = parser.parse_args()
+    args.command(args)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,24 @@
+# Lightweight model settings, kept apart from context_aware_model so that
+# command line parsing does not have to import torch and transformers
+
+DEFAULT_MODEL_NAME = "bert-base-multilingual-uncased"
+
+# The language code of every corpus directory name
+LANGUAGE_CODES = {'english': 'en', 'spanish': 'es', 'french': 'fr'}
+
+# Monolingual models per language code, used instead of DEFAULT_MODEL_NAME
+# only when asked for (see `--per-language-models`)
+LANGUAGE_MODELS = {
+    'en': "bert-base-uncased",
+    'es': "dccuchile/bert-base-spanish-wwm-uncased",
+}
+
+# The sentence-transformers model used for semantic similarity feedback
+DEFAULT_SIMILARITY_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Supported ways of turning model output into fitness scores
+SCORING_MODES = ("perplexity", "logit")
+
+# Supported inference backends: full precision, dynamically quantized int8
+# linear layers, and bfloat16 weights and activations
+BACKENDS = ("fp32", "dynamic-int8", "bf16")
@@ -0,0 +1,213 @@
+import gc
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Optional
+
+from model_options import DEFAULT_MODEL_NAME, LANGUAGE_CODES, \
+    LANGUAGE_MODELS
+from resource_usage import resident_memory_mb
+
+
+def model_name_for(language: str,
+                   language_models: Mapping[str, str] = LANGUAGE_MODELS,
+                   default_model_name: str = DEFAULT_MODEL_NAME) -> str:
+    """
+    Get the model name of a language.
+
+    Parameters
+    ----------
+    language : str
+        A language code (e.g. 'en') or corpus directory name (e.g.
+        'english').
+    language_models : Mapping[str, str], optional
+        The model name of every language code, by default LANGUAGE_MODELS.
+    default_model_name : str, optional
+        The model for languages without their own, by default
+        DEFAULT_MODEL_NAME.
+
+    Returns
+    -------
+    str
+        The name of the pre-trained model to use.
+    """
+    code = LANGUAGE_CODES.get(language, language)
+    return language_models.get(code, default_model_name)
+
+
+class ModelRegistry:
+    def __init__(self, language_models: Mapping[str, str] = LANGUAGE_MODELS,
+                 default_model_name: str = DEFAULT_MODEL_NAME,
+                 memory_budget_mb: Optional[float] = None,
+                 **model_kwargs: Any) -> None:
+        """
+        Load a ContextAwareTextModel per language on first use, sharing one
+        instance, with its tokenizer and weights, between the languages that
+        map to the same model name.
+
+        When the loaded models use more memory than the budget, the least
+        recently used ones are evicted. An evicted model is freed once its
+        last user drops it, and loaded again when it is next requested.
+
+        Parameters
+        ----------
+        language_models : Mapping[str, str], optional
+            The model name of every language code, by default
+            LANGUAGE_MODELS.
+        default_model_name : str, optional
+            The model for languages without their own, by default
+            DEFAULT_MODEL_NAME.
+        memory_budget_mb : Optional[float], optional
+            The memory the loaded models may use, in MiB, by default
+            unlimited. The most recently used model is always kept.
+        **model_kwargs : Any
+            Keyword arguments for every ContextAwareTextModel (e.g. scoring,
+            backend).
+        """
+        self.language_models = dict(language_models)
+        self.default_model_name = default_model_name
+        self.memory_budget_mb = memory_budget_mb
+        self.model_kwargs = model_kwargs
+        # Model name -> (model, estimated memory in MiB), least recently used
+        # first
+        self.models: OrderedDict = OrderedDict()
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+
+    def model_name(self, language: str) -> str:
+        """
+        Get the model name of a language, see `model_name_for`.
+        """
+        return model_name_for(language, self.language_models,
+                              self.default_model_name)
+
+    def get(self, language: str):
+        """
+        Get the model of a language, loading it if necessary.
+
+        Parameters
+        ----------
+        language : str
+            A language code (e.g. 'en') or corpus directory name.
+
+        Returns
+        -------
+        ContextAwareTextModel
+            The model of the language.
+        """
+        model_name = self.model_name(language)
+        with self._lock:
+            if model_name in self.models:
+                self.hits += 1
+                self.models.move_to_end(model_name)
+                return self.models[model_name][0]
+
+            model, memory = self._load(model_name)
+            self.loads += 1
+            self.models[model_name] = (model, memory)
+            self._enforce_budget()
+            return model
+
+    def touch(self, model_name: str) -> bool:
+        """
+        Mark a loaded model as recently used, like `get` does, without
+        waiting while another model is being loaded.
+
+        Parameters
+        ----------
+        model_name : str
+            The name of the model.
+
+        Returns
+        -------
+        bool
+            True if the model is loaded, False if it is not or the registry
+            is busy loading, in which case `get` has to be used.
+        """
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if model_name not in self.models:
+                return False
+            self.hits += 1
+            self.models.move_to_end(model_name)
+            return True
+        finally:
+            self._lock.release()
+
+    def _load(self, model_name: str):
+        """
+        Load a model and estimate the memory it uses.
+        """
+        from context_aware_model import ContextAwareTextModel
+
+        before = resident_memory_mb()
+        model = ContextAwareTextModel(model_name, **self.model_kwargs)
+        # The growth of the resident set misses memory reused from evicted
+        # models, so never estimate less than the size of the weights
+        weights = sum(tensor.numel() * tensor.element_size()
+                      for tensor in (*model.model.parameters(),
+                                     *model.model.buffers())) / 2 ** 20
+        return model, max(resident_memory_mb() - before, weights)
+
+    def _enforce_budget(self) -> None:
+        if self.memory_budget_mb is None:
+            return
+        while len(self.models) > 1 and \
+                self.memory_mb() > self.memory_budget_mb:
+            self.evict(next(iter(self.models)))
+
+    def evict(self, model_name: str) -> None:
+        """
+        Drop a model from the registry.
+
+        Parameters
+        ----------
+        model_name : str
+            The name of the model to drop.
+        """
+        with self._lock:
+            if self.models.pop(model_name, None) is not None:
+                self.evictions += 1
+                gc.collect()
+
+    def is_loaded(self, model_name: str) -> bool:
+        """
+        Check whether a model is currently held by the registry.
+        """
+        with self._lock:
+            return model_name in self.models
+
+    def loaded_model_names(self) -> List[str]:
+        """
+        Get the names of the loaded models, least recently used first.
+        """
+        with self._lock:
+            return list(self.models)
+
+    def memory_mb(self) -> float:
+        """
+        Get the estimated memory used by the loaded models, in MiB.
+        """
+        with self._lock:
+            return sum(memory for _, memory in self.models.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the load, hit and eviction counts and the memory use.
+
+        Returns
+        -------
+        Dict[str, Any]
+            Registry statistics, including the estimated memory of every
+            loaded model and the resident memory of the process.
+        """
+        with self._lock:
+            return {'loads': self.loads, 'hits': self.hits,
+                    'evictions': self.evictions,
+                    'models': {name: memory for name, (_, memory)
+                               in self.models.items()},
+                    'memory_mb': self.memory_mb(),
+                    'memory_budget_mb': self.memory_budget_mb,
+                    'resident_mb': resident_memory_mb()}
@@ -0,0 +1,155 @@
+from dataclasses import dataclass, replace
+from itertools import chain
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def is_maskable_token(token: str, special_tokens: Iterable[str]) -> bool:
+    """
+    Check whether a token is a whole alphabetic word that can be masked.
+
+    Parameters
+    ----------
+    token : str
+        The token as produced by the tokenizer.
+    special_tokens : Iterable[str]
+        The special tokens of the tokenizer (e.g., "[CLS]", "[SEP]").
+
+    Returns
+    -------
+    bool
+        True if the token can be masked, False otherwise.
+    """
+    return token.isalpha() and not token.startswith('##') \
+        and token not in special_tokens
+
+
+@dataclass
+class PreparedSentence:
+    """
+    A sentence tokenized once, holding everything the model needs to mask
+    and score it.
+
+    Token positions (in `offsets`, `maskable_positions` and `mask_index`)
+    count the tokens without [CLS] and [SEP], like the mask index returned
+    by `ContextAwareTextModel.mask_word`.
+    """
+    text: str
+    # The token ids of the sentence, with [CLS] and [SEP]
+    input_ids: List[int]
+    # The character span of every token, without [CLS] and [SEP]
+    offsets: List[Tuple[int, int]]
+    # The positions of the tokens that can be masked
+    maskable_positions: List[int]
+    # The position of the masked token, for a masked sentence
+    mask_index: Optional[int] = None
+    # The token id the mask replaced, for a masked sentence
+    original_token_id: Optional[int] = None
+
+    @property
+    def token_ids(self) -> List[int]:
+        """
+        The token ids of the sentence, without [CLS] and [SEP].
+        """
+        return self.input_ids[1:-1]
+
+    def masked(self, mask_index: int, mask_token: str,
+               mask_token_id: int) -> 'PreparedSentence':
+        """
+        Replace a token with the mask token, without tokenizing again.
+
+        Parameters
+        ----------
+        mask_index : int
+            The position of the token to mask.
+        mask_token : str
+            The text of the mask token, e.g. "[MASK]".
+        mask_token_id : int
+            The id of the mask token.
+
+        Returns
+        -------
+        PreparedSentence
+            The masked sentence, which keeps the id of the replaced token. It
+            has no maskable positions left.
+        """
+        start, end = self.offsets[mask_index]
+        shift = len(mask_token) - (end - start)
+        input_ids = list(self.input_ids)
+        original_token_id = input_ids[mask_index + 1]
+        input_ids[mask_index + 1] = mask_token_id
+        offsets = [(s, e) if s < end else (s + shift, e + shift)
+                   for s, e in self.offsets]
+        offsets[mask_index] = (start, start + len(mask_token))
+        return replace(self, text=self.text[:start] + mask_token +
+                       self.text[end:], input_ids=input_ids, offsets=offsets,
+                       maskable_positions=[], mask_index=mask_index,
+                       original_token_id=original_token_id)
+
+
+def prepare_sentences(tokenizer, sentences: Sequence[str],
+                      words: Optional[np.ndarray] = None) \
+        -> List[PreparedSentence]:
+    """
+    Tokenize sentences in bulk with a single call of the fast tokenizer.
+
+    Parameters
+    ----------
+    tokenizer : transformers.PreTrainedTokenizerFast
+        The tokenizer of the model.
+    sentences : Sequence[str]
+        The sentences to tokenize.
+    words : Optional[np.ndarray], optional
+        The `VocabularyTables.words` table of the tokenizer. With it, the
+        maskable tokens of all sentences are found with one array lookup
+        instead of checking the text of every token.
+
+    Returns
+    -------
+    List[PreparedSentence]
+        The prepared sentences, in the same order.
+    """
+    if not sentences:
+        return []
+    encoded = tokenizer(list(sentences), return_offsets_mapping=True)
+    special_tokens = set(tokenizer.all_special_tokens)
+    if words is not None:
+        all_maskable_positions = _maskable_positions(encoded['input_ids'],
+                                                     words)
+
+    prepared = []
+    for i, sentence in enumerate(sentences):
+        if words is not None:
+            maskable_positions = all_maskable_positions[i]
+        else:
+            # Skip [CLS] and [SEP]
+            maskable_positions = [
+                position for position, token
+                in enumerate(encoded.tokens(i)[1:-1])
+                if is_maskable_token(token, special_tokens)]
+        prepared.append(PreparedSentence(
+            sentence, encoded['input_ids'][i],
+            [tuple(span) for span in encoded['offset_mapping'][i][1:-1]],
+            maskable_positions))
+    return prepared
+
+
+def _maskable_positions(input_ids: List[List[int]], words: np.ndarray) \
+        -> List[List[int]]:
+    """
+    Find the maskable positions of every sentence with a single lookup of
+    all token ids in the words table.
+    """
+    lengths = np.fromiter(map(len, input_ids), dtype=np.int64,
+                          count=len(input_ids))
+    flat = np.fromiter(chain.from_iterable(input_ids), dtype=np.int64,
+                       count=int(lengths.sum()))
+    hits = np.flatnonzero(words[flat])
+    starts = np.concatenate(([0], np.cumsum(lengths)))
+    rows = np.searchsorted(starts, hits, 'right') - 1
+    # [CLS] and [SEP] are never words, and positions do not count [CLS]
+    positions = (hits - starts[rows] - 1).tolist()
+    bounds = np.searchsorted(rows, np.arange(len(input_ids) + 1)).tolist()
+    return [positions[bounds[i]:bounds[i + 1]]
+            for i in range(len(input_ids))]
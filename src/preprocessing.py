@@ -0,0 +1,296 @@
+import json
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from data_processing import FREQUENCY_FILE, load_frequency_dict, \
+    preprocess_text, save_frequency_dict
+
+# Byte range of a corpus file processed by one task: the file path, the
+# start and end offsets, and the number of the chunk
+ChunkTask = Tuple[str, int, int, int]
+
+# How far past a chunk boundary to look for a paragraph break, in bytes
+BOUNDARY_SEARCH = 1 << 16
+
+
+def _next_boundary(file, position: int, size: int) -> int:
+    """
+    Move a byte offset forward to the start of the next paragraph, or failing
+    that the next line, so chunks do not split sentences or UTF-8 sequences.
+    """
+    if position >= size:
+        return size
+    file.seek(position)
+    window = file.read(BOUNDARY_SEARCH)
+    for separator in (b'\n\n', b'\n'):
+        index = window.find(separator)
+        if index != -1:
+            return position + index + len(separator)
+    # A single enormous line; cut after the next whitespace instead, which is
+    # never part of a word or a multi-byte UTF-8 sequence
+    while window:
+        match = re.search(rb'\s', window)
+        if match:
+            return position + match.end()
+        position += len(window)
+        window = file.read(BOUNDARY_SEARCH)
+    return size
+
+
+def split_byte_ranges(filepaths: List[str], chunk_bytes: int = 16 << 20) \
+        -> List[ChunkTask]:
+    """
+    Split corpus files into byte ranges of roughly equal size.
+
+    Parameters
+    ----------
+    filepaths : List[str]
+        Paths to the text corpus files.
+    chunk_bytes : int, optional
+        The target size of a chunk, by default 16 MiB.
+
+    Returns
+    -------
+    List[ChunkTask]
+        The file path, start and end offset and number of every chunk, in
+        corpus order.
+    """
+    tasks = []
+    for filepath in filepaths:
+        size = os.path.getsize(filepath)
+        with open(filepath, 'rb') as file:
+            start = 0
+            while start < size:
+                end = _next_boundary(file, start + chunk_bytes, size)
+                tasks.append((filepath, start, end, len(tasks)))
+                start = end
+    return tasks
+
+
+def process_chunk(task: ChunkTask, output_dir: str) \
+        -> Tuple[int, Counter, int]:
+    """
+    Split a byte range of a corpus file into sentences and tokens, and write
+    them to the chunk's shard files.
+
+    Parameters
+    ----------
+    task : ChunkTask
+        The byte range to process.
+    output_dir : str
+        The directory to write the shards to.
+
+    Returns
+    -------
+    Tuple[int, Counter, int]
+        The number of the chunk, its token frequencies and its number of
+        sentences.
+    """
+    from nltk.tokenize import sent_tokenize
+
+    filepath, start, end, number = task
+    with open(filepath, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode('utf-8', errors='replace')
+
+    frequencies = Counter()
+    num_sentences = 0
+    with open(os.path.join(output_dir, f'sentences-{number:05d}.txt'), 'w',
+              encoding='utf-8') as sentences_file, \
+            open(os.path.join(output_dir, f'tokens-{number:05d}.txt'), 'w',
+                 encoding='utf-8') as tokens_file:
+        for sentence in sent_tokenize(text):
+            # One sentence per line
+            sentence = ' '.join(sentence.split())
+            if not sentence:
+                continue
+            tokens = preprocess_text(sentence)
+            frequencies.update(tokens)
+            sentences_file.write(sentence + '\n')
+            tokens_file.write(' '.join(tokens) + '\n')
+            num_sentences += 1
+    return number, frequencies, num_sentences
+
+
+def _process_chunk(args: Tuple[ChunkTask, str]) -> Tuple[int, Counter, int]:
+    return process_chunk(*args)
+
+
+def preprocess_corpus(filepaths: List[str], output_dir: str,
+                      workers: Optional[int] = None,
+                      chunk_bytes: int = 16 << 20) -> Dict[str, float]:
+    """
+    Split a corpus into sentences and tokens and count its word frequencies,
+    processing byte ranges of the corpus files in parallel.
+
+    Every chunk streams its sentences and tokens to its own shard files, so
+    no worker holds more than one chunk in memory, and only the per-chunk
+    Counters are sent back and merged.
+
+    Parameters
+    ----------
+    filepaths : List[str]
+        Paths to the text corpus files.
+    output_dir : str
+        The directory to write the shards, the frequencies and `meta.json`
+        to.
+    workers : Optional[int], optional
+        The number of worker processes, by default one per core. With one
+        worker the chunks are processed in the calling process.
+    chunk_bytes : int, optional
+        The target size of a chunk, by default 16 MiB.
+
+    Returns
+    -------
+    Dict[str, float]
+        The number of chunks, sentences and distinct words, and the time
+        taken in seconds.
+    """
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = split_byte_ranges(filepaths, chunk_bytes)
+
+    frequencies = Counter()
+    num_sentences = 0
+    if workers == 1:
+        results = (process_chunk(task, output_dir) for task in tasks)
+        for _, chunk_frequencies, chunk_sentences in results:
+            frequencies.update(chunk_frequencies)
+            num_sentences += chunk_sentences
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for _, chunk_frequencies, chunk_sentences in executor.map(
+                    _process_chunk, [(task, output_dir) for task in tasks]):
+                frequencies.update(chunk_frequencies)
+                num_sentences += chunk_sentences
+
+    save_frequency_dict(frequencies, os.path.join(output_dir,
+                                                  FREQUENCY_FILE))
+    with open(os.path.join(output_dir, 'meta.json'), 'w',
+              encoding='utf-8') as file:
+        json.dump({'files': filepaths,
+                   'sizes': [os.path.getsize(path) for path in filepaths],
+                   'num_chunks': len(tasks),
+                   'num_sentences': num_sentences}, file, indent=2)
+
+    return {'chunks': len(tasks), 'sentences': num_sentences,
+            'words': len(frequencies),
+            'seconds': time.perf_counter() - start}
+
+
+def is_preprocessed(output_dir: str, filepaths: List[str]) -> bool:
+    """
+    Check whether a corpus has been preprocessed to a directory and the
+    corpus files have not changed in size since.
+
+    Parameters
+    ----------
+    output_dir : str
+        The directory the corpus may have been preprocessed to.
+    filepaths : List[str]
+        Paths to the text corpus files.
+
+    Returns
+    -------
+    bool
+        True if the shards in the directory belong to the files.
+    """
+    path = os.path.join(output_dir, 'meta.json')
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'r', encoding='utf-8') as file:
+        meta = json.load(file)
+    return meta.get('files') == filepaths and meta.get('sizes') == \
+        [os.path.getsize(filepath) for filepath in filepaths]
+
+
+def load_preprocessed_frequencies(output_dir: str) -> Counter:
+    """
+    Load the word frequencies counted by `preprocess_corpus`.
+
+    Parameters
+    ----------
+    output_dir : str
+        The directory the corpus was preprocessed to.
+
+    Returns
+    -------
+    Counter
+        Frequency dictionary of the lowercased corpus words.
+    """
+    return load_frequency_dict(os.path.join(output_dir, FREQUENCY_FILE))
+
+
+def iter_preprocessed_sentences(output_dir: str) -> Iterator[str]:
+    """
+    Read the sentences written by `preprocess_corpus`, in corpus order.
+
+    Parameters
+    ----------
+    output_dir : str
+        The directory the corpus was preprocessed to.
+
+    Yields
+    ------
+    str
+        The sentences of the corpus.
+    """
+    with open(os.path.join(output_dir, 'meta.json'), 'r',
+              encoding='utf-8') as file:
+        num_chunks = json.load(file)['num_chunks']
+    for number in range(num_chunks):
+        with open(os.path.join(output_dir, f'sentences-{number:05d}.txt'),
+                  'r', encoding='utf-8') as file:
+            for line in file:
+                yield line.rstrip('\n')
+
+
+def report_scaling(filepaths: List[str], output_dir: str,
+                   max_workers: Optional[int] = None,
+                   chunk_bytes: int = 16 << 20) -> List[Dict[str, float]]:
+    """
+    Preprocess a corpus with 1, 2, 4, ... worker processes and print the
+    speedup over a single process.
+
+    Parameters
+    ----------
+    filepaths : List[str]
+        Paths to the text corpus files.
+    output_dir : str
+        The directory to preprocess the corpus to; it is overwritten by
+        every run.
+    max_workers : Optional[int], optional
+        The largest number of workers to try, by default one per core.
+    chunk_bytes : int, optional
+        The target size of a chunk, by default 16 MiB.
+
+    Returns
+    -------
+    List[Dict[str, float]]
+        The statistics of every run, with the number of workers and the
+        speedup added.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    counts = []
+    workers = 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers *= 2
+    counts.append(max_workers)
+
+    runs = []
+    print(f"{'workers':>8}{'seconds':>10}{'speedup':>10}")
+    for workers in counts:
+        stats = preprocess_corpus(filepaths, output_dir, workers, chunk_bytes)
+        stats['workers'] = workers
+        stats['speedup'] = runs[0]['seconds'] / stats['seconds'] \
+            if runs else 1.0
+        runs.append(stats)
+        print(f"{workers:>8}{stats['seconds']:>10.2f}"
+              f"{stats['speedup']:>9.2f}x")
+    return runs
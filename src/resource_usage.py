@@ -0,0 +1,74 @@
+import os
+import resource
+import sys
+from typing import Dict, Optional
+
+
+def resident_memory_mb() -> float:
+    """
+    Get the current resident set size of this process.
+
+    Falls back to the peak resident set size on platforms without
+    `/proc/self/statm`.
+
+    Returns
+    -------
+    float
+        The resident memory in MiB.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            resident_pages = int(file.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return peak_resident_memory_mb()
+
+
+def peak_resident_memory_mb() -> float:
+    """
+    Get the peak resident set size of this process.
+
+    Returns
+    -------
+    float
+        The peak resident memory in MiB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in KiB elsewhere
+    if sys.platform == 'darwin':
+        return peak / 2 ** 20
+    return peak / 2 ** 10
+
+
+def process_memory_mb(pid: Optional[int] = None) -> Optional[Dict[str, float]]:
+    """
+    Break the resident memory of a process down into the pages it shares
+    with other processes (e.g. model weights inherited from a forked parent)
+    and the pages that are its own.
+
+    Parameters
+    ----------
+    pid : Optional[int], optional
+        The process to inspect, by default this process.
+
+    Returns
+    -------
+    Optional[Dict[str, float]]
+        The 'rss', 'pss' (shared pages divided among their users), 'shared'
+        and 'private' memory in MiB, or None on platforms without
+        `/proc/<pid>/smaps_rollup`.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid or 'self'}/smaps_rollup", 'r') as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) / 2 ** 10
+    except OSError:
+        return None
+    return {'rss': fields.get('Rss', 0.0), 'pss': fields.get('Pss', 0.0),
+            'shared': fields.get('Shared_Clean', 0.0) +
+            fields.get('Shared_Dirty', 0.0),
+            'private': fields.get('Private_Clean', 0.0) +
+            fields.get('Private_Dirty', 0.0)}
@@ -0,0 +1,366 @@
+import itertools
+import json
+import os
+import random
+import sqlite3
+import threading
+from typing import Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from corpus_index import CorpusIndex
+from prepared_sentence import PreparedSentence
+from rounds import Round
+
+if TYPE_CHECKING:
+    from context_aware_model import ContextAwareTextModel
+
+# Bump when the layout or meaning of the bundles changes
+STORE_VERSION = 2
+
+
+def store_key(model: 'ContextAwareTextModel', top_k: int = 10) -> str:
+    """
+    Get the invalidation key of the bundles a model produces. Bundles
+    computed with a different model, model revision or scoring setup have
+    other fitness values and must not be played.
+
+    Parameters
+    ----------
+    model : ContextAwareTextModel
+        The model that scores the rounds.
+    top_k : int, optional
+        The number of predictions per round, by default 10.
+
+    Returns
+    -------
+    str
+        The key, as a JSON string.
+    """
+    return json.dumps({
+        'version': STORE_VERSION,
+        'model_name': model.model_name,
+        # The hub commit the weights were downloaded from, if any
+        'revision': getattr(model.model.config, '_commit_hash', None),
+        'scoring': model.scoring,
+        'backend': model.backend,
+        'context_window': model.context_window,
+        'top_k': top_k,
+    }, sort_keys=True)
+
+
+class RoundStore:
+    def __init__(self, path: str) -> None:
+        """
+        Persist precomputed rounds ("round bundles") in SQLite: the masked
+        sentence, the original word and its fitness, the top predictions
+        with their fitness and the baseline loss.
+
+        Bundles are indexed by difficulty, so drawing one for a difficulty
+        takes a few index lookups.
+
+        Parameters
+        ----------
+        path : str
+            The SQLite file to store the bundles in.
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        # Rounds are prefetched on a background thread
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bundles (
+                id INTEGER PRIMARY KEY,
+                difficulty REAL NOT NULL,
+                -- Breaks ties between bundles of the same difficulty
+                shuffle REAL NOT NULL,
+                sentence TEXT NOT NULL,
+                masked_sentence TEXT NOT NULL,
+                original_word TEXT NOT NULL,
+                mask_index INTEGER NOT NULL,
+                input_ids BLOB NOT NULL,
+                offsets BLOB NOT NULL,
+                original_fitness REAL NOT NULL,
+                top_words TEXT NOT NULL,
+                top_fitness BLOB NOT NULL,
+                baseline_loss REAL
+            );
+            CREATE INDEX IF NOT EXISTS bundles_difficulty
+                ON bundles (difficulty, shuffle);
+        """)
+
+    @property
+    def key(self) -> Optional[str]:
+        """
+        The invalidation key the stored bundles were computed with.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM meta WHERE key = 'key'").fetchone()
+        return row[0] if row else None
+
+    def is_valid(self, key: str) -> bool:
+        """
+        Check whether the store holds bundles computed with a key.
+        """
+        return self.key == key and len(self) > 0
+
+    def reset(self, key: str) -> None:
+        """
+        Delete all bundles and set the key of the bundles added next.
+
+        Parameters
+        ----------
+        key : str
+            The invalidation key, see `store_key`.
+        """
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM bundles")
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('key', ?)",
+                             (key,))
+
+    def add(self, bundles: List[Tuple[Round, float, Optional[float]]]) \
+            -> None:
+        """
+        Store rounds.
+
+        Parameters
+        ----------
+        bundles : List[Tuple[Round, float, Optional[float]]]
+            Every round, which must have a prepared sentence, with its
+            difficulty and the baseline loss of its masked sentence (None in
+            "logit" scoring mode).
+        """
+        rows = []
+        for game_round, difficulty, baseline_loss in bundles:
+            prepared = game_round.prepared
+            words, fitness = zip(*game_round.top_words_with_fitness) \
+                if game_round.top_words_with_fitness else ((), ())
+            rows.append((
+                difficulty, random.random(), game_round.sentence,
+                game_round.masked_sentence, game_round.original_word,
+                game_round.mask_index,
+                np.asarray(prepared.input_ids, dtype=np.int32).tobytes(),
+                np.asarray(prepared.offsets, dtype=np.int32).tobytes(),
+                game_round.original_fitness, json.dumps(list(words)),
+                np.asarray(fitness, dtype=np.float64).tobytes(),
+                baseline_loss))
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO bundles (difficulty, shuffle, sentence, "
+                "masked_sentence, original_word, mask_index, input_ids, "
+                "offsets, original_fitness, top_words, top_fitness, "
+                "baseline_loss) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows)
+
+    def sample(self, difficulty: float, spread: float = 0.1) \
+            -> Optional[Tuple[Round, Optional[float]]]:
+        """
+        Draw a bundle for a difficulty.
+
+        The target difficulty is drawn from a Gaussian around `difficulty`,
+        like `CorpusIndex.sample_position`, and a bundle of the nearest
+        difficulty at or above it is read through the difficulty index.
+
+        Parameters
+        ----------
+        difficulty : float
+            The difficulty level as a float (higher means more difficult),
+            clamped to the 0-1 range.
+        spread : float, optional
+            The standard deviation of the drawn difficulty, by default 0.1.
+
+        Returns
+        -------
+        Optional[Tuple[Round, Optional[float]]]
+            The round and its baseline loss, or None if the store is empty.
+        """
+        target = float(np.clip(np.random.normal(
+            loc=min(max(difficulty, 0.0), 1.0), scale=spread), 0.0, 1.0))
+        columns = ("sentence, masked_sentence, original_word, mask_index, "
+                   "input_ids, offsets, original_fitness, top_words, "
+                   "top_fitness, baseline_loss")
+        with self._lock:
+            match = self._db.execute(
+                "SELECT difficulty FROM bundles WHERE difficulty >= ? "
+                "ORDER BY difficulty LIMIT 1", (target,)).fetchone() or \
+                self._db.execute("SELECT MAX(difficulty) FROM bundles") \
+                .fetchone()
+            if match[0] is None:
+                return None
+            # Many bundles may share a difficulty, so pick uniformly among
+            # them by their random shuffle value
+            row = self._db.execute(
+                f"SELECT {columns} FROM bundles WHERE difficulty = ? AND "
+                "shuffle >= ? ORDER BY shuffle LIMIT 1",
+                (match[0], random.random())).fetchone() or \
+                self._db.execute(
+                    f"SELECT {columns} FROM bundles WHERE difficulty = ? "
+                    "ORDER BY shuffle LIMIT 1", (match[0],)).fetchone()
+
+        (sentence, masked_sentence, original_word, mask_index, input_ids,
+         offsets, original_fitness, top_words, top_fitness,
+         baseline_loss) = row
+        prepared = PreparedSentence(
+            masked_sentence, np.frombuffer(input_ids, np.int32).tolist(),
+            [tuple(span) for span in
+             np.frombuffer(offsets, np.int32).reshape(-1, 2).tolist()],
+            [], mask_index)
+        game_round = Round(
+            sentence, masked_sentence, original_word, mask_index,
+            original_fitness,
+            list(zip(json.loads(top_words),
+                     np.frombuffer(top_fitness, np.float64).tolist())),
+            prepared)
+        return game_round, baseline_loss
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM bundles").fetchone()[0]
+
+    def close(self) -> None:
+        """
+        Close the database.
+        """
+        with self._lock:
+            self._db.close()
+
+
+def _corpus_pairs(model: 'ContextAwareTextModel', corpus_index: CorpusIndex,
+                  count: int) -> Iterator[Tuple[PreparedSentence, int, float]]:
+    """
+    Pick positions spread evenly over the difficulty index of a corpus.
+    """
+    difficulties = corpus_index.difficulty['difficulty']
+    picks = np.unique(np.linspace(0, len(difficulties) - 1,
+                                  min(count, len(difficulties))).astype(int))
+    for i in picks:
+        sentence_id = int(corpus_index.difficulty['difficulty_sentences'][i])
+        prepared = model.prepare_encoded(
+            corpus_index.sentence(sentence_id),
+            corpus_index.token_ids(sentence_id),
+            corpus_index.offsets(sentence_id),
+            corpus_index.maskable_positions(sentence_id))
+        yield (prepared,
+               int(corpus_index.difficulty['difficulty_positions'][i]),
+               float(difficulties[i]))
+
+
+def _stream_pairs(model: 'ContextAwareTextModel', sentences: Iterator[str],
+                  count: int, max_attempts: int = 100) \
+        -> Iterator[Tuple[PreparedSentence, int, float]]:
+    """
+    Mask streamed sentences at random difficulties, rating each masked token
+    by the model's vocabulary rarity.
+
+    A cycling stream never runs out, so this gives up after `max_attempts`
+    sentences in a row without a maskable word.
+    """
+    produced = 0
+    attempts = 0
+    for sentence in sentences:
+        if produced >= count or attempts >= max_attempts:
+            return
+        prepared = model.prepare(sentence)
+        _, _, mask_index = model.mask_word(prepared, random.random())
+        if mask_index == -1:
+            attempts += 1
+            continue
+        attempts = 0
+        produced += 1
+        yield (prepared, mask_index, float(model.vocabulary.rarity[
+            prepared.token_ids[mask_index]]))
+
+
+def precompute_rounds(model: 'ContextAwareTextModel', store: RoundStore,
+                      count: int, corpus_index: Optional[CorpusIndex] = None,
+                      sentences: Optional[Iterator[str]] = None,
+                      top_k: int = 10, batch_size: int = 64) -> int:
+    """
+    Compute round bundles offline and replace the contents of a store with
+    them.
+
+    With a corpus index that has a difficulty index, the masked positions
+    are spread evenly over its difficulty range. Otherwise sentences are
+    drawn from the stream and masked at random difficulties.
+
+    Parameters
+    ----------
+    model : ContextAwareTextModel
+        The model that will play the rounds.
+    store : RoundStore
+        The store to fill.
+    count : int
+        The number of bundles to compute.
+    corpus_index : Optional[CorpusIndex], optional
+        The corpus index to draw positions from.
+    sentences : Optional[Iterator[str]], optional
+        A stream of raw sentences, used when there is no corpus index.
+    top_k : int, optional
+        The number of predictions per round, by default 10.
+    batch_size : int, optional
+        The number of rounds scored together, by default 64.
+
+    Returns
+    -------
+    int
+        The number of stored bundles.
+    """
+    if corpus_index is not None and corpus_index.difficulty is not None:
+        pairs = _corpus_pairs(model, corpus_index, count)
+    elif sentences is not None:
+        pairs = _stream_pairs(model, sentences, count)
+    else:
+        raise ValueError("Either a corpus index with a difficulty index or "
+                         "a sentence stream is required.")
+
+    store.reset(store_key(model, top_k))
+    stored = 0
+    batch = []
+    # A final None flushes the last, partial batch
+    for pair in itertools.chain(pairs, [None]):
+        if pair is not None:
+            batch.append(pair)
+            if len(batch) < batch_size:
+                continue
+        if not batch:
+            break
+
+        masked = []
+        for prepared, mask_index, difficulty in batch:
+            _, original_word, _ = model.mask_at(prepared.text,
+                                                prepared.offsets, mask_index)
+            masked.append((prepared.text,
+                           model.mask_prepared(prepared, mask_index),
+                           original_word, difficulty))
+        all_top_words = model.get_top_predictions_batch(
+            [prepared for _, prepared, _, _ in masked], top_k)
+        all_scores = model.score_batch([
+            (prepared, [prepared.original_token_id] + top_words,
+             prepared.mask_index)
+            for (_, prepared, original_word, _), top_words
+            in zip(masked, all_top_words)])
+
+        bundles = []
+        for (sentence, prepared, original_word, difficulty), top_words, \
+                scores in zip(masked, all_top_words, all_scores):
+            # The baseline was cached while scoring, so this is a lookup
+            baseline_loss = None
+            if model.scoring == "perplexity":
+                baseline_loss = model.baseline_loss(prepared,
+                                                    prepared.mask_index)
+            bundles.append((Round(
+                sentence, prepared.text, original_word, prepared.mask_index,
+                scores[0], list(zip(top_words, scores[1:])), prepared),
+                difficulty, baseline_loss))
+        store.add(bundles)
+        stored += len(bundles)
+        batch = []
+    return stored
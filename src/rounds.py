@@ -0,0 +1,342 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Sequence, Tuple, \
+    TYPE_CHECKING
+from corpus_index import CorpusIndex
+from prepared_sentence import PreparedSentence
+import instrumentation
+
+if TYPE_CHECKING:
+    from context_aware_model import ContextAwareTextModel
+    from round_store import RoundStore
+
+
+@dataclass
+class Round:
+    """
+    Everything about a round of the game that does not depend on the user's
+    guess.
+    """
+    sentence: str
+    masked_sentence: str
+    original_word: str
+    mask_index: int
+    original_fitness: float
+    top_words_with_fitness: List[Tuple[str, float]]
+    # The masked sentence, tokenized once for all scoring calls
+    prepared: Optional[PreparedSentence] = None
+
+
+class RoundEngine:
+    def __init__(self, model: 'ContextAwareTextModel',
+                 corpus_index: Optional[CorpusIndex] = None,
+                 sentences: Optional[Iterator[str]] = None,
+                 round_store: Optional['RoundStore'] = None) -> None:
+        """
+        Prepare game rounds, prefetching the next round in a background
+        thread while the user is still guessing the current one.
+
+        With a store of precomputed rounds, rounds are read from it instead,
+        and only the user's guess needs a forward pass.
+
+        Parameters
+        ----------
+        model : ContextAwareTextModel
+            The context model used for masking and scoring.
+        corpus_index : Optional[CorpusIndex], optional
+            The prebuilt corpus index to draw sentences from, by default None.
+        sentences : Optional[Iterator[str]], optional
+            A stream of raw sentences, used when there is no corpus index.
+        round_store : Optional[RoundStore], optional
+            Precomputed rounds for the model, by default None. Its key must
+            match the model, see `store_key`.
+        """
+        if corpus_index is None and sentences is None and round_store is None:
+            raise ValueError("Either a corpus index, a sentence stream or a "
+                             "round store is required.")
+        self.model = model
+        self.corpus_index = corpus_index
+        self.sentences = sentences
+        self.round_store = round_store
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending: Optional[Future] = None
+
+    def mask_next(self, difficulty: float) \
+            -> Optional[Tuple[str, Optional[PreparedSentence], str, int]]:
+        """
+        Draw the next sentence and mask a word in it.
+
+        Parameters
+        ----------
+        difficulty : float
+            The difficulty level as a float (higher means more difficult).
+
+        Returns
+        -------
+        Optional[Tuple[str, Optional[PreparedSentence], str, int]]
+            The sentence, the prepared masked sentence (None if nothing could
+            be masked), the original word and the index of the masked token,
+            or None if the corpus is exhausted.
+        """
+        if self.corpus_index is not None:
+            # Look up a position of the right difficulty directly, if the
+            # index has a difficulty index
+            sampled = self.corpus_index.sample_position(difficulty)
+            if sampled is not None:
+                return self._mask_indexed(*sampled)
+            prepared = self._prepare_indexed(
+                self.corpus_index.random_sentence_id())
+        else:
+            sentence = next(self.sentences, None)
+            if sentence is None:
+                return None
+            prepared = self.model.prepare(sentence)
+
+        _, _, mask_index = self.model.mask_word(prepared, difficulty)
+        if mask_index == -1:
+            return prepared.text, None, '', -1
+        return self._mask(prepared, mask_index)
+
+    def find_review_sentence(self, review_words: Sequence[str]) \
+            -> Optional[Tuple[str, PreparedSentence, str, int]]:
+        """
+        Draw a sentence containing a word that is due for review and mask
+        exactly that word.
+
+        The occurrences of every word are read from the word index of the
+        corpus index, so no sentence has to be scanned or retried.
+
+        Parameters
+        ----------
+        review_words : Sequence[str]
+            The words due for review, the first one tried first.
+
+        Returns
+        -------
+        Optional[Tuple[str, PreparedSentence, str, int]]
+            The sentence, the prepared masked sentence, the original word and
+            the index of the masked token, or None if none of the words
+            occurs in the corpus index or there is no word index.
+        """
+        if not review_words or self.corpus_index is None or \
+                self.corpus_index.words is None:
+            return None
+        for token_id in self.model.word_token_ids(review_words):
+            if token_id is None:
+                continue
+            sampled = self.corpus_index.sample_token(token_id)
+            if sampled is not None:
+                instrumentation.count("review_rounds")
+                return self._mask_indexed(*sampled)
+        return None
+
+    def _prepare_indexed(self, sentence_id: int) -> PreparedSentence:
+        """
+        Prepare a sentence of the corpus index. The index is already
+        tokenized, so the tokenizer is not needed.
+        """
+        return self.model.prepare_encoded(
+            self.corpus_index.sentence(sentence_id),
+            self.corpus_index.token_ids(sentence_id),
+            self.corpus_index.offsets(sentence_id),
+            self.corpus_index.maskable_positions(sentence_id))
+
+    def _mask_indexed(self, sentence_id: int, mask_index: int) \
+            -> Tuple[str, PreparedSentence, str, int]:
+        """
+        Mask a token of a sentence of the corpus index.
+        """
+        return self._mask(self._prepare_indexed(sentence_id), mask_index)
+
+    def _mask(self, prepared: PreparedSentence, mask_index: int) \
+            -> Tuple[str, PreparedSentence, str, int]:
+        """
+        Mask a token of a prepared sentence.
+        """
+        _, original_word, _ = self.model.mask_at(
+            prepared.text, prepared.offsets, mask_index)
+        return (prepared.text, self.model.mask_prepared(prepared, mask_index),
+                original_word, mask_index)
+
+    def find_masked_sentence(self, difficulty: float,
+                             max_attempts: int = 100) \
+            -> Optional[Tuple[str, PreparedSentence, str, int]]:
+        """
+        Draw sentences until one has a word that can be masked.
+
+        Parameters
+        ----------
+        difficulty : float
+            The difficulty level as a float (higher means more difficult).
+        max_attempts : int, optional
+            The number of sentences to try before giving up on finding a
+            maskable one, by default 100.
+
+        Returns
+        -------
+        Optional[Tuple[str, PreparedSentence, str, int]]
+            The sentence, the prepared masked sentence, the original word and
+            the index of the masked token, or None if no maskable sentence
+            was found.
+        """
+        for _ in range(max_attempts):
+            masked = self.mask_next(difficulty)
+            if masked is None:
+                return None
+            if masked[3] != -1:
+                return masked
+        return None
+
+    @property
+    def has_sentences(self) -> bool:
+        """
+        Whether sentences can be drawn and masked, rather than only read
+        from the round store.
+        """
+        return self.corpus_index is not None or self.sentences is not None
+
+    def stored_round(self, difficulty: float) -> Optional[Round]:
+        """
+        Draw a precomputed round from the round store.
+
+        Parameters
+        ----------
+        difficulty : float
+            The difficulty level as a float (higher means more difficult).
+
+        Returns
+        -------
+        Optional[Round]
+            The round, or None if there is no round store or it is empty.
+        """
+        if self.round_store is None:
+            return None
+        bundle = self.round_store.sample(difficulty)
+        if bundle is None:
+            return None
+        game_round, baseline_loss = bundle
+        if baseline_loss is not None:
+            # Scoring the guess then skips the masked baseline
+            self.model.seed_baseline_loss(
+                game_round.prepared, game_round.mask_index, baseline_loss)
+        instrumentation.count("stored_rounds")
+        return game_round
+
+    def prepare_round(self, difficulty: float,
+                      review_words: Sequence[str] = ()) -> Optional[Round]:
+        """
+        Prepare a round: mask a sentence, get the model's top predictions and
+        score them together with the original word, or read a precomputed
+        round from the round store.
+
+        A word due for review is masked in a sentence of the corpus index
+        before any other sentence is drawn.
+
+        Parameters
+        ----------
+        difficulty : float
+            The difficulty level as a float (higher means more difficult).
+        review_words : Sequence[str], optional
+            The words due for review, the first one tried first.
+
+        Returns
+        -------
+        Optional[Round]
+            The prepared round, or None if no maskable sentence was found.
+        """
+        with instrumentation.profiled("prepare"), \
+                instrumentation.timer("prepare_round"):
+            masked = self.find_review_sentence(review_words)
+            if masked is None and self.round_store is not None:
+                game_round = self.stored_round(difficulty)
+                if game_round is not None:
+                    return game_round
+                if not self.has_sentences:
+                    return None
+
+            if masked is None:
+                masked = self.find_masked_sentence(difficulty)
+            if masked is None:
+                return None
+            sentence, prepared, original_word, mask_index = masked
+
+            # Score the original word and the model's own top predictions
+            # together in a single batched forward pass. The original is
+            # scored by its token id, as the word itself may be capitalized
+            top_words = self.model.get_top_predictions(prepared)
+            fitness_scores = self.model.score_candidates(
+                prepared, [prepared.original_token_id] + top_words,
+                mask_index)
+
+        return Round(sentence, prepared.text, original_word, mask_index,
+                     fitness_scores[0],
+                     list(zip(top_words, fitness_scores[1:])), prepared)
+
+    def next_round(self, difficulty: float,
+                   review_words: Sequence[str] = ()) -> Optional[Round]:
+        """
+        Get the next round and start preparing the one after it.
+
+        The prefetched round uses the difficulty and review words known when
+        it was started, so changes take effect with a delay of one round.
+        The word of the returned round is left out of the prefetched round's
+        review words, as it is about to be reviewed.
+
+        Parameters
+        ----------
+        difficulty : float
+            The difficulty level as a float (higher means more difficult).
+        review_words : Sequence[str], optional
+            The words due for review, the first one tried first.
+
+        Returns
+        -------
+        Optional[Round]
+            The next round, or None if the corpus is exhausted.
+        """
+        if self.pending is not None:
+            game_round = self.pending.result()
+        else:
+            game_round = self.prepare_round(difficulty, review_words)
+
+        self.pending = None
+        if game_round is not None:
+            self.pending = self.executor.submit(
+                self.prepare_round, difficulty,
+                [word for word in review_words
+                 if word != game_round.original_word])
+        return game_round
+
+    def score_guess(self, game_round: Round, guess: str) -> float:
+        """
+        Calculate the fitness score of the user's guess. The masked baseline
+        is already cached from preparing the round, so only the guess itself
+        needs a forward pass.
+
+        Parameters
+        ----------
+        game_round : Round
+            The round the guess was made in.
+        guess : str
+            The word guessed by the user.
+
+        Returns
+        -------
+        float
+            The fitness score of the guess.
+        """
+        masked_sentence = game_round.masked_sentence \
+            if game_round.prepared is None else game_round.prepared
+        return self.model.score_candidates(
+            masked_sentence, [guess], game_round.mask_index)[0]
+
+    def close(self) -> None:
+        """
+        Stop the background worker, discarding any prefetched round, and
+        close the round store.
+        """
+        if self.pending is not None:
+            self.pending.cancel()
+        self.executor.shutdown(wait=True)
+        if self.round_store is not None:
+            self.round_store.close()
@@ -0,0 +1,560 @@
+import asyncio
+import json
+import uuid
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, \
+    TYPE_CHECKING
+
+from feedback import provide_context_feedback
+from model_registry import ModelRegistry
+from prepared_sentence import PreparedSentence
+from rounds import Round, RoundEngine
+from user import UserProfile, adjust_difficulty, schedule_review
+
+if TYPE_CHECKING:
+    from context_aware_model import ContextAwareTextModel
+    from worker_pool import ModelWorkerPool
+
+
+class MicroBatcher:
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]],
+                 executor: Executor, max_batch_size: int = 32,
+                 max_wait: float = 0.01) -> None:
+        """
+        Collect requests from concurrent coroutines into batches and process
+        every batch with a single call in an executor.
+
+        A batch is processed as soon as it holds `max_batch_size` requests,
+        or `max_wait` seconds after its first request arrived. Under light
+        load requests are therefore delayed by at most `max_wait`; under heavy
+        load batches fill up and throughput grows with the batch size.
+
+        Parameters
+        ----------
+        process_batch : Callable[[List[Any]], List[Any]]
+            Processes a list of requests, returning one result per request.
+        executor : Executor
+            The executor to run `process_batch` in.
+        max_batch_size : int, optional
+            The maximum number of requests per batch, by default 32.
+        max_wait : float, optional
+            The maximum time to wait for a batch to fill, in seconds, by
+            default 0.01.
+        """
+        self.process_batch = process_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.requests = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """
+        Start collecting batches on the running event loop.
+        """
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop collecting batches. Requests that are still waiting fail.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("The batcher stopped."))
+
+    async def submit(self, request: Any) -> Any:
+        """
+        Add a request to the next batch and wait for its result.
+
+        Parameters
+        ----------
+        request : Any
+            The request to process.
+
+        Returns
+        -------
+        Any
+            The result of the request.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((request, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(),
+                                                        remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            self.batches += 1
+            self.requests += len(batch)
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self.process_batch,
+                    [request for request, _ in batch])
+            except asyncio.CancelledError:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(
+                            RuntimeError("The batcher stopped."))
+                raise
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get the number of processed batches and requests.
+
+        Returns
+        -------
+        Dict[str, float]
+            The batch and request counts and the mean batch size.
+        """
+        return {'batches': self.batches, 'requests': self.requests,
+                'mean_batch_size': self.requests / max(self.batches, 1)}
+
+
+@dataclass
+class Session:
+    """
+    The state of one learner connected to the server.
+    """
+    profile: UserProfile
+    round: Optional[Round] = None
+    feedback: Optional[str] = None
+    # The corpus directory name of the language the session plays in
+    language: Optional[str] = None
+
+
+@dataclass
+class LanguageRuntime:
+    """
+    The model, round engine and batchers serving one language.
+
+    With a worker pool, the workers each have their own round engine, the
+    predictions batcher prepares whole rounds and the scores batcher scores
+    guesses, both spread over the workers.
+    """
+    model: 'ContextAwareTextModel'
+    engine: Optional[RoundEngine]
+    predictions: MicroBatcher
+    scores: MicroBatcher
+    pool: Optional['ModelWorkerPool'] = None
+
+
+class GameServer:
+    def __init__(self, registry: ModelRegistry,
+                 open_engine: Callable[[str, 'ContextAwareTextModel'],
+                                       RoundEngine],
+                 languages: Sequence[str], max_batch_size: int = 32,
+                 max_wait: float = 0.01, workers: int = 0) -> None:
+        """
+        Host the guessing game for many sessions in one or more languages,
+        micro-batching their inference requests.
+
+        The model of a language is taken from the registry when its first
+        session starts a round, so languages that map to the same model share
+        its weights. When the registry evicts a model to
+        stay within its memory budget, the languages using it are closed and
+        reopened on their next request.
+
+        Requests are JSON objects, one per line, with an "op" of
+        "start_round", "submit_guess" or "get_feedback" and a "session" id.
+        "start_round" creates the session if it is missing or unknown, in
+        its optional "language" or else the first served language.
+
+        Parameters
+        ----------
+        registry : ModelRegistry
+            Loads the model of every language.
+        open_engine : Callable[[str, ContextAwareTextModel], RoundEngine]
+            Creates the round engine of a language for its model.
+        languages : Sequence[str]
+            The corpus directory names of the served languages.
+        max_batch_size : int, optional
+            The maximum number of requests per inference batch, by default
+            32.
+        max_wait : float, optional
+            The maximum time a request waits for its batch to fill, in
+            seconds, by default 0.01.
+        workers : int, optional
+            The number of worker processes per language that prepare rounds
+            and score guesses, by default 0, which runs the model in the
+            server process. The workers are forked once the model is loaded,
+            so they share its weights, see `ModelWorkerPool`.
+        """
+        self.registry = registry
+        self.open_engine = open_engine
+        self.languages = list(languages)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.workers = workers
+        self._runtime_lock = asyncio.Lock()
+        self.sessions: Dict[str, Session] = {}
+        self.runtimes: Dict[str, LanguageRuntime] = {}
+        # All model work runs on one thread; batching provides the
+        # parallelism
+        self.executor = ThreadPoolExecutor(max_workers=1,
+                                           thread_name_prefix="model")
+
+    async def _runtime(self, language: str) -> LanguageRuntime:
+        """
+        Get the runtime of a language, opening it if it is not open or its
+        model has been evicted.
+        """
+        runtime = self._loaded_runtime(language)
+        if runtime is not None:
+            return runtime
+
+        loop = asyncio.get_running_loop()
+        # Concurrent first requests must not open a language twice
+        async with self._runtime_lock:
+            # It may have been opened while waiting for the lock
+            runtime = self._loaded_runtime(language)
+            if runtime is not None:
+                return runtime
+            model = await loop.run_in_executor(self.executor,
+                                               self.registry.get, language)
+            runtime = self.runtimes.get(language)
+            if runtime is None or runtime.model is not model:
+                if runtime is not None:
+                    await self._close_runtime(language)
+                runtime = await loop.run_in_executor(
+                    self.executor, self._open_runtime, language, model)
+                runtime.predictions.start()
+                runtime.scores.start()
+                self.runtimes[language] = runtime
+
+            # Release the languages whose model was evicted by this load
+            for other in list(self.runtimes):
+                if not self.registry.is_loaded(self.runtimes[other].model
+                                               .model_name):
+                    await self._close_runtime(other)
+        return runtime
+
+    def _loaded_runtime(self, language: str) -> Optional[LanguageRuntime]:
+        """
+        Get the runtime of a language if it is open and its model is still
+        loaded. It is returned without a trip to the model executor, so
+        concurrent requests reach the batchers together.
+        """
+        runtime = self.runtimes.get(language)
+        if runtime is not None and \
+                self.registry.touch(runtime.model.model_name):
+            return runtime
+        return None
+
+    def _open_runtime(self, language: str,
+                      model: 'ContextAwareTextModel') -> LanguageRuntime:
+        """
+        Open the round engine and batchers of a language, or fork its
+        workers, which each open their own round engine. The server process
+        runs no inference in that case, so it is safe to fork.
+        """
+        if not self.workers:
+            return LanguageRuntime(
+                model, self.open_engine(language, model),
+                MicroBatcher(model.get_top_predictions_batch, self.executor,
+                             self.max_batch_size, self.max_wait),
+                MicroBatcher(model.score_batch, self.executor,
+                             self.max_batch_size, self.max_wait))
+
+        from worker_pool import ModelWorkerPool, prepare_review_round
+
+        pool = ModelWorkerPool(model, self.workers,
+                               setup=partial(self.open_engine, language))
+        return LanguageRuntime(
+            model, None,
+            MicroBatcher(partial(pool.map, prepare_review_round),
+                         self.executor, self.max_batch_size, self.max_wait),
+            MicroBatcher(pool.score_guesses, self.executor,
+                         self.max_batch_size, self.max_wait),
+            pool)
+
+    async def _close_runtime(self, language: str) -> None:
+        runtime = self.runtimes.pop(language)
+        await runtime.predictions.stop()
+        await runtime.scores.stop()
+        if runtime.engine is not None:
+            runtime.engine.close()
+        if runtime.pool is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                self.executor, runtime.pool.close)
+
+    async def start_round(self, session_id: Optional[str],
+                          language: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Start a new round for a session.
+
+        Parameters
+        ----------
+        session_id : Optional[str]
+            The session to start a round for.
+        language : Optional[str], optional
+            The language of a new session, by default the first served
+            language. It is ignored for existing sessions.
+
+        Returns
+        -------
+        Dict[str, Any]
+            The session id and the masked sentence.
+        """
+        if session_id not in self.sessions:
+            language = language or self.languages[0]
+            if language not in self.languages:
+                raise ValueError(f"Language '{language}' is not served.")
+            session_id = session_id or uuid.uuid4().hex
+            self.sessions[session_id] = Session(UserProfile(),
+                                                language=language)
+        session = self.sessions[session_id]
+        runtime = await self._runtime(session.language)
+        engine = runtime.engine
+        difficulty = session.profile.get_average_score()
+
+        if runtime.pool is not None:
+            game_round = await runtime.predictions.submit(
+                (difficulty, session.profile.get_words_to_review()))
+            if game_round is None:
+                raise RuntimeError("The corpus does not contain any "
+                                   "maskable sentences.")
+            session.round = game_round
+            session.feedback = None
+            return {'session': session_id, 'language': session.language,
+                    'masked_sentence': game_round.masked_sentence}
+
+        loop = asyncio.get_running_loop()
+        masked = await loop.run_in_executor(
+            self.executor, engine.find_review_sentence,
+            session.profile.get_words_to_review())
+        # Precomputed rounds only need the guess to be scored
+        game_round = None
+        if masked is None:
+            game_round = await loop.run_in_executor(
+                self.executor, engine.stored_round, difficulty)
+        if game_round is None:
+            if masked is None and engine.has_sentences:
+                masked = await loop.run_in_executor(
+                    self.executor, engine.find_masked_sentence, difficulty)
+            if masked is None:
+                raise RuntimeError("The corpus does not contain any "
+                                   "maskable sentences.")
+            game_round = await self._score_round(runtime, *masked)
+
+        session.round = game_round
+        session.feedback = None
+        return {'session': session_id, 'language': session.language,
+                'masked_sentence': game_round.masked_sentence}
+
+    async def _score_round(self, runtime: LanguageRuntime, sentence: str,
+                           prepared: PreparedSentence, original_word: str,
+                           mask_index: int) -> Round:
+        """
+        Get the top predictions of a masked sentence and score them with the
+        original word, in the micro-batches of other sessions.
+        """
+        top_words = await runtime.predictions.submit(prepared)
+        fitness_scores = await runtime.scores.submit(
+            (prepared, [prepared.original_token_id] + top_words,
+             mask_index))
+        return Round(sentence, prepared.text, original_word, mask_index,
+                     fitness_scores[0],
+                     list(zip(top_words, fitness_scores[1:])), prepared)
+
+    async def submit_guess(self, session_id: str, guess: str) \
+            -> Dict[str, Any]:
+        """
+        Score a guess for the current round of a session and update the
+        session's profile.
+
+        Parameters
+        ----------
+        session_id : str
+            The session the guess belongs to.
+        guess : str
+            The word guessed by the user.
+
+        Returns
+        -------
+        Dict[str, Any]
+            The fitness of the guess and of the original word.
+        """
+        session = self._session(session_id)
+        game_round = session.round
+        if game_round is None:
+            raise ValueError("No round in progress, start a round first.")
+
+        guess = guess.strip().lower()
+        runtime = await self._runtime(session.language)
+        if runtime.pool is not None:
+            user_fitness = await runtime.scores.submit((game_round, guess))
+        else:
+            user_fitness = (await runtime.scores.submit(
+                (game_round.prepared, [guess], game_round.mask_index)))[0]
+
+        session.feedback = provide_context_feedback(
+            guess,
+            game_round.original_word,
+            user_fitness,
+            game_round.original_fitness,
+            game_round.top_words_with_fitness,
+            game_round.masked_sentence,
+            runtime.model
+        )
+        session.round = None
+
+        profile = session.profile
+        profile.update_performance(user_fitness)
+        profile.set_difficulty(adjust_difficulty(profile))
+        schedule_review(profile, game_round.original_word)
+        profile.update_review_times()
+
+        return {'session': session_id, 'fitness': user_fitness,
+                'original_word': game_round.original_word,
+                'original_fitness': game_round.original_fitness,
+                'difficulty': profile.get_current_difficulty()}
+
+    def get_feedback(self, session_id: str) -> Dict[str, Any]:
+        """
+        Get the feedback on the last guess of a session.
+
+        Parameters
+        ----------
+        session_id : str
+            The session to get the feedback for.
+
+        Returns
+        -------
+        Dict[str, Any]
+            The feedback text and the session's progress.
+        """
+        session = self._session(session_id)
+        return {'session': session_id, 'feedback': session.feedback,
+                'average_score': session.profile.get_average_score(),
+                'words_to_review': session.profile.get_words_to_review()}
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the number of sessions, the micro-batching statistics of every
+        open language and the model registry statistics.
+
+        Returns
+        -------
+        Dict[str, Any]
+            Server statistics.
+        """
+        return {'sessions': len(self.sessions),
+                'languages': {
+                    language: {'model_name': runtime.model.model_name,
+                               'predictions': runtime.predictions.stats(),
+                               'scores': runtime.scores.stats()}
+                    for language, runtime in self.runtimes.items()},
+                'models': self.registry.stats()}
+
+    def _session(self, session_id: str) -> Session:
+        if session_id not in self.sessions:
+            raise ValueError(f"Unknown session '{session_id}'.")
+        return self.sessions[session_id]
+
+    async def handle_request(self, request: Any) -> Dict[str, Any]:
+        """
+        Dispatch a single JSON request.
+
+        Parameters
+        ----------
+        request : Any
+            The decoded request, which must be a JSON object.
+
+        Returns
+        -------
+        Dict[str, Any]
+            The response, with "ok" set to False and an "error" message if
+            the request failed.
+        """
+        if not isinstance(request, dict):
+            return {'ok': False, 'error': "A request must be a JSON object."}
+        op = request.get('op')
+        session_id = request.get('session')
+        try:
+            if op == 'start_round':
+                response = await self.start_round(session_id,
+                                                  request.get('language'))
+            elif op == 'submit_guess':
+                response = await self.submit_guess(session_id,
+                                                   request.get('guess', ''))
+            elif op == 'get_feedback':
+                response = self.get_feedback(session_id)
+            elif op == 'stats':
+                response = self.stats()
+            else:
+                raise ValueError(f"Unknown op '{op}'.")
+        except Exception as error:
+            return {'ok': False, 'error': str(error)}
+        return {'ok': True, **response}
+
+    async def handle_connection(self, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter) -> None:
+        """
+        Answer JSON-lines requests on a client connection until it closes.
+        """
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError as error:
+                    response = {'ok': False,
+                                'error': f"Invalid JSON: {error}"}
+                else:
+                    response = await self.handle_request(request)
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765) -> None:
+        """
+        Listen for JSON-lines connections until cancelled.
+
+        Parameters
+        ----------
+        host : str, optional
+            The address to listen on, by default '127.0.0.1'.
+        port : int, optional
+            The port to listen on, by default 8765.
+        """
+        server = await asyncio.start_server(self.handle_connection, host,
+                                            port)
+        print(f"Serving {', '.join(self.languages)} on {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for language in list(self.runtimes):
+                await self._close_runtime(language)
+            self.executor.shutdown(wait=False)
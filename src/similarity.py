@@ -0,0 +1,265 @@
+import json
+import os
+from collections import Counter
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from cache import LRUCache
+from model_options import DEFAULT_SIMILARITY_MODEL_NAME
+
+EMBEDDINGS_FILE = 'embeddings.bin'
+WORDS_FILE = 'words.txt'
+
+# Rows of the embedding matrix converted to float32 at a time, which bounds
+# the temporary memory of a full-vocabulary product
+CHUNK_SIZE = 16384
+
+
+def load_encoder(model_name: str = DEFAULT_SIMILARITY_MODEL_NAME):
+    """
+    Load a sentence-transformers model. The import is deferred, as
+    sentence-transformers is only needed to build the embeddings and to
+    embed out-of-vocabulary words.
+
+    Parameters
+    ----------
+    model_name : str, optional
+        The name of the model, by default DEFAULT_SIMILARITY_MODEL_NAME.
+
+    Returns
+    -------
+    sentence_transformers.SentenceTransformer
+        The loaded model.
+    """
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def encode_words(encoder, words: Sequence[str], batch_size: int = 256) \
+        -> np.ndarray:
+    """
+    Embed words as unit-length float32 vectors.
+
+    Parameters
+    ----------
+    encoder : sentence_transformers.SentenceTransformer
+        The model to embed the words with.
+    words : Sequence[str]
+        The words to embed.
+    batch_size : int, optional
+        The number of words per forward pass, by default 256.
+
+    Returns
+    -------
+    np.ndarray
+        The embeddings, of shape (words, dim).
+    """
+    return np.asarray(encoder.encode(
+        list(words), batch_size=batch_size, convert_to_numpy=True,
+        normalize_embeddings=True, show_progress_bar=False),
+        dtype=np.float32)
+
+
+def build_vocabulary_embeddings(frequencies: Counter, output_dir: str,
+                                model_name: str =
+                                DEFAULT_SIMILARITY_MODEL_NAME,
+                                max_words: int = 50000,
+                                batch_size: int = 256, encoder=None) -> int:
+    """
+    Embed the most frequent words of a corpus once and store them as a
+    memory-mappable float16 matrix.
+
+    Parameters
+    ----------
+    frequencies : Counter
+        The word frequencies of the corpus.
+    output_dir : str
+        The directory to write the embeddings to.
+    model_name : str, optional
+        The sentence-transformers model to use, by default
+        DEFAULT_SIMILARITY_MODEL_NAME.
+    max_words : int, optional
+        The number of most frequent words to embed, by default 50000.
+    batch_size : int, optional
+        The number of words per forward pass, by default 256.
+    encoder : sentence_transformers.SentenceTransformer, optional
+        An already loaded model, by default `model_name` is loaded.
+
+    Returns
+    -------
+    int
+        The number of embedded words.
+    """
+    if encoder is None:
+        encoder = load_encoder(model_name)
+    words = [word for word, _ in frequencies.most_common(max_words)
+             if word.isalpha()]
+
+    os.makedirs(output_dir, exist_ok=True)
+    dim = None
+    with open(os.path.join(output_dir, EMBEDDINGS_FILE), 'wb') as file:
+        # Encode in slices, so only one slice is held in memory
+        for start in range(0, len(words), batch_size * 16):
+            embeddings = encode_words(
+                encoder, words[start:start + batch_size * 16], batch_size)
+            dim = embeddings.shape[1]
+            file.write(embeddings.astype(np.float16).tobytes())
+
+    with open(os.path.join(output_dir, WORDS_FILE), 'w',
+              encoding='utf-8') as file:
+        file.write('\n'.join(words))
+    with open(os.path.join(output_dir, 'meta.json'), 'w',
+              encoding='utf-8') as file:
+        json.dump({'model_name': model_name, 'num_words': len(words),
+                   'dim': dim}, file, indent=2)
+    return len(words)
+
+
+class SimilarityScorer:
+    def __init__(self, embedding_dir: str, encoder=None,
+                 cache_size: int = 1024) -> None:
+        """
+        Score the semantic similarity of words with the precomputed
+        vocabulary embeddings of `build_vocabulary_embeddings`.
+
+        Words in the vocabulary are looked up in the memory-mapped matrix.
+        Other words are embedded on demand by the sentence-transformers
+        model, which is only loaded when the first such word is seen, and
+        kept in an LRU cache.
+
+        Parameters
+        ----------
+        embedding_dir : str
+            The directory containing the embeddings.
+        encoder : sentence_transformers.SentenceTransformer, optional
+            The model for out-of-vocabulary words, by default the model the
+            embeddings were built with, loaded lazily.
+        cache_size : int, optional
+            The number of out-of-vocabulary embeddings to keep, by default
+            1024.
+        """
+        with open(os.path.join(embedding_dir, 'meta.json'), 'r',
+                  encoding='utf-8') as file:
+            self.meta = json.load(file)
+        with open(os.path.join(embedding_dir, WORDS_FILE), 'r',
+                  encoding='utf-8') as file:
+            self.words: List[str] = file.read().split('\n')
+        self.word_ids = {word: i for i, word in enumerate(self.words)}
+        self.model_name: str = self.meta['model_name']
+        if self.meta['num_words'] == 0:
+            # np.memmap cannot map empty files
+            self.words, self.word_ids = [], {}
+            self.embeddings = np.zeros((0, 0), dtype=np.float16)
+        else:
+            self.embeddings = np.memmap(
+                os.path.join(embedding_dir, EMBEDDINGS_FILE),
+                dtype=np.float16, mode='r',
+                shape=(self.meta['num_words'], self.meta['dim']))
+        self.encoder = encoder
+        self.cache = LRUCache(cache_size)
+
+    @staticmethod
+    def exists(embedding_dir: str) -> bool:
+        """
+        Check whether embeddings have been built in a directory.
+        """
+        return os.path.isfile(os.path.join(embedding_dir, 'meta.json'))
+
+    def embedding(self, word: str) -> np.ndarray:
+        """
+        Get the unit-length embedding of a word.
+
+        Parameters
+        ----------
+        word : str
+            The word to embed.
+
+        Returns
+        -------
+        np.ndarray
+            The float32 embedding, of shape (dim,).
+        """
+        word = word.lower()
+        if word in self.word_ids:
+            return self.embeddings[self.word_ids[word]].astype(np.float32)
+
+        vector = self.cache.get(word)
+        if vector is None:
+            if self.encoder is None:
+                self.encoder = load_encoder(self.model_name)
+            vector = encode_words(self.encoder, [word])[0]
+            self.cache.put(word, vector)
+        return vector
+
+    def similarity(self, word: str, other: str) -> float:
+        """
+        Calculate the cosine similarity of two words.
+
+        Parameters
+        ----------
+        word : str
+            The first word, e.g. the user's guess.
+        other : str
+            The second word, e.g. the original word.
+
+        Returns
+        -------
+        float
+            The cosine similarity between -1 and 1.
+        """
+        return float(np.dot(self.embedding(word), self.embedding(other)))
+
+    def similarities(self, word: str) -> np.ndarray:
+        """
+        Calculate the cosine similarity of a word to every vocabulary word.
+
+        Parameters
+        ----------
+        word : str
+            The word to compare.
+
+        Returns
+        -------
+        np.ndarray
+            The similarity to each word in `words`, of shape (words,).
+        """
+        vector = self.embedding(word)
+        scores = np.empty(len(self.words), dtype=np.float32)
+        for start in range(0, len(self.words), CHUNK_SIZE):
+            chunk = self.embeddings[start:start + CHUNK_SIZE]
+            scores[start:start + len(chunk)] = \
+                chunk.astype(np.float32) @ vector
+        return scores
+
+    def closest_words(self, word: str, top_k: int = 5,
+                      exclude: Sequence[str] = ()) -> List[Tuple[str, float]]:
+        """
+        Find the vocabulary words most similar to a word.
+
+        Parameters
+        ----------
+        word : str
+            The word to find neighbours of.
+        top_k : int, optional
+            The number of words to return, by default 5.
+        exclude : Sequence[str], optional
+            Words to leave out besides `word` itself, by default none.
+
+        Returns
+        -------
+        List[Tuple[str, float]]
+            The closest words and their similarity, most similar first.
+        """
+        scores = self.similarities(word)
+        for excluded in (word, *exclude):
+            if excluded.lower() in self.word_ids:
+                scores[self.word_ids[excluded.lower()]] = -np.inf
+
+        top_k = min(top_k, len(scores))
+        if top_k == 0:
+            return []
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.words[i], float(scores[i])) for i in top
+                if np.isfinite(scores[i])]
@@ -0,0 +1,124 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+
+class StartupTimer:
+    def __init__(self, start: Optional[float] = None) -> None:
+        """
+        Record how long each startup phase takes.
+
+        Parameters
+        ----------
+        start : Optional[float], optional
+            The `time.perf_counter()` value at which the program started, by
+            default the moment the timer is created.
+        """
+        self.start = time.perf_counter() if start is None else start
+        self.phases: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Time the enclosed block as a named phase.
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float) -> None:
+        """
+        Record the duration of a phase that was timed elsewhere.
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase.
+        seconds : float
+            The duration of the phase, in seconds.
+        """
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def report(self) -> str:
+        """
+        Format the recorded phases and the total time since startup.
+
+        Returns
+        -------
+        str
+            A human-readable startup report.
+        """
+        with self._lock:
+            phases = dict(self.phases)
+        lines = ["Startup time by phase:"]
+        for name, seconds in phases.items():
+            lines.append(f"  {name:<24}{seconds * 1000:>9.0f} ms")
+        total = time.perf_counter() - self.start
+        lines.append(f"  {'total (wall clock)':<24}{total * 1000:>9.0f} ms")
+        return "\n".join(lines)
+
+
+class BackgroundModelLoader:
+    def __init__(self, timer: StartupTimer, **model_kwargs: Any) -> None:
+        """
+        Import the model dependencies, load the ContextAwareTextModel and run
+        a warm-up forward pass in a background thread.
+
+        Phases running in the background overlap with the ones in the main
+        thread, so the startup report shows where the time went rather than
+        a sum that adds up to the wall clock time.
+
+        Parameters
+        ----------
+        timer : StartupTimer
+            The timer to record the loading phases in.
+        **model_kwargs : Any
+            Keyword arguments for ContextAwareTextModel.
+        """
+        self.timer = timer
+        self.model_kwargs = model_kwargs
+        self.model = None
+        self.error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._load, daemon=True,
+                                        name="model-loader")
+        self._thread.start()
+
+    def _load(self) -> None:
+        try:
+            with self.timer.phase("imports (torch, transformers)"):
+                from context_aware_model import ContextAwareTextModel
+
+            model = ContextAwareTextModel(**self.model_kwargs)
+            for name, seconds in model.load_timings.items():
+                self.timer.record(name, seconds)
+
+            self.timer.record("first inference", model.warm_up())
+            self.model = model
+        except BaseException as error:
+            self.error = error
+
+    def result(self):
+        """
+        Wait for the model to finish loading.
+
+        Returns
+        -------
+        ContextAwareTextModel
+            The loaded and warmed-up model.
+        """
+        start = time.perf_counter()
+        self._thread.join()
+        self.timer.record("waiting for model", time.perf_counter() - start)
+        if self.error is not None:
+            raise self.error
+        return self.model
@@ -0,0 +1,196 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Sequence
+
+
+class TranslatorBackend(ABC):
+    """
+    A service that translates a single text. Implementations do not need to
+    cache or parallelize; CachedTranslator takes care of both.
+    """
+
+    @abstractmethod
+    def translate(self, text: str, src: str, dest: str) -> str:
+        """
+        Translate a text.
+
+        Parameters
+        ----------
+        text : str
+            The text to translate.
+        src : str
+            The language code of the text.
+        dest : str
+            The language code to translate to.
+
+        Returns
+        -------
+        str
+            The translated text.
+        """
+
+
+class GoogleTranslatorBackend(TranslatorBackend):
+    def __init__(self) -> None:
+        """
+        Translate with the Google Translate web service through googletrans.
+
+        googletrans is imported lazily and every worker thread gets its own
+        client, as the client is not safe to share between threads.
+        """
+        self._local = threading.local()
+
+    def translate(self, text: str, src: str, dest: str) -> str:
+        if not hasattr(self._local, 'translator'):
+            from googletrans import Translator
+            self._local.translator = Translator()
+        return self._local.translator.translate(text, src=src, dest=dest).text
+
+
+class StubTranslatorBackend(TranslatorBackend):
+    def __init__(self, delay: float = 0.0) -> None:
+        """
+        A local stand-in for a translation service, for tests and benchmarks.
+
+        Parameters
+        ----------
+        delay : float, optional
+            The simulated latency of every request in seconds, by default 0.
+        """
+        self.delay = delay
+        self.requests = 0
+
+    def translate(self, text: str, src: str, dest: str) -> str:
+        self.requests += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return f"[{src}->{dest}] {text}"
+
+
+class CachedTranslator:
+    def __init__(self, backend: TranslatorBackend,
+                 cache_path: Optional[str] = 'data/cache/translations.sqlite',
+                 timeout: float = 5.0, max_workers: int = 4,
+                 offline_cooldown: float = 60.0) -> None:
+        """
+        Translate texts through a persistent on-disk cache, sending cache
+        misses to the backend concurrently.
+
+        Parameters
+        ----------
+        backend : TranslatorBackend
+            The service used for texts that are not cached yet.
+        cache_path : Optional[str], optional
+            The SQLite file to cache translations in, by default
+            'data/cache/translations.sqlite'. None keeps the cache in memory.
+        timeout : float, optional
+            The maximum time to wait for the backend in seconds, by default
+            5.0.
+        max_workers : int, optional
+            The maximum number of concurrent backend requests, by default 4.
+        offline_cooldown : float, optional
+            How long to skip the backend after a failed request, in seconds,
+            by default 60.0. Only cached translations are returned meanwhile.
+        """
+        self.backend = backend
+        self.timeout = timeout
+        self.offline_cooldown = offline_cooldown
+        self.offline_until = 0.0
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="translate")
+
+        if cache_path is None:
+            cache_path = ':memory:'
+        elif os.path.dirname(cache_path):
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(cache_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "src TEXT NOT NULL, dest TEXT NOT NULL, text TEXT NOT NULL, "
+            "translation TEXT NOT NULL, PRIMARY KEY (src, dest, text))")
+        self._db.commit()
+
+    def _lookup(self, texts: Sequence[str], src: str, dest: str) \
+            -> Dict[str, str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT text, translation FROM translations WHERE src = ? "
+                f"AND dest = ? AND text IN ({','.join('?' * len(texts))})",
+                [src, dest, *texts]).fetchall()
+        return dict(rows)
+
+    def _store(self, translations: Dict[str, str], src: str, dest: str) \
+            -> None:
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)",
+                [(src, dest, text, translation)
+                 for text, translation in translations.items()])
+            self._db.commit()
+
+    def translate_many(self, texts: Sequence[str], src: str, dest: str) \
+            -> List[Optional[str]]:
+        """
+        Translate several texts, serving repeated texts from the cache.
+
+        Parameters
+        ----------
+        texts : Sequence[str]
+            The texts to translate.
+        src : str
+            The language code of the texts.
+        dest : str
+            The language code to translate to.
+
+        Returns
+        -------
+        List[Optional[str]]
+            The translation of every text, or None where the backend failed,
+            timed out or is considered offline.
+        """
+        unique = list(dict.fromkeys(texts))
+        if not unique:
+            return []
+        translations = self._lookup(unique, src, dest)
+        misses = [text for text in unique if text not in translations]
+
+        if misses and time.monotonic() >= self.offline_until:
+            futures = {self.executor.submit(
+                self.backend.translate, text, src, dest): text
+                for text in misses}
+            done, not_done = wait(futures, timeout=self.timeout)
+
+            fetched = {}
+            for future in done:
+                if future.exception() is None:
+                    fetched[futures[future]] = future.result()
+            for future in not_done:
+                future.cancel()
+
+            if len(fetched) < len(misses):
+                # Stop waiting on a service that is unreachable for a while
+                self.offline_until = time.monotonic() + self.offline_cooldown
+            if fetched:
+                self._store(fetched, src, dest)
+                translations.update(fetched)
+
+        return [translations.get(text) for text in texts]
+
+    def translate(self, text: str, src: str, dest: str) -> Optional[str]:
+        """
+        Translate a single text, see `translate_many`.
+        """
+        return self.translate_many([text], src, dest)[0]
+
+    def close(self) -> None:
+        """
+        Stop the worker threads and close the cache.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            self._db.close()
@@ -1,24 +1,188 @@
+import heapq
+import os
 import random
-from typing import List, Dict
+import sqlite3
+from array import array
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+# The number of recent scores kept in a profile's performance history
+HISTORY_SIZE = 20
+
+
+class ReviewScheduler:
+    def __init__(self, current_round: int = 0) -> None:
+        """
+        Schedule words for review on a global round counter.
+
+        Due rounds are absolute, so advancing time is O(1) instead of
+        decrementing every entry. Scheduled words sit in a min-heap keyed by
+        their due round and move to the due set when their round comes, so
+        finding due words costs O(log n) per word that became due.
+
+        Parameters
+        ----------
+        current_round : int, optional
+            The round the counter starts at, by default 0.
+        """
+        self.current_round = current_round
+        # Heap of (due round, sequence number, word). Rescheduled or removed
+        # words leave stale entries behind, which are skipped when popped.
+        self._heap: List[Tuple[int, int, str]] = []
+        self._entries: Dict[str, Tuple[int, int]] = {}
+        self._due: Dict[str, None] = {}
+        self._sequence = 0
+        # Words changed since the last save, for incremental persistence
+        self.dirty: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._entries
+
+    def schedule(self, word: str, delay: int) -> None:
+        """
+        Schedule a word for review, replacing any earlier schedule.
+
+        Parameters
+        ----------
+        word : str
+            The word to review.
+        delay : int
+            The number of rounds until the word is due.
+        """
+        self._push(word, self.current_round + delay)
+        self.dirty.add(word)
+
+    def _push(self, word: str, due_round: int) -> None:
+        self._sequence += 1
+        self._entries[word] = (due_round, self._sequence)
+        self._due.pop(word, None)
+        heapq.heappush(self._heap, (due_round, self._sequence, word))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+
+    def remove(self, word: str) -> None:
+        """
+        Stop reviewing a word.
+
+        Parameters
+        ----------
+        word : str
+            The word to remove.
+        """
+        if self._entries.pop(word, None) is not None:
+            self._due.pop(word, None)
+            self.dirty.add(word)
+
+    def advance(self, rounds: int = 1) -> None:
+        """
+        Move the round counter forward.
+
+        Parameters
+        ----------
+        rounds : int, optional
+            The number of rounds that passed, by default 1.
+        """
+        self.current_round += rounds
+
+    def due_words(self) -> List[str]:
+        """
+        Get the words that are due for review, earliest first.
+
+        Returns
+        -------
+        List[str]
+            The due words.
+        """
+        while self._heap and self._heap[0][0] <= self.current_round:
+            due_round, sequence, word = heapq.heappop(self._heap)
+            if self._entries.get(word) == (due_round, sequence):
+                self._due[word] = None
+        return list(self._due)
+
+    def due_round(self, word: str) -> Optional[int]:
+        """
+        Get the round at which a word is due.
+
+        Parameters
+        ----------
+        word : str
+            The word to look up.
+
+        Returns
+        -------
+        Optional[int]
+            The due round, or None if the word is not scheduled.
+        """
+        entry = self._entries.get(word)
+        return None if entry is None else entry[0]
+
+    def items(self) -> Iterator[Tuple[str, int]]:
+        """
+        Iterate over all scheduled words and their due rounds.
+
+        Yields
+        ------
+        Tuple[str, int]
+            A word and the round at which it is due.
+        """
+        for word, (due_round, _) in self._entries.items():
+            yield word, due_round
+
+    def load(self, items: List[Tuple[str, int]]) -> None:
+        """
+        Replace the schedule with saved words and due rounds in O(n).
+
+        Parameters
+        ----------
+        items : List[Tuple[str, int]]
+            The words and the rounds at which they are due.
+        """
+        self._entries = {}
+        self._due = {}
+        self._heap = []
+        for word, due_round in items:
+            self._sequence += 1
+            self._entries[word] = (due_round, self._sequence)
+            self._heap.append((due_round, self._sequence, word))
+        heapq.heapify(self._heap)
+        self.dirty.clear()
+
+    def _compact(self) -> None:
+        """
+        Drop stale heap entries left behind by rescheduled or removed words.
+        """
+        self._heap = [(due_round, sequence, word)
+                      for word, (due_round, sequence) in self._entries.items()
+                      if word not in self._due]
+        heapq.heapify(self._heap)
 
 
 class UserProfile:
-    def __init__(self) -> None:
+    def __init__(self, user_id: str = 'default') -> None:
         """
         Initialize a UserProfile instance.
 
+        Parameters
+        ----------
+        user_id : str, optional
+            The identifier the profile is stored under, by default 'default'.
+
         Attributes
         ----------
         difficulty : str
             Current difficulty level.
-        performance_history : List[float]
-            History of user performance scores.
-        words_to_review : Dict[str, int]
-            Dictionary of words and their respective review times.
+        performance_history : Deque[float]
+            Ring buffer of the most recent user performance scores.
+        review_scheduler : ReviewScheduler
+            The words to review and the rounds at which they are due.
         """
+        self.user_id = user_id
         self.difficulty = 'easy'
-        self.performance_history: List[float] = []
-        self.words_to_review: Dict[str, int] = {}
+        self.performance_history: Deque[float] = deque(maxlen=HISTORY_SIZE)
+        self.review_scheduler = ReviewScheduler()
 
     def update_performance(self, fitness: float) -> None:
         """
@@ -29,9 +193,8 @@ class UserProfile:
         fitness : float
             The fitness score to be added to the performance history.
         """
+        # The deque drops the oldest score once it holds HISTORY_SIZE
         self.performance_history.append(fitness)
-        if len(self.performance_history) > 20:
-            self.performance_history.pop(0)
 
     def get_average_score(self) -> float:
         """
@@ -77,9 +240,9 @@ class UserProfile:
         word : str
             The word to be added to the review list.
         review_time : int
-            The time until the word should be reviewed.
+            The number of rounds until the word should be reviewed.
         """
-        self.words_to_review[word] = review_time
+        self.review_scheduler.schedule(word, review_time)
 
     def get_words_to_review(self) -> List[str]:
         """
@@ -90,15 +253,113 @@ class UserProfile:
         List[str]
             The list of words that need to be reviewed.
         """
-        return [word for word, time in self.words_to_review.items()
-                if time <= 0]
+        return self.review_scheduler.due_words()
 
     def update_review_times(self) -> None:
         """
-        Update the review times for all words in the review list.
+        Advance the review clock by one round.
+        """
+        self.review_scheduler.advance()
+
+
+class ProfileStore:
+    def __init__(self, path: str = 'data/profiles.sqlite') -> None:
+        """
+        Persist user profiles in SQLite.
+
+        Review words are stored one row per word and saved incrementally, so
+        a profile with tens of thousands of review words only writes the
+        words that changed in a round.
+
+        Parameters
+        ----------
+        path : str, optional
+            The SQLite file to store the profiles in, by default
+            'data/profiles.sqlite'.
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS profiles (
+                user_id TEXT PRIMARY KEY,
+                difficulty TEXT NOT NULL,
+                current_round INTEGER NOT NULL,
+                history BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS reviews (
+                user_id TEXT NOT NULL,
+                word TEXT NOT NULL,
+                due_round INTEGER NOT NULL,
+                PRIMARY KEY (user_id, word)
+            ) WITHOUT ROWID;
+        """)
+
+    def load(self, user_id: str) -> UserProfile:
+        """
+        Load a profile, or create a new one if it was never saved.
+
+        Parameters
+        ----------
+        user_id : str
+            The identifier of the profile.
+
+        Returns
+        -------
+        UserProfile
+            The stored profile.
+        """
+        profile = UserProfile(user_id)
+        row = self._db.execute(
+            "SELECT difficulty, current_round, history FROM profiles "
+            "WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return profile
+
+        difficulty, current_round, history = row
+        profile.difficulty = difficulty
+        # The history is stored as packed doubles
+        profile.performance_history.extend(array('d', history))
+        profile.review_scheduler.current_round = current_round
+        profile.review_scheduler.load(self._db.execute(
+            "SELECT word, due_round FROM reviews WHERE user_id = ?",
+            (user_id,)).fetchall())
+        return profile
+
+    def save(self, profile: UserProfile) -> None:
+        """
+        Save a profile, writing only the review words that changed.
+
+        Parameters
+        ----------
+        profile : UserProfile
+            The profile to save.
+        """
+        scheduler = profile.review_scheduler
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?)",
+                (profile.user_id, profile.difficulty,
+                 scheduler.current_round,
+                 array('d', profile.performance_history).tobytes()))
+
+            changed = [(word, scheduler.due_round(word))
+                       for word in scheduler.dirty]
+            self._db.executemany(
+                "INSERT OR REPLACE INTO reviews VALUES (?, ?, ?)",
+                [(profile.user_id, word, due_round)
+                 for word, due_round in changed if due_round is not None])
+            self._db.executemany(
+                "DELETE FROM reviews WHERE user_id = ? AND word = ?",
+                [(profile.user_id, word)
+                 for word, due_round in changed if due_round is None])
+        scheduler.dirty.clear()
+
+    def close(self) -> None:
+        """
+        Close the database.
         """
-        for word in self.words_to_review:
-            self.words_to_review[word] -= 1
+        self._db.close()
 
 
 def schedule_review(user_profile: UserProfile, word: str) -> None:
@@ -0,0 +1,151 @@
+import os
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from prepared_sentence import is_maskable_token
+
+# Bump when the layout or meaning of the tables changes
+VOCABULARY_VERSION = 1
+
+# Where the game caches the tables of every model it loads. The cached rarity
+# is the token id proxy: a model is shared by all languages, so no single
+# corpus ranks its tokens
+VOCABULARY_DIR = 'data/vocabulary'
+
+
+@dataclass
+class VocabularyTables:
+    """
+    Per-token-id lookup tables of a tokenizer's vocabulary.
+    """
+    # Whether every token id is a whole alphabetic word, i.e. a token that can
+    # be masked and a prediction that can be played
+    words: np.ndarray
+    # The rarity of every token id, from 0 for the most frequent word to 1 for
+    # the rarest. Without corpus frequencies the token id order is used.
+    rarity: np.ndarray
+
+
+def build_vocabulary_tables(tokenizer,
+                            frequencies: Optional[Counter] = None) \
+        -> VocabularyTables:
+    """
+    Classify every token of a vocabulary once, so checks per token become
+    array lookups.
+
+    Parameters
+    ----------
+    tokenizer : transformers.PreTrainedTokenizerFast
+        The tokenizer to build the tables for.
+    frequencies : Optional[Counter], optional
+        The word frequencies of a corpus to rank the tokens by, by default
+        the token ids are used as a proxy.
+
+    Returns
+    -------
+    VocabularyTables
+        The tables, with one entry per token id.
+    """
+    size = len(tokenizer)
+    tokens = tokenizer.convert_ids_to_tokens(list(range(size)))
+    special_tokens = set(tokenizer.all_special_tokens)
+    words = np.array([is_maskable_token(token, special_tokens)
+                      for token in tokens], dtype=bool)
+
+    if not frequencies:
+        rarity = np.arange(size, dtype=np.float32) / max(size - 1, 1)
+        return VocabularyTables(words, rarity)
+
+    # Map the corpus words to token ids with the tokenizer itself, so its
+    # normalization (lowercasing, accent stripping) is applied. Tokens of
+    # words that never appear on their own are treated as the rarest.
+    ranked = [word for word, _ in frequencies.most_common()]
+    rarity = np.ones(size, dtype=np.float32)
+    if ranked:
+        scale = max(len(ranked) - 1, 1)
+        encoded = tokenizer(ranked, add_special_tokens=False)['input_ids']
+        # Walk from the rarest word, so the most frequent spelling of a token
+        # is written last
+        for rank in range(len(ranked) - 1, -1, -1):
+            if len(encoded[rank]) == 1:
+                rarity[encoded[rank][0]] = rank / scale
+    return VocabularyTables(words, rarity)
+
+
+def save_vocabulary_tables(tables: VocabularyTables, path: str,
+                           model_name: str) -> None:
+    """
+    Write vocabulary tables to an .npz file.
+
+    Parameters
+    ----------
+    tables : VocabularyTables
+        The tables to write.
+    path : str
+        The file to write.
+    model_name : str
+        The name of the tokenizer's model, checked when loading.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    np.savez(path, words=tables.words, rarity=tables.rarity,
+             model_name=np.array(model_name),
+             version=np.array(VOCABULARY_VERSION))
+
+
+def load_vocabulary_tables(tokenizer, path: str) -> VocabularyTables:
+    """
+    Load the vocabulary tables of a tokenizer from disk, building and saving
+    them first if they are missing or were built for another tokenizer.
+
+    The cached rarity ranks tokens by id, as a proxy for their frequency.
+    Corpus frequencies only rank the tokens in `build_corpus_index`, which
+    builds its own tables and stores the resulting difficulty index.
+
+    Parameters
+    ----------
+    tokenizer : transformers.PreTrainedTokenizerFast
+        The tokenizer the tables belong to.
+    path : str
+        The .npz file the tables are cached in.
+
+    Returns
+    -------
+    VocabularyTables
+        The tables, with one entry per token id.
+    """
+    if os.path.isfile(path):
+        with np.load(path) as cached:
+            if int(cached['version']) == VOCABULARY_VERSION and \
+                    str(cached['model_name']) == tokenizer.name_or_path and \
+                    len(cached['words']) == len(tokenizer):
+                return VocabularyTables(cached['words'], cached['rarity'])
+
+    tables = build_vocabulary_tables(tokenizer)
+    save_vocabulary_tables(tables, path, tokenizer.name_or_path)
+    return tables
+
+
+def vocabulary_cache_path(model_name: str,
+                          cache_dir: str = VOCABULARY_DIR) -> str:
+    """
+    Get the file the vocabulary tables of a model are cached in.
+
+    Parameters
+    ----------
+    model_name : str
+        The name or path of the model.
+    cache_dir : str, optional
+        The directory of the cached tables, by default VOCABULARY_DIR.
+
+    Returns
+    -------
+    str
+        The path of the .npz file.
+    """
+    name = model_name.strip('/').replace('/', '--')
+    return os.path.join(cache_dir, f'{name}.npz')
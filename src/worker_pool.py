@@ -0,0 +1,299 @@
+import multiprocessing
+import os
+import queue
+import random
+import threading
+import traceback
+from typing import Any, Callable, Dict, Iterable, List, Optional, \
+    Sequence, Tuple, TYPE_CHECKING
+
+import numpy as np
+import torch
+
+from resource_usage import process_memory_mb
+from rounds import Round, RoundEngine
+
+if TYPE_CHECKING:
+    from context_aware_model import ContextAwareTextModel
+
+
+def _worker_main(model: 'ContextAwareTextModel',
+                 setup: Optional[Callable[['ContextAwareTextModel'], Any]],
+                 threads: int, cores: Optional[List[int]],
+                 tasks: multiprocessing.Queue,
+                 results: multiprocessing.Queue) -> None:
+    """
+    Run tasks in a forked worker until the pool sends None.
+    """
+    torch.set_num_threads(threads)
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    # Forked workers inherit the parent's random state; without a reseed
+    # they would all draw the same sentences
+    random.seed()
+    np.random.seed()
+
+    state = None
+    try:
+        try:
+            state = setup(model) if setup is not None else model
+        except Exception:
+            # A task id of None tells the pool that the worker failed to start
+            results.put((None, False, traceback.format_exc()))
+            return
+
+        while (task := tasks.get()) is not None:
+            task_id, function, item = task
+            try:
+                results.put((task_id, True, function(state, item)))
+            except Exception:
+                results.put((task_id, False, traceback.format_exc()))
+    finally:
+        if hasattr(state, 'close'):
+            state.close()
+
+
+class ModelWorkerPool:
+    def __init__(self, model: 'ContextAwareTextModel',
+                 workers: Optional[int] = None, threads_per_worker: int = 1,
+                 setup: Optional[Callable[['ContextAwareTextModel'], Any]] =
+                 None, pin: bool = True, poll_interval: float = 1.0) -> None:
+        """
+        Spread model work over worker processes that share one copy of the
+        weights.
+
+        The model is loaded once in the parent and the workers are forked
+        from it, so the weights stay in pages shared copy-on-write by all
+        processes instead of being loaded again by every worker. Each worker
+        runs its own small number of intra-op threads, optionally pinned to
+        its own cores, which suits many small forward passes better than one
+        process with all threads.
+
+        Run no inference in the parent before the pool is started; forking a
+        process whose thread pools are busy is unsafe.
+
+        Parameters
+        ----------
+        model : ContextAwareTextModel
+            The loaded model.
+        workers : Optional[int], optional
+            The number of worker processes, by default one per core divided
+            by `threads_per_worker`.
+        threads_per_worker : int, optional
+            The intra-op threads of every worker, by default 1.
+        setup : Optional[Callable[[ContextAwareTextModel], Any]], optional
+            Creates the per-worker state passed to the tasks (e.g. a
+            RoundEngine, see `open_round_engine`), by default the model
+            itself. A state with a `close` method is closed on shutdown.
+        pin : bool, optional
+            Whether to pin every worker to its own cores, by default True.
+        poll_interval : float, optional
+            How often, in seconds, to check that the workers are still alive
+            while waiting for results, by default 1.
+        """
+        cores = sorted(os.sched_getaffinity(0)) \
+            if hasattr(os, 'sched_getaffinity') else []
+        self.workers = workers or max(
+            (len(cores) or os.cpu_count() or 1) // threads_per_worker, 1)
+        self.threads_per_worker = threads_per_worker
+        self.poll_interval = poll_interval
+
+        context = multiprocessing.get_context('fork')
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._lock = threading.Lock()
+        self._next_task = 0
+        self.processes = []
+        for index in range(self.workers):
+            worker_cores = None
+            if pin and cores:
+                # Round-robin when there are more threads than cores
+                worker_cores = [
+                    cores[(index * threads_per_worker + i) % len(cores)]
+                    for i in range(threads_per_worker)]
+            process = context.Process(
+                target=_worker_main,
+                args=(model, setup, threads_per_worker, worker_cores,
+                      self._tasks, self._results),
+                daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    def map(self, function: Callable[[Any, Any], Any],
+            items: Iterable[Any]) -> List[Any]:
+        """
+        Apply a function to every item in the workers.
+
+        Parameters
+        ----------
+        function : Callable[[Any, Any], Any]
+            A module-level function called as `function(state, item)` with
+            the worker's state.
+        items : Iterable[Any]
+            The items, which must be picklable, as must the results.
+
+        Returns
+        -------
+        List[Any]
+            The results, in the order of the items.
+
+        Raises
+        ------
+        RuntimeError
+            If a task failed, or a worker failed to start or died.
+        """
+        with self._lock:
+            first = self._next_task
+            for item in items:
+                self._tasks.put((self._next_task, function, item))
+                self._next_task += 1
+
+            results: Dict[int, Any] = {}
+            failure = None
+            while len(results) < self._next_task - first:
+                try:
+                    task_id, ok, result = self._results.get(
+                        timeout=self.poll_interval)
+                except queue.Empty:
+                    self._check_workers()
+                    continue
+                if task_id is None:
+                    raise RuntimeError(
+                        f"A worker failed to start:\n{result}")
+                if task_id < first:
+                    # Left over from a map that failed
+                    continue
+                results[task_id] = result
+                if not ok and failure is None:
+                    failure = result
+            if failure is not None:
+                raise RuntimeError(f"A worker task failed:\n{failure}")
+            return [results[task_id]
+                    for task_id in range(first, self._next_task)]
+
+    def _check_workers(self) -> None:
+        """
+        Raise if a worker has exited, e.g. because it was killed for using
+        too much memory; its tasks would never finish.
+        """
+        for process in self.processes:
+            if process.exitcode is not None:
+                raise RuntimeError(f"Worker process {process.pid} exited "
+                                   f"with code {process.exitcode}.")
+
+    def prepare_rounds(self, difficulties: Iterable[float]) \
+            -> List[Optional[Round]]:
+        """
+        Prepare a round per difficulty, spread over the workers. The pool
+        must have been created with `open_round_engine`.
+
+        Parameters
+        ----------
+        difficulties : Iterable[float]
+            The difficulty of every round.
+
+        Returns
+        -------
+        List[Optional[Round]]
+            The rounds, None where no maskable sentence was found.
+        """
+        return self.map(prepare_round, difficulties)
+
+    def score_guesses(self, guesses: Iterable[Tuple[Round, str]]) \
+            -> List[float]:
+        """
+        Score guesses for rounds, spread over the workers. The pool must have
+        been created with `open_round_engine`.
+
+        Parameters
+        ----------
+        guesses : Iterable[Tuple[Round, str]]
+            The round and the guessed word of every guess.
+
+        Returns
+        -------
+        List[float]
+            The fitness score of every guess.
+        """
+        return self.map(score_guess, guesses)
+
+    def memory(self) -> List[Optional[Dict[str, float]]]:
+        """
+        Get the shared and private memory of every worker, see
+        `process_memory_mb`.
+        """
+        return [process_memory_mb(process.pid) for process in self.processes]
+
+    def close(self) -> None:
+        """
+        Stop the workers once they finish their current task.
+        """
+        for _ in self.processes:
+            self._tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+
+    def __enter__(self) -> 'ModelWorkerPool':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def open_round_engine(corpus_index_dir: Optional[str] = None,
+                      corpus_files: Optional[List[str]] = None) \
+        -> Callable[['ContextAwareTextModel'], RoundEngine]:
+    """
+    Get a pool setup function that gives every worker its own RoundEngine,
+    drawing from a corpus index or from its own shuffled corpus stream.
+
+    Parameters
+    ----------
+    corpus_index_dir : Optional[str], optional
+        The directory of a corpus index built for the model.
+    corpus_files : Optional[List[str]], optional
+        The corpus files to stream when there is no index.
+
+    Returns
+    -------
+    Callable[[ContextAwareTextModel], RoundEngine]
+        The setup function for `ModelWorkerPool`.
+    """
+    def setup(model: 'ContextAwareTextModel') -> RoundEngine:
+        from corpus_index import CorpusIndex
+        from data_processing import sentence_stream
+
+        if corpus_index_dir is not None:
+            return RoundEngine(model, corpus_index=CorpusIndex(
+                corpus_index_dir))
+        return RoundEngine(model, sentences=sentence_stream(corpus_files))
+    return setup
+
+
+def prepare_round(engine: RoundEngine, difficulty: float) -> Optional[Round]:
+    """
+    Prepare a round in a worker, see `RoundEngine.prepare_round`.
+    """
+    return engine.prepare_round(difficulty)
+
+
+def prepare_review_round(engine: RoundEngine,
+                         request: Tuple[float, Sequence[str]]) \
+        -> Optional[Round]:
+    """
+    Prepare a round for a difficulty and the words due for review in a
+    worker, see `RoundEngine.prepare_round`.
+    """
+    difficulty, review_words = request
+    return engine.prepare_round(difficulty, review_words)
+
+
+def score_guess(engine: RoundEngine, guess: Tuple[Round, str]) -> float:
+    """
+    Score a guess in a worker, see `RoundEngine.score_guess`.
+    """
+    game_round, word = guess
+    return engine.score_guess(game_round, word)
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmark import build_tiny_model, synthetic_sentences  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def tiny_model(tmp_path_factory):
+    """
+    A tiny, randomly initialized BERT saved to disk, and its whole words.
+    """
+    directory = str(tmp_path_factory.mktemp('tiny-bert'))
+    words = build_tiny_model(directory, vocab_size=300, seed=0)
+    return directory, words
+
+
+@pytest.fixture(scope='session')
+def sentences(tiny_model):
+    _, words = tiny_model
+    return synthetic_sentences(words, 40, max_length=12, seed=0)
+
+
+@pytest.fixture(scope='session')
+def model(tiny_model):
+    from context_aware_model import ContextAwareTextModel
+
+    return ContextAwareTextModel(tiny_model[0])
@@ -0,0 +1,45 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cache import CacheInfo, LRUCache  # noqa: E402
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    # Reading 'a' makes 'b' the least recently used entry
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def test_lru_cache_counts_hits_and_misses():
+    cache = LRUCache(maxsize=4)
+    cache.put('a', 1)
+    cache.get('a')
+    cache.get('a')
+    cache.get('missing')
+    assert cache.info() == CacheInfo(hits=2, misses=1, maxsize=4,
+                                     currsize=1)
+
+    cache.clear()
+    assert cache.info() == CacheInfo(hits=0, misses=0, maxsize=4,
+                                     currsize=0)
+
+
+def test_lru_cache_put_replaces_value():
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.put('a', 3)
+    cache.put('c', 4)
+    # Replacing 'a' marked it as recently used, so 'b' was evicted
+    assert cache.get('a') == 3
+    assert cache.get('b') is None
@@ -0,0 +1,142 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from context_aware_model import ContextAwareTextModel  # noqa: E402
+
+
+def masked_round(model, sentence, position=0):
+    """
+    Mask the `position`-th maskable token of a sentence.
+    """
+    prepared = model.prepare(sentence)
+    mask_index = prepared.maskable_positions[position]
+    return model.mask_prepared(prepared, mask_index), mask_index
+
+
+def reference_fitness(model, masked, word):
+    """
+    Score a word with unbatched forward passes of the underlying model: the
+    masked sentence and the sentence with the word in place of the mask,
+    both compared with the masked sentence.
+    """
+    labels = torch.tensor([masked.input_ids])
+    filled = model.tokenizer(masked.text.replace(model.tokenizer.mask_token,
+                                                 word),
+                             return_tensors='pt')['input_ids']
+    with torch.no_grad():
+        loss_masked = model.model(input_ids=labels, labels=labels).loss
+        loss_word = model.model(input_ids=filled, labels=labels).loss
+    return float(torch.exp(loss_masked) / torch.exp(loss_word))
+
+
+def test_score_candidates_matches_unbatched_forwards(model, sentences):
+    masked, mask_index = masked_round(model, sentences[0], position=1)
+    candidates = model.get_top_predictions(masked, top_k=4)
+
+    scores = model.score_candidates(masked, candidates, mask_index)
+    assert scores == pytest.approx(
+        [reference_fitness(model, masked, word) for word in candidates],
+        rel=1e-4)
+
+
+def test_score_candidates_matches_calculate_perplexity(model, sentences):
+    masked, mask_index = masked_round(model, sentences[1])
+    words = model.get_top_predictions(masked, top_k=3)
+
+    expected = []
+    for word in words:
+        perplexity_masked, perplexity_word = model.calculate_perplexity(
+            masked, word, mask_index)
+        expected.append(model.calculate_fitness_score(perplexity_masked,
+                                                      perplexity_word))
+    assert model.score_candidates(masked, words, mask_index) == \
+        pytest.approx(expected)
+
+
+def test_score_batch_matches_single_sentences(model, sentences):
+    # Sentences of different lengths are padded together in one batch
+    requests = []
+    for sentence in sentences[2:6]:
+        masked, mask_index = masked_round(model, sentence)
+        requests.append((masked, model.get_top_predictions(masked, top_k=3),
+                         mask_index))
+
+    batched = model.score_batch(requests)
+    model.cache.clear()
+    for request, scores in zip(requests, batched):
+        assert scores == pytest.approx(model.score_batch([request])[0],
+                                       rel=1e-4)
+
+
+def test_original_word_is_scored_by_its_token(model, sentences):
+    # Synthetic sentences start with a capitalized word, which the uncased
+    # vocabulary only has in lowercase
+    prepared = model.prepare(sentences[0])
+    masked = model.mask_prepared(prepared, 0)
+    start, end = prepared.offsets[0]
+    original_word = prepared.text[start:end]
+    assert original_word != original_word.lower()
+    assert masked.original_token_id == prepared.input_ids[1]
+
+    by_word, by_token, by_id = model.score_candidates(
+        masked, [original_word, original_word.lower(),
+                 masked.original_token_id], 0)
+    assert by_word == by_token == by_id
+    assert by_id == pytest.approx(
+        reference_fitness(model, masked, original_word.lower()), rel=1e-4)
+
+
+def test_candidate_token_ids(model, tiny_model):
+    _, words = tiny_model
+    unknown = model.tokenizer.unk_token_id
+    token_id = model.tokenizer.convert_tokens_to_ids(words[0])
+    assert model.candidate_token_ids(
+        [words[0], words[0].upper(), 'zzzzzzzzzz', token_id]) == \
+        [token_id, token_id, unknown, token_id]
+
+
+def test_logit_scoring_reads_the_masked_position(tiny_model, sentences):
+    model = ContextAwareTextModel(tiny_model[0], scoring='logit')
+    masked, mask_index = masked_round(model, sentences[3], position=2)
+    words = model.get_top_predictions(masked, top_k=3)
+
+    with torch.no_grad():
+        logits = model.model(
+            input_ids=torch.tensor([masked.input_ids])).logits
+    log_probs = torch.log_softmax(logits[0, mask_index + 1], dim=-1)
+    expected = model.calibrate_logit_scores(
+        log_probs, log_probs.max().item())[
+            model.tokenizer.convert_tokens_to_ids(words)]
+
+    assert model.score_candidates(masked, words, mask_index) == \
+        pytest.approx(expected.tolist(), rel=1e-4)
+    # The top prediction has the highest log-probability, so it scores 1
+    assert model.score_candidates(masked, words[:1], mask_index)[0] == \
+        pytest.approx(1.0)
+
+
+def test_top_predictions_are_whole_words(model, sentences):
+    masked, _ = masked_round(model, sentences[4])
+    predictions = model.get_top_predictions(masked, top_k=10)
+    assert len(predictions) == 10
+    token_ids = model.tokenizer.convert_tokens_to_ids(predictions)
+    assert all(model.vocabulary.words[token_id] for token_id in token_ids)
+
+
+def test_windowed_scoring_matches_full_context_for_short_sentences(
+        tiny_model, sentences):
+    full = ContextAwareTextModel(tiny_model[0], context_window=None)
+    windowed = ContextAwareTextModel(tiny_model[0], context_window=64)
+    masked, mask_index = masked_round(full, sentences[5])
+    words = full.get_top_predictions(masked, top_k=3)
+    assert windowed.score_candidates(masked, words, mask_index) == \
+        pytest.approx(full.score_candidates(masked, words, mask_index),
+                      rel=1e-4)
+    assert np.isclose(windowed.baseline_loss(masked, mask_index),
+                      full.baseline_loss(masked, mask_index), rtol=1e-4)
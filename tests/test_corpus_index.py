@@ -0,0 +1,62 @@
+import os
+import sys
+
+import pytest
+from nltk.tokenize.punkt import PunktSentenceTokenizer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import corpus_index  # noqa: E402
+import data_processing  # noqa: E402
+from corpus_index import CorpusIndex, build_corpus_index  # noqa: E402
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch, model, sentences):
+    # The NLTK punkt data is not needed to split and count this corpus
+    monkeypatch.setattr(data_processing, '_PUNKT_TOKENIZER',
+                        PunktSentenceTokenizer())
+    monkeypatch.setattr(corpus_index, 'preprocess_text',
+                        lambda text: text.lower().split())
+    path = tmp_path / 'corpus.txt'
+    path.write_text(' '.join(sentences[:20]), encoding='utf-8')
+    index_dir = str(tmp_path / 'index')
+    assert build_corpus_index([str(path)], index_dir, model.tokenizer,
+                              batch_size=7) == 20
+    return CorpusIndex(index_dir)
+
+
+def test_corpus_index_stores_tokenized_sentences(index, model, sentences):
+    assert len(index) == 20
+    for sentence_id in (0, 7, 19):
+        sentence = index.sentence(sentence_id)
+        assert sentence == sentences[sentence_id]
+        prepared = model.prepare(sentence)
+        assert index.token_ids(sentence_id).tolist() == prepared.token_ids
+        assert [tuple(span) for span in
+                index.offsets(sentence_id).tolist()] == prepared.offsets
+        assert index.maskable_positions(sentence_id).tolist() == \
+            list(prepared.maskable_positions)
+
+    frequencies = index.frequencies()
+    first_word = sentences[0].split()[0].lower()
+    assert frequencies[first_word] >= 1
+
+
+@pytest.mark.parametrize('difficulty', [0.0, 0.5, 1.0])
+def test_sample_position_returns_maskable_positions(index, difficulty):
+    for _ in range(20):
+        sentence_id, position = index.sample_position(difficulty)
+        assert 0 <= sentence_id < len(index)
+        assert position in index.maskable_positions(sentence_id)
+
+
+def test_sample_token_returns_occurrences(index):
+    token_id = int(index.token_ids(3)[index.maskable_positions(3)[0]])
+    for _ in range(10):
+        sentence_id, position = index.sample_token(token_id)
+        assert int(index.token_ids(sentence_id)[position]) == token_id
+        assert position in index.maskable_positions(sentence_id)
+
+    assert index.sample_token(-1) is None
+    assert index.sample_token(10 ** 9) is None
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+from nltk.tokenize.punkt import PunktSentenceTokenizer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from data_processing import stream_sentences  # noqa: E402
+
+TEXT = ("The quick brown fox jumps over the lazy dog. Another sentence "
+        "here.\nDr. Smith arrived at 5 p.m. on Monday.  It rained!\n\n"
+        "Was it late? Yes, it was late.\tThe end.\n")
+
+
+@pytest.fixture
+def corpus_file(tmp_path):
+    path = tmp_path / 'corpus.txt'
+    path.write_text(TEXT, encoding='utf-8')
+    return str(path)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 10, 45, 64, 1 << 20])
+def test_stream_sentences_matches_whole_text(corpus_file, chunk_size):
+    tokenizer = PunktSentenceTokenizer()
+    assert list(stream_sentences([corpus_file], chunk_size,
+                                 tokenizer=tokenizer)) == \
+        tokenizer.tokenize(TEXT)
+
+
+def test_stream_sentences_cuts_long_sentences_at_whitespace(tmp_path):
+    path = tmp_path / 'corpus.txt'
+    path.write_text("alpha beta gamma delta epsilon zeta eta theta",
+                    encoding='utf-8')
+    sentences = list(stream_sentences([str(path)], chunk_size=8,
+                                      max_sentence_length=12,
+                                      tokenizer=PunktSentenceTokenizer()))
+    words = "alpha beta gamma delta epsilon zeta eta theta".split()
+    assert ' '.join(sentences).split() == words
+    assert all(word in words for sentence in sentences
+               for word in sentence.split())
@@ -0,0 +1,67 @@
+import itertools
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from context_aware_model import ContextAwareTextModel  # noqa: E402
+from round_store import RoundStore, _stream_pairs, precompute_rounds, \
+    store_key  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = RoundStore(str(tmp_path / 'rounds.sqlite'))
+    yield store
+    store.close()
+
+
+def test_store_key_depends_on_scoring_setup(model, tiny_model):
+    logit_model = ContextAwareTextModel(tiny_model[0], scoring='logit')
+    keys = {store_key(model), store_key(model, top_k=5),
+            store_key(logit_model)}
+    assert len(keys) == 3
+    assert store_key(model) == store_key(ContextAwareTextModel(tiny_model[0]))
+
+
+def test_store_is_keyed_by_its_model(store, model, tiny_model, sentences):
+    assert precompute_rounds(model, store, 5, sentences=iter(sentences),
+                             batch_size=2) == 5
+    assert len(store) == 5
+    assert store.is_valid(store_key(model))
+    assert not store.is_valid(store_key(model, top_k=5))
+    logit_model = ContextAwareTextModel(tiny_model[0], scoring='logit')
+    assert not store.is_valid(store_key(logit_model))
+
+    store.reset(store_key(logit_model))
+    assert len(store) == 0
+    assert not store.is_valid(store_key(logit_model))
+
+
+def test_stored_rounds_match_live_scoring(store, model, sentences):
+    precompute_rounds(model, store, 8, sentences=iter(sentences), top_k=3)
+    for difficulty in (0.0, 0.5, 1.0):
+        game_round, baseline_loss = store.sample(difficulty)
+        prepared = game_round.prepared
+        mask_index = game_round.mask_index
+        assert prepared.input_ids[mask_index + 1] == \
+            model.tokenizer.mask_token_id
+        assert len(game_round.top_words_with_fitness) == 3
+
+        model.cache.clear()
+        words = [game_round.original_word.lower()] + \
+            [word for word, _ in game_round.top_words_with_fitness]
+        scores = model.score_candidates(prepared, words, mask_index)
+        assert game_round.original_fitness == pytest.approx(scores[0],
+                                                            rel=1e-4)
+        assert [fitness for _, fitness in game_round.top_words_with_fitness] \
+            == pytest.approx(scores[1:], rel=1e-4)
+        assert baseline_loss == pytest.approx(
+            model.baseline_loss(prepared, mask_index), rel=1e-4)
+
+
+def test_stream_pairs_gives_up_on_unmaskable_sentences(model):
+    assert list(_stream_pairs(model, itertools.cycle(['!!! ...']), 5,
+                              max_attempts=10)) == []
@@ -0,0 +1,130 @@
+import asyncio
+import itertools
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from model_registry import ModelRegistry  # noqa: E402
+from rounds import RoundEngine  # noqa: E402
+from server import GameServer, MicroBatcher  # noqa: E402
+
+
+def run_batcher(process_batch, requests, **kwargs):
+    """
+    Submit requests concurrently to a batcher and gather their results.
+    """
+    async def run():
+        executor = ThreadPoolExecutor(max_workers=1)
+        batcher = MicroBatcher(process_batch, executor, **kwargs)
+        batcher.start()
+        try:
+            return await asyncio.gather(
+                *[batcher.submit(request) for request in requests],
+                return_exceptions=True), batcher.stats()
+        finally:
+            await batcher.stop()
+            executor.shutdown()
+
+    return asyncio.run(run())
+
+
+def test_micro_batcher_batches_concurrent_requests():
+    batches = []
+
+    def process_batch(requests):
+        batches.append(list(requests))
+        return [request * 2 for request in requests]
+
+    results, stats = run_batcher(process_batch, range(10), max_wait=1.0)
+    assert results == [request * 2 for request in range(10)]
+    assert batches == [list(range(10))]
+    assert stats['batches'] == 1 and stats['requests'] == 10
+
+
+def test_micro_batcher_respects_max_batch_size():
+    batches = []
+
+    def process_batch(requests):
+        batches.append(list(requests))
+        return list(requests)
+
+    results, _ = run_batcher(process_batch, range(10), max_batch_size=4,
+                             max_wait=1.0)
+    assert results == list(range(10))
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+
+
+def test_micro_batcher_fails_the_requests_of_a_failed_batch():
+    calls = itertools.count()
+    lock = threading.Lock()
+
+    def process_batch(requests):
+        with lock:
+            call = next(calls)
+        if call == 0:
+            raise ValueError("broken batch")
+        return list(requests)
+
+    results, _ = run_batcher(process_batch, range(6), max_batch_size=3,
+                             max_wait=1.0)
+    assert all(isinstance(result, ValueError) for result in results[:3])
+    assert results[3:] == [3, 4, 5]
+
+
+@pytest.fixture
+def server(tiny_model, sentences):
+    def open_engine(language, model):
+        return RoundEngine(model, sentences=itertools.cycle(sentences))
+
+    registry = ModelRegistry({}, tiny_model[0])
+    server = GameServer(registry, open_engine, ['english'], max_wait=0.05)
+    yield server
+    server.executor.shutdown()
+
+
+def test_server_plays_concurrent_sessions(server):
+    sessions = [f'session-{i}' for i in range(6)]
+
+    async def play():
+        started = await asyncio.gather(*[server.handle_request(
+            {'op': 'start_round', 'session': session})
+            for session in sessions])
+        rounds = [server.sessions[session].round for session in sessions]
+        guesses = await asyncio.gather(*[server.handle_request(
+            {'op': 'submit_guess', 'session': session,
+             'guess': game_round.original_word})
+            for session, game_round in zip(sessions, rounds)])
+        stats = server.stats()
+        for language in list(server.runtimes):
+            await server._close_runtime(language)
+        return started, rounds, guesses, stats
+
+    started, rounds, guesses, stats = asyncio.run(play())
+    assert all(response['ok'] for response in started + guesses)
+    # Concurrent first requests open the language, and load its model, once
+    assert server.registry.loads == 1
+    assert stats['languages']['english']['predictions']['batches'] < 6
+
+    for game_round, response in zip(rounds, guesses):
+        # Guessing the original word scores it like the prepared round did
+        assert response['original_word'] == game_round.original_word
+        assert response['fitness'] == pytest.approx(
+            game_round.original_fitness, rel=1e-4)
+
+
+def test_server_rejects_malformed_requests(server):
+    async def handle(request):
+        return await server.handle_request(request)
+
+    for request in ([], 'start_round', None):
+        response = asyncio.run(handle(request))
+        assert response == {'ok': False,
+                            'error': "A request must be a JSON object."}
+    response = asyncio.run(handle({'op': 'submit_guess', 'session': 'x'}))
+    assert not response['ok']
+    assert 'Unknown session' in response['error']
@@ -0,0 +1,76 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from user import ProfileStore, ReviewScheduler, UserProfile  # noqa: E402
+
+
+def test_review_scheduler_returns_due_words_earliest_first():
+    scheduler = ReviewScheduler()
+    scheduler.schedule('late', 5)
+    scheduler.schedule('early', 2)
+    scheduler.schedule('never', 100)
+
+    scheduler.advance(2)
+    assert scheduler.due_words() == ['early']
+    scheduler.advance(3)
+    assert scheduler.due_words() == ['early', 'late']
+
+
+def test_review_scheduler_reschedule_and_remove():
+    scheduler = ReviewScheduler()
+    scheduler.schedule('word', 1)
+    scheduler.schedule('other', 1)
+    scheduler.advance()
+    assert scheduler.due_words() == ['word', 'other']
+
+    # A rescheduled word is no longer due, and its old heap entry is stale
+    scheduler.schedule('word', 3)
+    scheduler.remove('other')
+    assert scheduler.due_words() == []
+    assert 'other' not in scheduler
+    assert scheduler.due_round('word') == 4
+
+    scheduler.advance(3)
+    assert scheduler.due_words() == ['word']
+
+
+def test_profile_store_round_trip(tmp_path):
+    path = str(tmp_path / 'profiles.sqlite')
+    profile = UserProfile('learner')
+    profile.set_difficulty('medium')
+    for fitness in (0.5, 0.75, 1.25):
+        profile.update_performance(fitness)
+    profile.add_word_to_review('apple', 2)
+    profile.add_word_to_review('pear', 10)
+    profile.review_scheduler.advance(3)
+
+    store = ProfileStore(path)
+    store.save(profile)
+    store.close()
+
+    store = ProfileStore(path)
+    loaded = store.load('learner')
+    assert loaded.get_current_difficulty() == 'medium'
+    assert list(loaded.performance_history) == [0.5, 0.75, 1.25]
+    assert loaded.review_scheduler.current_round == 3
+    assert dict(loaded.review_scheduler.items()) == {'apple': 2, 'pear': 10}
+    assert loaded.get_words_to_review() == ['apple']
+
+    # Only the changed words are written; removed words are deleted
+    loaded.review_scheduler.remove('apple')
+    loaded.add_word_to_review('plum', 1)
+    store.save(loaded)
+    assert dict(store.load('learner').review_scheduler.items()) == \
+        {'pear': 10, 'plum': 4}
+    store.close()
+
+
+def test_profile_store_creates_missing_profiles(tmp_path):
+    store = ProfileStore(str(tmp_path / 'profiles.sqlite'))
+    profile = store.load('new')
+    assert profile.user_id == 'new'
+    assert profile.get_average_score() == 0.0
+    assert len(profile.review_scheduler) == 0
+    store.close()